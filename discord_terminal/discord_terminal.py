@@ -54,6 +54,9 @@ def runDiscordTerminalProcess(
         data = json.load(configFile)
         token = None
         ownerId = None
+        useEngine = False
+        if "schwab" in data.keys() and "useEngine" in data["schwab"].keys():
+            useEngine = data["schwab"]["useEngine"]
         if "discord" in data.keys():
             discordConfig = data["discord"]
             if "token" in discordConfig.keys():
@@ -75,7 +78,7 @@ def runDiscordTerminalProcess(
     discordUtils = DiscordUtils(CONFIG_JSON_FILE_NAME, client)
     logsChannel = None
 
-    appManager = SchwabManager(account_id, api)
+    appManager = SchwabManager(account_id, api, useEngine=useEngine)
     
     @tasks.loop(seconds=1)
     async def timer():
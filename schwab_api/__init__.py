@@ -1,2 +1,3 @@
 from .schwab import Schwab
-from .totp_generator import generate_totp
\ No newline at end of file
+from .async_schwab import AsyncSchwab
+from .totp_generator import generate_totp
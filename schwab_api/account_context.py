@@ -0,0 +1,122 @@
+from collections.abc import Mapping
+from types import MappingProxyType
+
+# Headers set per request rather than taken from the captured header template.
+_PER_REQUEST_HEADERS = ("authorization", "schwab-client-account", "schwab-resource-version", "content-type")
+# Token generations a HeaderSet keeps headers for. Older tokens are not sent again once refreshed.
+_MAX_TOKEN_GENERATIONS = 4
+
+
+class HeaderSet(Mapping):
+    __slots__ = ("_headers", "_with_token")
+
+    def __init__(self, headers):
+        """
+            The headers of one kind of request (account, resource version and content type),
+            without the bearer token. Read-only, so any number of threads and tasks can send
+            them at once.
+
+            headers (dict) - The headers. Not copied; the caller must not change them.
+        """
+        self._headers = headers
+        self._with_token = {} # token generation -> read-only headers with the token
+
+    def with_token(self, entry):
+        """
+            Returns the headers with the bearer token of entry (a CachedToken), built once per
+            token generation.
+        """
+        headers = self._with_token.get(entry.generation)
+        if headers is None:
+            if len(self._with_token) >= _MAX_TOKEN_GENERATIONS:
+                self._with_token = {}
+            headers = dict(self._headers)
+            headers["authorization"] = f"Bearer {entry.token}"
+            headers = self._with_token[entry.generation] = MappingProxyType(headers)
+        return headers
+
+    def __getitem__(self, key):
+        return self._headers[key]
+
+    def __iter__(self):
+        return iter(self._headers)
+
+    def __len__(self):
+        return len(self._headers)
+
+    def __repr__(self):
+        return f"HeaderSet({self._headers})"
+
+
+class AccountContext:
+    def __init__(self, api, account_id=None):
+        """
+            The AccountContext class. Makes requests for one account with headers of its own,
+            instead of setting schwab-client-account on the shared api.headers before each call,
+            so requests for different accounts can run at the same time.
+
+            The headers are built once per resource version and content type from api's header
+            template and returned as read-only HeaderSets, which add the bearer token once per
+            token generation. They are built again when api.headers is replaced (e.g. by a login
+            or SchwabCredentials.apply).
+
+            api (Schwab) - The client the requests are sent with.
+            account_id (int or str) - The account. None for requests that are not for one
+                        account (the headers then have no schwab-client-account).
+        """
+        self.api = api
+        self.account_id = None if account_id is None else str(account_id)
+        # (the api.headers the HeaderSets were built from, (resource version, content type) ->
+        # HeaderSet), replaced as a whole so a thread never mixes sets of two header templates
+        self._cache = (None, {})
+
+    def __getstate__(self):
+        # the HeaderSets are rebuilt from api.headers on first use
+        state = self.__dict__.copy()
+        state["_cache"] = (None, {})
+        return state
+
+    def headers(self, resource_version=None, content_type=None):
+        """
+            Returns the HeaderSet for a request with resource_version and content_type.
+        """
+        source, header_sets = self._cache
+        if source is not self.api.headers:
+            source, header_sets = self._cache = (self.api.headers, {})
+        key = (resource_version, content_type)
+        headers = header_sets.get(key)
+        if headers is None:
+            built = {name: value for name, value in (source or {}).items() if name.lower() not in _PER_REQUEST_HEADERS}
+            if self.account_id is not None:
+                built["schwab-client-account"] = self.account_id
+            if resource_version is not None:
+                built["schwab-resource-version"] = resource_version
+            if content_type is not None:
+                built["content-type"] = content_type
+            headers = header_sets[key] = HeaderSet(built)
+        return headers
+
+    def orders(self, openOnly=False, compact=False):
+        return self.api.orders_v2(self.account_id, openOnly=openOnly, compact=compact)
+
+    def todays_orders(self, compact=False):
+        return self.api.todays_orders_v2(self.account_id, compact=compact)
+
+    def quotes(self, tickers):
+        return self.api.get_quotes(tickers, self.account_id)
+
+    def transactions(self):
+        """
+            Returns the account's transaction history as a list of Transactions, newest first.
+        """
+        return list(self.api.iter_transaction_history_v2(self.account_id))
+
+    def account_info(self):
+        """
+            Returns the account's Account (positions and totals), or None if Holdings does not
+            list it.
+        """
+        return self.api.get_accounts_v2().get(int(self.account_id))
+
+    def __repr__(self):
+        return f"AccountContext(account_id={self.account_id!r})"
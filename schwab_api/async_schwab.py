@@ -0,0 +1,512 @@
+import asyncio
+import json
+import time
+
+# Imported by the first AsyncSchwab (see _import_aiohttp); importing it with schwab_api would
+# slow down every process, including those that only use Schwab.
+aiohttp = None
+
+from . import urls
+from .order_templates import (
+    OrderSubmission,
+    normalize_limit_price,
+    limit_order_payload,
+    replace_limit_order_payload,
+    order_payload,
+    oco_order_payload,
+    cancel_order_payload,
+    cancel_limit_order_payload,
+    PLACE
+)
+from .codec import QUOTES_SCHEMA, ORDERS_SCHEMA
+from .quote_service import quotes_by_symbol
+from .records import Quote
+from .schwab import REQUEST_TIMEOUT, _checked, _with_token
+
+# Connections kept open by the async pool. One event loop can have far more requests in flight
+# than the threaded strategy code, so this is larger than the sync transport's pool.
+DEFAULT_ASYNC_POOL_MAXSIZE = 64
+DEFAULT_ASYNC_KEEP_ALIVE = 30 # seconds an idle pooled connection is kept open
+
+
+def _import_aiohttp():
+    global aiohttp
+    if aiohttp is None:
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError("AsyncSchwab requires aiohttp. Install it with: pip install aiohttp") from None
+
+
+class _Response:
+    def __init__(self, status_code, content, encoding="utf-8"):
+        """
+            The parts of a gateway response the v2 methods use, read before the aiohttp response
+            is released back to the pool. The body is kept as bytes; text is only decoded for
+            error messages.
+        """
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding
+        self.size = len(content)
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, "replace")
+
+
+async def _read_response(r):
+    body = await r.read()
+    return _Response(r.status, body, r.get_encoding())
+
+
+class AsyncSchwab:
+    def __init__(self, api, **kwargs):
+        """
+            The AsyncSchwab class. An asyncio client for the v2 gateway methods, so one event loop
+            can keep quotes, orders and cancels for many tickers in flight at once instead of
+            using a thread per request.
+
+            api (Schwab) - A logged in Schwab instance. Its token cache, cached schwabSecurityIds
+                        and order templates are shared, so tokens refreshed by either client (or a
+                        TokenRefresher / TokenBoard attached to api) are used by both.
+
+            Optional keyword arguments:
+            pool_maxsize (int) - The maximum number of connections kept open.
+            keep_alive (number) - Seconds an idle pooled connection is kept open.
+            place_orders_directly (bool) - Defaults to api.place_orders_directly.
+            metrics (GatewayMetrics) - Where requests are recorded. Defaults to api.metrics.
+            codec (Codec) - Parses the responses. Defaults to api.codec.
+
+            Requires aiohttp (pip install aiohttp). The HTTP session is created on first use, in
+            the running event loop; call close() (or use `async with`) when done.
+        """
+        _import_aiohttp()
+        self.api = api
+        self.token_cache = api.token_cache
+        self.security_ids = api.security_ids
+        self.place_orders_directly = kwargs.get("place_orders_directly", api.place_orders_directly)
+        self.pool_maxsize = kwargs.get("pool_maxsize", DEFAULT_ASYNC_POOL_MAXSIZE)
+        self.keep_alive = kwargs.get("keep_alive", DEFAULT_ASYNC_KEEP_ALIVE)
+        self.metrics = kwargs.get("metrics", api.metrics)
+        self.codec = kwargs.get("codec", api.codec)
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_maxsize, keepalive_timeout=self.keep_alive)
+            # Gateway requests authenticate with the bearer token only, same as the sync transport.
+            self._session = aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar())
+        return self._session
+
+    def _headers(self, account_id=None, resource_version=None, content_type=None):
+        # the same precomputed HeaderSets as the sync client's
+        return self.api.account(account_id or None).headers(resource_version, content_type)
+
+    async def _get_token(self, token_type):
+        if not self.token_cache.needs_refresh(token_type):
+            return self.token_cache.get_entry(token_type)
+        # Fetching a token blocks, so it runs in a worker thread. TokenCache collapses concurrent
+        # fetches for a scope into one, so a burst of requests still only fetches once.
+        return await asyncio.get_running_loop().run_in_executor(None, self.token_cache.get_entry, token_type)
+
+    async def _refresh_token(self, token_type, stale_token):
+        await asyncio.get_running_loop().run_in_executor(None, self.token_cache.refresh, token_type, stale_token)
+        return self.token_cache.get_entry(token_type)
+
+    async def _gateway_request(self, method, url, headers, token_type='api', endpoint="other", timeout=None, data=None, **kwargs):
+        """
+        Async version of Schwab._gateway_request. Returns a response with status_code and text.
+        A json payload is encoded here; headers must then have the json content-type.
+        """
+        session = self._get_session()
+        payload = kwargs.pop("json", None)
+        if timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+        entry = await self._get_token(token_type)
+        if payload is not None:
+            # encoded here rather than by aiohttp so the request size is known for metrics
+            data = json.dumps(payload).encode("utf-8")
+        retries = 0
+        start_time = time.perf_counter()
+        try:
+            async with session.request(method, url, headers=_with_token(headers, entry), data=data, **kwargs) as r:
+                response = await _read_response(r)
+            if response.status_code == 401:
+                retries = 1
+                entry = await self._refresh_token(token_type, entry.token)
+                async with session.request(method, url, headers=_with_token(headers, entry), data=data, **kwargs) as r:
+                    response = await _read_response(r)
+        except Exception as e:
+            if self.metrics is not None:
+                self.metrics.record_error(endpoint, time.perf_counter() - start_time, e, retries=retries)
+            raise
+        if self.metrics is not None:
+            self.metrics.record(
+                endpoint,
+                time.perf_counter() - start_time,
+                response.status_code,
+                bytes_out=len(data or b"") * (retries + 1),
+                bytes_in=response.size,
+                retries=retries
+            )
+        return response
+
+    async def quote_v2(self, tickers, account_id):
+        """
+        Returns quote information for tickers, like Schwab.quote_v2.
+        """
+        r = await self._quote_request(tickers, account_id)
+        if r.status_code != 200:
+            return [r.text], False
+
+        response = self.codec.loads(r.content)
+        return response["quotes"]
+
+    async def _quote_request(self, tickers, account_id):
+        data = {
+            "Symbols":tickers,
+            "IsIra":False,
+            "AccountRegType":"S3"
+        }
+        headers = self._headers(account_id, '1.0', 'application/json')
+        return await self._gateway_request("POST", urls.ticker_quotes_v2(), headers, token_type='update', endpoint="quotes", json=data, timeout=REQUEST_TIMEOUT)
+
+    async def getBidAsk(self, ticker, account_id):
+        quotes = await self.get_quotes([ticker,], account_id)
+        quote = list(quotes.values())[0] # only getting one ticker
+        return quote.bid, quote.ask
+
+    async def get_quotes(self, tickers, account_id):
+        """
+        Returns a dict of ticker -> Quote for every ticker in tickers, like Schwab.get_quotes.
+        """
+        r = await self._quote_request(tickers, account_id)
+        if r.status_code != 200:
+            raise ValueError("error getting bid/ask: " + str([r.text]))
+        quotes = self.codec.decode(r.content, QUOTES_SCHEMA)["quotes"]
+        return {symbol: Quote.from_entry(quote, symbol) for symbol, quote in quotes_by_symbol(tickers, quotes).items()}
+
+    async def orders_v2(self, account_id=None, compact=False):
+        headers = self._headers(account_id, '2.0')
+        r = await self._gateway_request("GET", urls.orders_v2(), headers, token_type='api', endpoint="orders")
+        if r.status_code != 200:
+            return [r.text], False
+
+        response = self.codec.decode(r.content, ORDERS_SCHEMA) if compact else self.codec.loads(r.content)
+        return response["Orders"]
+
+    async def todays_orders_v2(self, account_id=None, compact=False):
+        headers = self._headers(account_id, '2.0')
+        r = await self._gateway_request("GET", urls.todays_orders_v2(), headers, token_type='api', endpoint="todays_orders", timeout=REQUEST_TIMEOUT)
+        if r.status_code != 200:
+            return [r.text], False
+
+        response = self.codec.decode(r.content, ORDERS_SCHEMA) if compact else self.codec.loads(r.content)
+        return response["Orders"], True
+
+    async def orders_for_accounts(self, account_ids, compact=False, max_concurrency=None):
+        """
+        Fetches the orders of every account in account_ids concurrently, like
+        Schwab.orders_for_accounts. Returns (orders, errors).
+        """
+        return await self._fan_out(account_ids, lambda account_id: self.orders_v2(account_id, compact=compact), max_concurrency)
+
+    async def todays_orders_for_accounts(self, account_ids, compact=False, max_concurrency=None):
+        """
+        Fetches today's orders of every account in account_ids concurrently, like
+        Schwab.todays_orders_for_accounts. Returns (orders, errors).
+        """
+        async def todays_orders(account_id):
+            return _checked(await self.todays_orders_v2(account_id, compact=compact))[0]
+
+        return await self._fan_out(account_ids, todays_orders, max_concurrency)
+
+    async def _fan_out(self, account_ids, call, max_concurrency):
+        semaphore = asyncio.Semaphore(max_concurrency or len(account_ids) or 1)
+
+        async def call_one(account_id):
+            async with semaphore:
+                try:
+                    return True, _checked(await call(account_id))
+                except Exception as e:
+                    return False, str(e)
+
+        outcomes = await asyncio.gather(*[call_one(account_id) for account_id in account_ids])
+        results, errors = {}, {}
+        for account_id, (ok, value) in zip(account_ids, outcomes):
+            if ok:
+                results[account_id] = value
+            else:
+                errors[account_id] = value
+        return results, errors
+
+    async def get_account_info_v2(self):
+        return {account_id: account._as_dict() for account_id, account in (await self.get_accounts_v2()).items()}
+
+    async def get_accounts_v2(self):
+        """
+        Returns a dict mapping each account id to its Account record, like Schwab.get_accounts_v2.
+        """
+        r = await self._gateway_request("GET", urls.positions_v2(), self._headers(), token_type='api', endpoint="holdings")
+        return self.api._parse_account_info_v2(self.codec.loads(r.content))
+
+    async def cancel_order_v2(self, account_id, order_id, instrument_type=46):
+        """
+        Cancels an open order, like Schwab.cancel_order_v2.
+        """
+        data = cancel_order_payload(order_id, instrument_type)
+        return await self._cancel_v2(data, self._headers(account_id, '2.0', 'application/json'), timeout=None)
+
+    async def cancel_limit_order_v2(self, account_id, order_id, ticker, buysell, price, qty, instrument_type=46):
+        """
+        Cancels an open limit order, like Schwab.cancel_limit_order_v2.
+        """
+        data = cancel_limit_order_payload(order_id, ticker, buysell, price, qty, instrument_type)
+        return await self._cancel_v2(data, self._headers(account_id, '2.0', 'application/json'), timeout=REQUEST_TIMEOUT)
+
+    async def cancel_orders_v2(self, cancels, max_concurrency=None):
+        """
+        Cancels several orders concurrently, like Schwab.cancel_orders_v2. Each order is
+        confirmed as soon as its own CancelOrderId comes back.
+
+        Returns a list of (messages, is_success), in the order of cancels.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or len(cancels) or 1)
+
+        async def cancel_one(cancel):
+            async with semaphore:
+                try:
+                    if "ticker" in cancel:
+                        return await self.cancel_limit_order_v2(**cancel)
+                    return await self.cancel_order_v2(**cancel)
+                except Exception as e:
+                    return [str(e)], False
+
+        return list(await asyncio.gather(*[cancel_one(cancel) for cancel in cancels]))
+
+    async def _cancel_v2(self, data, headers, timeout):
+        r1 = await self._gateway_request("POST", urls.cancel_order_v2(), headers, token_type='api', endpoint="cancel_request", json=data, timeout=timeout)
+        if r1.status_code not in (200, 202):
+            return [r1.text], False
+
+        try:
+            response = self.codec.loads(r1.content)
+            cancel_order_id = response['CancelOrderId']
+        except (json.decoder.JSONDecodeError, KeyError):
+            return [r1.text], False
+
+        data['ConfirmCancelOrderId'] = cancel_order_id
+        data['OrderProcessingControl'] = PLACE
+        r2 = await self._gateway_request("POST", urls.cancel_order_v2(), headers, token_type='api', endpoint="cancel_confirm", json=data, timeout=timeout)
+        if r2.status_code not in (200, 202):
+            return [r2.text], False
+        try:
+            response = self.codec.loads(r2.content)
+            if response["CancelOperationSuccessful"]:
+                return response, True
+        except (json.decoder.JSONDecodeError, KeyError):
+            return [r2.text], False
+        return response, False
+
+    async def trade_v2(
+            self, ticker, side, qty, account_id, dry_run=True,
+            order_type=49, duration=48, limit_price=0, stop_price=0, primary_security_type=46,
+            valid_return_codes={0,10}, affirm_order=False, costBasis='FIFO', place_directly=None
+            ):
+        """
+        Places an order, like Schwab.trade_v2.
+
+        Returns messages (list of strings), is_success (boolean)
+        """
+        if side == "Buy":
+            buySellCode = "49"
+        elif side == "Sell":
+            buySellCode = "50"
+        else:
+            raise Exception("side must be either Buy or Sell")
+
+        limit_price, limit_price_warning = normalize_limit_price(limit_price)
+        template = self.api._order_template(
+            ("order", ticker, buySellCode, qty, account_id, order_type, duration, stop_price, primary_security_type, costBasis, affirm_order),
+            lambda: order_payload(ticker, buySellCode, qty, account_id, order_type, duration, stop_price, primary_security_type, costBasis),
+            affirm_order
+        )
+        messages, success, _ = await self._submit_order_v2(
+            template, limit_price, valid_return_codes, dry_run=dry_run, place_directly=place_directly, warnings=[limit_price_warning]
+        )
+        return messages, success
+
+    async def trade_v2_limit_buy_order(self, ticker, qty, account_id, limit_price, **kwargs):
+        """
+        Places a limit buy order, like Schwab.trade_v2_limit_buy_order (without old_order_id;
+        use replace_limit_order_v2 to re-price an open order).
+
+        Returns messages (list of strings), is_success (boolean), order_id
+        """
+        return await self._limit_order(ticker, 49, qty, account_id, limit_price, "limit_buy_price", **kwargs)
+
+    async def trade_v2_limit_sell_order(self, ticker, qty, account_id, limit_price, **kwargs):
+        """
+        Places a limit sell order, like Schwab.trade_v2_limit_sell_order (without old_order_id).
+
+        Returns messages (list of strings), is_success (boolean), order_id
+        """
+        return await self._limit_order(ticker, 50, qty, account_id, limit_price, "limit_price", **kwargs)
+
+    async def replace_limit_order_v2(
+            self, account_id, order_id, isBuy, new_price, ticker=None, qty=None,
+            duration=48, primary_security_type=46, valid_return_codes={0,10}, affirm_order=False,
+            costBasis='FIFO', dry_run=False
+            ):
+        """
+        Replaces an open limit order with one at new_price, like Schwab.replace_limit_order_v2.
+
+        Returns messages (list of strings), is_success (boolean), new_order_id
+        """
+        if ticker is None or qty is None:
+            raise ValueError("replace_limit_order_v2 needs the ticker and qty of the order")
+        instruction = 49 if isBuy else 50
+        new_price, new_price_warning = normalize_limit_price(new_price, "new_price")
+        template = self.api._order_template(
+            ("replace", ticker, instruction, qty, account_id, duration, primary_security_type, costBasis, affirm_order),
+            lambda: replace_limit_order_payload(ticker, instruction, qty, account_id, duration, primary_security_type, costBasis),
+            affirm_order
+        )
+        return await self._submit_order_v2(
+            template, new_price, valid_return_codes, dry_run=dry_run, place_directly=False, warnings=[new_price_warning],
+            timeout=REQUEST_TIMEOUT, replace_order_id=order_id, account_id=account_id
+        )
+
+    async def submit_orders(self, orders, max_concurrency=None):
+        """
+        Places several limit orders concurrently, like Schwab.submit_orders.
+
+        Returns a list of (messages, is_success, order_id), in the order of orders.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or len(orders) or 1)
+
+        async def submit_one(order):
+            async with semaphore:
+                try:
+                    kwargs = dict(order)
+                    side = kwargs.pop("side")
+                    if side == "Buy":
+                        return await self.trade_v2_limit_buy_order(**kwargs)
+                    if side == "Sell":
+                        return await self.trade_v2_limit_sell_order(**kwargs)
+                    raise ValueError(f"side must be 'Buy' or 'Sell', not {side!r}")
+                except Exception as e:
+                    return [str(e)], False, None
+
+        return list(await asyncio.gather(*[submit_one(order) for order in orders]))
+
+    async def trade_v2_buy_OCO_ONLY(self, ticker, qty, account_id, limit_price, **kwargs):
+        """
+        Places an OCO buy limit + trailing stop, like Schwab.trade_v2_buy_OCO_ONLY.
+
+        Returns messages (list of strings), is_success (boolean)
+        """
+        return await self._oco_order(ticker, 49, qty, account_id, limit_price, "limit_buy_price", **kwargs)
+
+    async def trade_v2_sell_OCO_ONLY(self, ticker, qty, account_id, limit_price, **kwargs):
+        """
+        Places an OCO sell limit + trailing stop, like Schwab.trade_v2_sell_OCO_ONLY.
+
+        Returns messages (list of strings), is_success (boolean)
+        """
+        return await self._oco_order(ticker, 50, qty, account_id, limit_price, "limit_price", **kwargs)
+
+    async def _limit_order(
+            self, ticker, instruction, qty, account_id, limit_price, price_name,
+            duration=48, primary_security_type=46, valid_return_codes={0,10}, affirm_order=False,
+            costBasis='FIFO', place_directly=None
+            ):
+        limit_price, limit_price_warning = normalize_limit_price(limit_price, price_name)
+        template = self.api._order_template(
+            ("limit", ticker, instruction, qty, account_id, duration, primary_security_type, costBasis, affirm_order),
+            lambda: limit_order_payload(ticker, instruction, qty, account_id, duration, primary_security_type, costBasis),
+            affirm_order
+        )
+        return await self._submit_order_v2(
+            template, limit_price, valid_return_codes, place_directly=place_directly, warnings=[limit_price_warning], timeout=REQUEST_TIMEOUT
+        )
+
+    async def _oco_order(
+            self, ticker, instruction, qty, account_id, limit_price, price_name,
+            trailing_stop_dollars=0.07, duration=48, primary_security_type=46, valid_return_codes={0,10,20},
+            affirm_order=False, place_directly=None
+            ):
+        limit_price, limit_price_warning = normalize_limit_price(limit_price, price_name)
+        template = self.api._order_template(
+            ("oco", ticker, instruction, qty, account_id, duration, primary_security_type, trailing_stop_dollars, affirm_order),
+            lambda: oco_order_payload(ticker, instruction, qty, account_id, duration, primary_security_type, trailing_stop_dollars),
+            affirm_order
+        )
+        messages, success, _ = await self._submit_order_v2(
+            template, limit_price, valid_return_codes, place_directly=place_directly, warnings=[limit_price_warning]
+        )
+        return messages, success
+
+    async def _submit_order_v2(
+            self, template, limit_price, valid_return_codes, dry_run=False, place_directly=None, warnings=(), timeout=None,
+            replace_order_id=None, account_id=None
+            ):
+        """
+        Async version of Schwab._submit_order_v2: verify then place, or place directly when the
+        symbol's schwabSecurityId is cached and place_directly is on (checking today's orders
+        before placing again if the direct response is unclear). With replace_order_id, the
+        order is sent to that order's replace endpoint as its replacement.
+
+        Returns messages (list of strings), is_success (boolean), order_id (or None)
+        """
+        if place_directly is None:
+            place_directly = self.place_orders_directly
+        submission = OrderSubmission(
+            template, limit_price, valid_return_codes, self.security_ids, dry_run, place_directly, warnings, replace_order_id
+        )
+        headers = self._headers(account_id, submission.resource_version, 'application/json')
+
+        body = submission.direct_body()
+        if body is not None:
+            status_code, response = None, None
+            try:
+                r = await self._gateway_request("POST", urls.order_verification_v2(), headers, token_type='update', endpoint="place", data=body, timeout=timeout)
+                status_code = r.status_code
+                response = self.codec.loads(r.content) if r.status_code == 200 else None
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                print(f"[AsyncSchwab] no usable response to placing the {submission.ticker} order directly: {e!r}")
+            result = submission.direct_result(status_code, response)
+            if result is None and submission.placement_unclear:
+                # the order may have been placed; look for it before placing it again
+                try:
+                    orders, success = await self.todays_orders_v2(submission.account_id, compact=True)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    orders, success = None, False
+                result = submission.unclear_result(orders if success else None)
+            if result is not None:
+                return result
+
+        r = await self._gateway_request("POST", submission.url, headers, token_type=submission.token_type, endpoint=submission.verify_endpoint, data=submission.verify_body(), timeout=timeout)
+        if r.status_code != 200:
+            return [r.text], False, None
+        result = submission.verify_result(self.codec.loads(r.content))
+        if result is not None:
+            return result
+
+        r = await self._gateway_request("POST", submission.url, headers, token_type=submission.token_type, endpoint=submission.place_endpoint, data=submission.place_body(), timeout=timeout)
+        if r.status_code != 200:
+            return [r.text], False, None
+
+        return submission.place_result(self.codec.loads(r.content))
@@ -1,11 +1,9 @@
 import requests
-import pyotp
 import re
 from . import urls
 
-from playwright.sync_api import sync_playwright, TimeoutError
 from requests.cookies import cookiejar_from_dict
-from playwright_stealth import stealth_sync
+from .session_vault import SessionVault
 
 
 # Constants
@@ -14,8 +12,36 @@ VIEWPORT = { 'width': 1500, 'height': 800 }
 
 class SessionManager:
     def __init__(self) -> None:
-        self.headers = None
+        # Replaced by the captured request headers on login.
+        self.headers = {}
         self.session = requests.Session()
+        # True when a session saved in the vault was restored and is still logged in; login()
+        # then has nothing to do.
+        self.session_restored = False
+        # The browser is only started by the first login(), see start_browser.
+        self.playwright = None
+        self.browser = None
+        self.page = None
+
+        session_vault = getattr(self, "session_vault", None)
+        if isinstance(session_vault, str):
+            session_vault = self.session_vault = SessionVault(session_vault)
+        if session_vault is not None:
+            self.session_restored = self.restore_session()
+
+    def start_browser(self):
+        """
+            Starts the playwright browser used to log in, unless it is running already.
+            Playwright is only imported here, so processes that never log in through the
+            browser (restored sessions, the simulator) do not load it.
+        """
+        if self.browser is not None:
+            return
+        if not getattr(self, "launchBrowser", True):
+            raise RuntimeError("Logging in needs the browser, but the session was created with launch_browser=False")
+
+        from playwright.sync_api import sync_playwright
+        from playwright_stealth import stealth_sync
 
         self.playwright = sync_playwright().start()
         if self.browserType == "firefox":
@@ -42,17 +68,45 @@ class SessionManager:
             return False
         return True
 
+    def restore_session(self):
+        """
+            Restores the session saved in self.session_vault and checks that it is still logged
+            in. Returns True if it is.
+        """
+        if not self.session_vault.restore(self):
+            return False
+        try:
+            if self.check_auth():
+                return True
+        except requests.RequestException as e:
+            print(f"[SessionManager] could not validate the restored session: {e}")
+        print("[SessionManager] the restored session is no longer logged in")
+        self.session.cookies.clear()
+        self.headers = {}
+        return False
+
+    def save_session(self):
+        """
+            Saves the current cookies and headers to self.session_vault, if there is one.
+        """
+        if getattr(self, "session_vault", None) is not None:
+            self.session_vault.save(self)
+
     def save_and_close_session(self):
         cookies = {cookie["name"]: cookie["value"] for cookie in self.page.context.cookies()}
         self.session.cookies = cookiejar_from_dict(cookies)
         self.page.close()
         self.browser.close()
         self.playwright.stop()
+        self.browser = None
+        self.playwright = None
+        self.save_session()
 
     def get_session(self):
         return self.session
 
     def sms_login(self, code):
+        self.start_browser()
 
         # Inconsistent UI for SMS Authentication means we try both
         try:
@@ -92,7 +146,12 @@ class SessionManager:
         :returns: True if login was successful and no further action is needed or False
             if login requires additional steps (i.e. SMS)
         """
-        
+        if self.session_restored:
+            # logged in already, with the session restored from the vault
+            return True
+
+        self.start_browser()
+
         # Log in to schwab using Playwright
         with self.page.expect_navigation():
             self.page.goto("https://www.schwab.com/")
@@ -114,6 +173,7 @@ class SessionManager:
         
         # Add TOTP to password
         # if totp_secret is not None:
+        #     import pyotp
         #     totp = pyotp.TOTP(totp_secret)
         #     password += str(totp.now())
 
@@ -126,7 +186,7 @@ class SessionManager:
         # try:
         #     with self.page.expect_navigation():
         #         self.page.frame(name=login_frame).press("[placeholder=\"Password\"]", "Enter")
-        # except TimeoutError:
+        # except playwright.sync_api.TimeoutError:
         #     raise Exception("Login was not successful; please check username and password")
 
         # NOTE: THIS FUNCTIONALITY WILL SOON BE UNSUPPORTED/DEPRECATED.
@@ -0,0 +1,89 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Gateway requests a batch keeps in flight at once. Below the transport's pool size
+# (DEFAULT_POOL_MAXSIZE), so a batch does not open connections beyond the pool.
+DEFAULT_MAX_CONCURRENCY = 8
+_THREAD_NAME_PREFIX = "SchwabBatch"
+
+
+class BatchRunner:
+    def __init__(self, max_workers=DEFAULT_MAX_CONCURRENCY):
+        """
+            The BatchRunner class. Runs independent gateway calls (cancels, orders, per-account
+            requests) on a shared thread pool, so their round trips overlap instead of running
+            one after another.
+
+            The pool is created on first use, and again after a fork, since the worker threads of
+            the parent do not exist in a child process.
+
+            max_workers (int) - The most calls running at once across every batch.
+        """
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def __getstate__(self):
+        # the pool can not be pickled; the copy creates its own on first use
+        state = self.__dict__.copy()
+        state["_lock"] = None
+        state["_executor"] = None
+        state["_pid"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=_THREAD_NAME_PREFIX)
+                self._pid = os.getpid()
+            return self._executor
+
+    def run(self, calls, on_error, max_concurrency=None):
+        """
+            Runs every call in calls (callables taking no arguments) and returns their results in
+            the same order. A call that raises returns on_error(exception) instead, so one failure
+            does not affect the other calls.
+
+            max_concurrency (int) - The most calls of this batch running at once. Defaults to
+                        max_workers.
+        """
+        calls = list(calls)
+        results = [None] * len(calls)
+        # Calls made from a pool thread run inline; waiting on the pool from inside it could
+        # deadlock once every worker is waiting.
+        if len(calls) <= 1 or threading.current_thread().name.startswith(_THREAD_NAME_PREFIX):
+            for i, call in enumerate(calls):
+                results[i] = _call(call, on_error)
+            return results
+
+        executor = self._get_executor()
+        limit = max(1, min(max_concurrency or self.max_workers, self.max_workers))
+        pending = {}
+        next_index = 0
+        while next_index < len(calls) or pending:
+            while next_index < len(calls) and len(pending) < limit:
+                pending[executor.submit(_call, calls[next_index], on_error)] = next_index
+                next_index += 1
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+        return results
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+def _call(call, on_error):
+    try:
+        return call()
+    except Exception as e:
+        return on_error(e)
@@ -0,0 +1,112 @@
+import json
+from typing import Any, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+from .records import Quote, OrderStatus
+
+# JSON backends in order of preference. The first one installed is used by default.
+BACKENDS = ("orjson", "msgspec", "json")
+
+# Schemas for decode(): a dict lists the keys kept from a JSON object, a one-item list is a JSON
+# array of that item, and None keeps the value as it is. Everything else is skipped.
+QUOTES_SCHEMA = {"quotes": [{"symbol": None, "quote": {field: None for field in Quote.QUOTE_FIELDS}}]}
+ORDERS_SCHEMA = {"Orders": [{"OrderList": [{field: None for field in OrderStatus.ITEM_FIELDS}]}]}
+
+
+def available_backends():
+    installed = {"orjson": orjson is not None, "msgspec": msgspec is not None, "json": True}
+    return [backend for backend in BACKENDS if installed[backend]]
+
+
+def _loader(backend):
+    if backend == "orjson":
+        return orjson.loads # orjson.JSONDecodeError subclasses json.JSONDecodeError
+    if backend == "msgspec":
+        return _msgspec_loads
+    return json.loads
+
+
+def _msgspec_loads(data, type=Any):
+    try:
+        return msgspec.json.decode(data, type=type)
+    except msgspec.DecodeError as e:
+        # raised as the json module would, so callers catch one exception whatever the backend
+        document = data.decode("utf-8", "replace") if isinstance(data, (bytes, bytearray)) else data
+        raise json.JSONDecodeError(str(e), document, 0) from e
+
+
+def _project(value, schema):
+    if schema is None or value is None:
+        return value
+    if isinstance(schema, list):
+        return [_project(item, schema[0]) for item in value]
+    return {key: _project(value[key], field_schema) for key, field_schema in schema.items() if key in value}
+
+
+# id(schema) -> (schema, msgspec type); the schema is kept so its id is not reused
+_msgspec_types = {}
+
+
+def _msgspec_type(schema, name="Schema"):
+    if schema is None:
+        return Any
+    if isinstance(schema, list):
+        return Optional[list[_msgspec_type(schema[0], name + "Item")]]
+    # missing fields default to UNSET, which to_builtins leaves out, while a null is kept as None
+    # (as _project does), so the two cases decode differently
+    fields = [
+        (key, Union[_msgspec_type(field_schema, name + "_" + key), msgspec.UnsetType], msgspec.UNSET)
+        for key, field_schema in schema.items()
+    ]
+    return Optional[msgspec.defstruct(name, fields)]
+
+
+class Codec:
+    def __init__(self, backend=None):
+        """
+            The Codec class. Parses gateway response bodies straight from bytes (r.content)
+            with the fastest JSON backend installed: orjson, then msgspec, then the json module.
+
+            decode(data, schema) only keeps the fields listed in schema (see QUOTES_SCHEMA and
+            ORDERS_SCHEMA), so large listView responses do not keep every field of every order.
+            With msgspec, the skipped fields are not even built; with the other backends they are
+            dropped right after parsing.
+
+            Invalid JSON raises json.JSONDecodeError whatever the backend.
+
+            backend (str) - 'orjson', 'msgspec' or 'json'. Defaults to the first one installed.
+        """
+        self.backend = backend if backend is not None else available_backends()[0]
+        if self.backend not in available_backends():
+            raise ValueError(f"JSON backend '{self.backend}' is not installed; available: {available_backends()}")
+        self._loads = _loader(self.backend)
+
+    def loads(self, data):
+        """
+            Parses data (bytes or str) into dicts and lists.
+        """
+        return self._loads(data)
+
+    def decode(self, data, schema):
+        """
+            Parses data, keeping only the fields in schema. Missing fields are left out, so the
+            result can be read the same way as the full response.
+        """
+        if self.backend == "msgspec":
+            entry = _msgspec_types.get(id(schema))
+            if entry is None:
+                entry = _msgspec_types[id(schema)] = (schema, _msgspec_type(schema))
+            return msgspec.to_builtins(_msgspec_loads(data, entry[1]))
+        return _project(self._loads(data), schema)
+
+    def __repr__(self):
+        return f"Codec(backend={self.backend!r})"
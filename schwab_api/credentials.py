@@ -0,0 +1,106 @@
+import time
+
+from requests.cookies import create_cookie
+
+from .token_cache import TOKEN_SCOPES
+
+_COOKIE_FIELDS = ("name", "value", "domain", "path", "secure", "expires")
+
+
+class SchwabCredentials:
+    def __init__(self, cookies, headers, tokens=None, security_ids=None, taken_at=None):
+        """
+            The SchwabCredentials class. A snapshot of a logged in session made of plain values
+            only, so it pickles in a few KB. Hand it to a worker process instead of a Schwab
+            instance (whose session, transport, threads and browser references do not belong in
+            another process) and build the worker's own pooled client with client().
+
+            A newer snapshot can be applied to a running client with apply(), e.g. after the
+            parent logged in again.
+
+            cookies (list) - The session cookies, as dicts of name, value, domain, path, secure
+                        and expires.
+            headers (dict) - The header template sent with gateway requests, without the bearer
+                        token.
+            tokens (dict) - Maps scope to (token, issued_at) for the cached bearer tokens.
+            security_ids (dict) - The schwabSecurityId per symbol learned by the parent, so the
+                        worker can place orders directly without verifying them first.
+            taken_at (number) - When the snapshot was taken (time.time()).
+        """
+        self.cookies = cookies
+        self.headers = headers
+        self.tokens = tokens or {}
+        self.security_ids = security_ids or {}
+        self.taken_at = time.time() if taken_at is None else taken_at
+
+    @classmethod
+    def from_api(cls, api, include_tokens=True):
+        """
+            Takes a snapshot of api (a Schwab instance). Tokens are left out if include_tokens
+            is False, e.g. when the snapshot is stored for longer than a token lives.
+        """
+        tokens = {}
+        if include_tokens:
+            for scope in TOKEN_SCOPES:
+                entry = api.token_cache.peek(scope)
+                if entry is not None:
+                    tokens[scope] = (entry.token, entry.issued_at)
+        return cls(
+            [{field: getattr(cookie, field) for field in _COOKIE_FIELDS} for cookie in api.session.cookies],
+            {key: value for key, value in (api.headers or {}).items() if key.lower() != "authorization"},
+            tokens,
+            dict(getattr(api, "security_ids", {}))
+        )
+
+    @classmethod
+    def from_dict(cls, state):
+        tokens = {scope: tuple(entry) for scope, entry in state.get("tokens", {}).items()}
+        return cls(state["cookies"], state["headers"], tokens, state.get("security_ids"), state.get("taken_at"))
+
+    def to_dict(self):
+        """
+            Returns the snapshot as JSON serializable values (see from_dict).
+        """
+        return {
+            "cookies": self.cookies,
+            "headers": self.headers,
+            "tokens": {scope: list(entry) for scope, entry in self.tokens.items()},
+            "security_ids": self.security_ids,
+            "taken_at": self.taken_at
+        }
+
+    def apply(self, api):
+        """
+            Loads the snapshot into api (a Schwab instance): its cookies and header template
+            replace api's, and each token replaces the cached one unless that was issued later.
+        """
+        api.session.cookies.clear()
+        for cookie in self.cookies:
+            api.session.cookies.set_cookie(create_cookie(
+                cookie["name"],
+                cookie["value"],
+                domain=cookie["domain"],
+                path=cookie["path"],
+                secure=cookie["secure"],
+                expires=cookie["expires"]
+            ))
+        api.headers = dict(self.headers)
+        for scope, (token, issued_at) in self.tokens.items():
+            current = api.token_cache.peek(scope)
+            if current is None or issued_at > current.issued_at:
+                api.token_cache.put(scope, token, issued_at)
+        api.security_ids.update(self.security_ids)
+
+    def client(self, **kwargs):
+        """
+            Returns a new Schwab instance (with its own connection pool) logged in with this
+            snapshot. kwargs are passed to Schwab; the browser is not launched.
+        """
+        from .schwab import Schwab
+        kwargs.setdefault("launch_browser", False)
+        api = Schwab(**kwargs)
+        self.apply(api)
+        return api
+
+    def __repr__(self):
+        return f"SchwabCredentials(cookies={len(self.cookies)}, tokens={sorted(self.tokens)}, taken_at={self.taken_at})"
@@ -0,0 +1,196 @@
+import asyncio
+import threading
+import time
+
+from .order_store import OrderStore
+from .records import Fill
+
+# listView order statuses after which an order will not change again.
+FILLED_STATUS = "Filled"
+CLOSED_STATUSES = {"Filled", "Canceled", "Cancelled", "Rejected", "Expired", "Replaced"}
+
+
+class FillSubscription:
+    def __init__(self, callback, symbol):
+        self.callback = callback
+        self.symbol = symbol
+
+
+class FillTracker:
+    def __init__(self, account_id, store=None, clock=time.time):
+        """
+            The FillTracker class. Polls todays_orders_v2, diffs each order's status by OrderId
+            against the previous poll, and publishes a Fill to the subscribers whenever an order
+            changes to Filled. One poll serves every ticker, so fills (and positions derived from
+            them) no longer need a Holdings request per ticker, or a guess when a cancel fails.
+
+            The orders are kept in an OrderStore (store, or a new one), so each poll only
+            parses the entries that changed, and the store can be queried by symbol, status or
+            version. Orders already filled on the first poll are recorded without being
+            published, so net_filled() counts the fills since the tracker started.
+
+            Partial fills are not tracked: listView entries only give an order's total Quantity,
+            so an order counts as filled (for all of it) once its status is Filled. An order that
+            partially fills and is then canceled or replaced is not counted at all. Such orders
+            are counted by closed_without_fill(), so callers can check the position elsewhere
+            (e.g. Holdings) when it changes.
+
+            Polls are deduplicated: poll(api, max_age) only sends a request if no poll started
+            within max_age seconds, and callers that arrive while a poll is in flight wait for it
+            instead of sending their own.
+
+            account_id (int) - The account passed to todays_orders_v2.
+            store (OrderStore) - Where the polled orders are kept.
+        """
+        self.account_id = account_id
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._async_poll_lock = None
+        self.store = store if store is not None else OrderStore()
+        self._subscriptions = []
+        self._net_filled = {} # symbol -> signed quantity filled since the first poll
+        self._closed_without_fill = {} # symbol -> orders closed without filling since the first poll
+        self.fills = [] # every Fill published, oldest first
+        self.primed = False
+        self.last_poll_started = None
+        self.last_poll = None
+        self.polls = 0
+
+    def subscribe(self, callback, symbol=None):
+        """
+            Calls callback(fill) for every new fill, or only for fills of symbol if given.
+            Callbacks run in the thread (or task) that polls.
+
+            Returns a FillSubscription to pass to unsubscribe.
+        """
+        subscription = FillSubscription(callback, symbol)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def status(self, order_id, leg=0):
+        """
+            Returns the order's last seen OrderStatus, or None if it has not been seen.
+        """
+        return self.store.status(order_id, leg)
+
+    def is_open(self, order_id, leg=0):
+        """
+            Returns False once the order has been seen in a closed status (filled, canceled, ...).
+            Orders that have not been seen yet are assumed to be open.
+        """
+        return self.status(order_id, leg) not in CLOSED_STATUSES
+
+    def is_filled(self, order_id, leg=0):
+        return self.status(order_id, leg) == FILLED_STATUS
+
+    def net_filled(self, symbol):
+        """
+            Returns the quantity bought minus the quantity sold of symbol since the first poll.
+        """
+        return self._net_filled.get(symbol, 0)
+
+    def closed_without_fill(self, symbol):
+        """
+            Returns how many orders of symbol closed without filling (canceled, rejected, replaced,
+            ...) since the first poll. Any of them may have filled partially.
+        """
+        return self._closed_without_fill.get(symbol, 0)
+
+    def net_filled_by_symbol(self):
+        """
+            Returns net_filled for every symbol with fills, as a dict (a copy).
+        """
+        with self._lock:
+            return dict(self._net_filled)
+
+    def closed_without_fill_by_symbol(self):
+        """
+            Returns closed_without_fill for every symbol with such orders, as a dict (a copy).
+        """
+        with self._lock:
+            return dict(self._closed_without_fill)
+
+    def update(self, orders, now=None):
+        """
+            Diffs the Orders list of a todays_orders_v2 response against the last one and
+            publishes the new fills. Returns the new fills.
+        """
+        now = self._clock() if now is None else now
+        new_fills = []
+        deliveries = []
+        with self._lock:
+            for record in self.store.update(orders):
+                if not self.primed:
+                    continue
+                if record.status in CLOSED_STATUSES and record.status != FILLED_STATUS and record.previous_status not in CLOSED_STATUSES:
+                    self._closed_without_fill[record.symbol] = self._closed_without_fill.get(record.symbol, 0) + 1
+                if record.status != FILLED_STATUS or record.previous_status == FILLED_STATUS:
+                    continue
+                fill = Fill(record.order_id, record.symbol, record.action, record.qty, record.fill_price, now, record.leg, record)
+                new_fills.append(fill)
+                self._net_filled[fill.symbol] = self._net_filled.get(fill.symbol, 0) + fill.signed_qty
+                for subscription in self._subscriptions:
+                    if subscription.symbol is None or subscription.symbol == fill.symbol:
+                        deliveries.append((subscription.callback, fill))
+            self.fills.extend(new_fills)
+            self.primed = True
+            self.last_poll = now
+        for callback, fill in deliveries:
+            try:
+                callback(fill)
+            except Exception as e:
+                print(f"[FillTracker] subscriber callback for order {fill.order_id} failed: {e}")
+        return new_fills
+
+    def _is_fresh(self, requested_at, max_age):
+        return self.last_poll_started is not None and self.last_poll_started >= requested_at - max_age
+
+    def poll(self, api, max_age=0):
+        """
+            Polls todays_orders_v2 using api (a Schwab instance) unless a poll started within
+            max_age seconds. Returns the new fills ([] if no request was sent or it failed).
+        """
+        requested_at = self._clock()
+        with self._poll_lock:
+            if self._is_fresh(requested_at, max_age):
+                return []
+            self.last_poll_started = self._clock()
+            self.polls += 1
+            try:
+                orders, success = api.todays_orders_v2(self.account_id, compact=True)
+            except Exception as e:
+                print(f"[FillTracker] failed to get today's orders: {e}")
+                return []
+            if not success:
+                print(f"[FillTracker] failed to get today's orders: {orders}")
+                return []
+            return self.update(orders)
+
+    async def poll_async(self, api, max_age=0):
+        """
+            Same as poll, using api (an AsyncSchwab instance).
+        """
+        requested_at = self._clock()
+        if self._async_poll_lock is None:
+            self._async_poll_lock = asyncio.Lock()
+        async with self._async_poll_lock:
+            if self._is_fresh(requested_at, max_age):
+                return []
+            self.last_poll_started = self._clock()
+            self.polls += 1
+            try:
+                orders, success = await api.todays_orders_v2(self.account_id, compact=True)
+            except Exception as e:
+                print(f"[FillTracker] failed to get today's orders: {e}")
+                return []
+            if not success:
+                print(f"[FillTracker] failed to get today's orders: {orders}")
+                return []
+            return self.update(orders)
@@ -0,0 +1,279 @@
+import copy
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Sub-bucket bits of the latency histograms. Each power of two is split into 2**(bits - 1)
+# buckets, so a recorded value is off by at most 1/64 (~1.6%) from the one it is reported as.
+HISTOGRAM_SUB_BUCKET_BITS = 7
+# Bucket bounds (seconds) of the Prometheus histograms.
+PROMETHEUS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DEFAULT_METRIC_PREFIX = "schwab_gateway"
+
+
+class LatencyHistogram:
+    def __init__(self, sub_bucket_bits=HISTOGRAM_SUB_BUCKET_BITS):
+        """
+            An HDR-style histogram of durations. Values are recorded in microseconds into
+            log-linear buckets: exact below 2**sub_bucket_bits us, and with a fixed relative error
+            above that, so recording is O(1) and memory stays small whatever the range.
+        """
+        self.sub_bucket_bits = sub_bucket_bits
+        self._half = 1 << (sub_bucket_bits - 1)
+        self._counts = Counter() # bucket index -> count
+        self.count = 0
+        self.total = 0 # microseconds
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        exponent = value.bit_length() - self.sub_bucket_bits
+        if exponent <= 0:
+            return value
+        return exponent * self._half + (value >> exponent)
+
+    def _bounds(self, index):
+        # (lowest, highest) microsecond value recorded into bucket index
+        if index < 2 * self._half:
+            return index, index
+        exponent = index // self._half - 1
+        sub_bucket = index - exponent * self._half
+        return sub_bucket << exponent, ((sub_bucket + 1) << exponent) - 1
+
+    def record(self, seconds):
+        value = max(int(seconds * 1000000), 0)
+        self._counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, fraction):
+        """
+            Returns the duration (seconds) below which fraction (0-1) of the recorded values fall,
+            or None if nothing was recorded.
+        """
+        if self.count == 0:
+            return None
+        rank = max(fraction * self.count, 1)
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= rank:
+                return min(self._bounds(index)[1], self.max) / 1000000
+        return self.max / 1000000
+
+    def cumulative_counts(self, bounds):
+        """
+            Returns the number of recorded values at or below each of bounds (seconds).
+        """
+        result = [0] * len(bounds)
+        for index, count in self._counts.items():
+            value = self._bounds(index)[0] / 1000000
+            for i, bound in enumerate(bounds):
+                if value <= bound:
+                    result[i] += count
+        return result
+
+    def merge(self, other):
+        self._counts.update(other._counts)
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def summary(self):
+        if self.count == 0:
+            return None
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count / 1000,
+            "min_ms": self.min / 1000,
+            "p50_ms": self.percentile(0.50) * 1000,
+            "p90_ms": self.percentile(0.90) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "p999_ms": self.percentile(0.999) * 1000,
+            "max_ms": self.max / 1000,
+        }
+
+
+class EndpointStats:
+    def __init__(self):
+        """
+            Everything recorded for one endpoint.
+        """
+        self.latency = LatencyHistogram()
+        self.requests = 0
+        self.status_codes = Counter()
+        self.errors = Counter() # exception class name -> count
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.retries = 0
+
+    def summary(self):
+        return {
+            "requests": self.requests,
+            "status_codes": dict(self.status_codes),
+            "errors": dict(self.errors),
+            "bytes_out": self.bytes_out,
+            "bytes_in": self.bytes_in,
+            "retries": self.retries,
+            "latency": self.latency.summary(),
+        }
+
+
+class GatewayMetrics:
+    def __init__(self):
+        """
+            The GatewayMetrics class. Per-endpoint request counters and latency histograms for
+            the gateway calls made by Schwab and AsyncSchwab (quotes, verify, place, both cancel
+            phases, listView, Holdings, token fetches, ...).
+
+            Every call records its wall time (including a 401 retry), status code, request and
+            response bytes and retry count. Read them with snapshot(), or in the Prometheus text
+            format with prometheus_text() / start_http_server().
+        """
+        self._lock = threading.Lock()
+        self._endpoints = {} # endpoint name -> EndpointStats
+        self._server = None
+
+    def __getstate__(self):
+        # the lock and the HTTP server can not be pickled; the copy keeps the recorded stats only
+        with self._lock:
+            state = self.__dict__.copy()
+            state["_endpoints"] = copy.deepcopy(self._endpoints)
+        state["_lock"] = None
+        state["_server"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _stats(self, endpoint):
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = EndpointStats()
+        return stats
+
+    def record(self, endpoint, seconds, status_code, bytes_out=0, bytes_in=0, retries=0):
+        with self._lock:
+            stats = self._stats(endpoint)
+            stats.latency.record(seconds)
+            stats.requests += 1
+            stats.status_codes[status_code] += 1
+            stats.bytes_out += bytes_out
+            stats.bytes_in += bytes_in
+            stats.retries += retries
+
+    def record_error(self, endpoint, seconds, error, bytes_out=0, retries=0):
+        """
+            Records a call that raised (timeout, connection error, ...) instead of returning.
+        """
+        with self._lock:
+            stats = self._stats(endpoint)
+            stats.latency.record(seconds)
+            stats.requests += 1
+            stats.errors[type(error).__name__] += 1
+            stats.bytes_out += bytes_out
+            stats.retries += retries
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+
+    def endpoints(self):
+        with self._lock:
+            return list(self._endpoints.keys())
+
+    def histogram(self, endpoint):
+        """
+            Returns a copy of endpoint's LatencyHistogram, or None if nothing was recorded for it.
+        """
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                return None
+            histogram = LatencyHistogram(stats.latency.sub_bucket_bits)
+            histogram.merge(stats.latency)
+            return histogram
+
+    def snapshot(self):
+        """
+            Returns a dict of endpoint -> {requests, status_codes, errors, bytes_out, bytes_in,
+            retries, latency: {count, mean_ms, min_ms, p50_ms, p90_ms, p99_ms, p999_ms, max_ms}}.
+        """
+        with self._lock:
+            return {endpoint: stats.summary() for endpoint, stats in self._endpoints.items()}
+
+    def prometheus_text(self, prefix=DEFAULT_METRIC_PREFIX):
+        """
+            Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = [
+            f"# HELP {prefix}_request_duration_seconds Wall time of gateway requests, including retries.",
+            f"# TYPE {prefix}_request_duration_seconds histogram",
+        ]
+        counters = {
+            "requests_total": ("Gateway requests by status code.", []),
+            "errors_total": ("Gateway requests that raised, by exception type.", []),
+            "request_bytes_total": ("Bytes sent in gateway request bodies.", []),
+            "response_bytes_total": ("Bytes received in gateway response bodies.", []),
+            "retries_total": ("Gateway requests retried after a 401.", []),
+        }
+        with self._lock:
+            for endpoint, stats in sorted(self._endpoints.items()):
+                label = f'endpoint="{endpoint}"'
+                cumulative = stats.latency.cumulative_counts(PROMETHEUS_BUCKETS)
+                for bound, count in zip(PROMETHEUS_BUCKETS, cumulative):
+                    lines.append(f'{prefix}_request_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'{prefix}_request_duration_seconds_bucket{{{label},le="+Inf"}} {stats.latency.count}')
+                lines.append(f'{prefix}_request_duration_seconds_sum{{{label}}} {stats.latency.total / 1000000}')
+                lines.append(f'{prefix}_request_duration_seconds_count{{{label}}} {stats.latency.count}')
+                for status_code, count in sorted(stats.status_codes.items()):
+                    counters["requests_total"][1].append(f'{{{label},status="{status_code}"}} {count}')
+                for error, count in sorted(stats.errors.items()):
+                    counters["errors_total"][1].append(f'{{{label},error="{error}"}} {count}')
+                counters["request_bytes_total"][1].append(f'{{{label}}} {stats.bytes_out}')
+                counters["response_bytes_total"][1].append(f'{{{label}}} {stats.bytes_in}')
+                counters["retries_total"][1].append(f'{{{label}}} {stats.retries}')
+        for name, (description, samples) in counters.items():
+            lines.append(f"# HELP {prefix}_{name} {description}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            lines.extend(f"{prefix}_{name}{sample}" for sample in samples)
+        return "\n".join(lines) + "\n"
+
+    def start_http_server(self, port, host="127.0.0.1", prefix=DEFAULT_METRIC_PREFIX):
+        """
+            Serves prometheus_text() at http://host:port/metrics from a daemon thread. Returns the
+            server; call stop_http_server() to shut it down.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text(prefix).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.stop_http_server()
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="GatewayMetrics", daemon=True).start()
+        return self._server
+
+    def stop_http_server(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,133 @@
+import threading
+from collections import OrderedDict
+
+from .records import OrderStatus
+
+# the name of OrderStatus before it moved to records.py
+OrderRecord = OrderStatus
+
+
+class OrderStore:
+    def __init__(self):
+        """
+            The OrderStore class. Keeps the last seen listView entry of every order, keyed by
+            OrderId (and leg), and applies each new orders_v2 / todays_orders_v2 response as a
+            diff: entries that did not change are compared but not parsed again, and only changed
+            entries bump the store's version.
+
+            changed_since(version) returns what changed after a given version without scanning
+            the whole store, and by_symbol / by_status use indexes, so the cost of reading the
+            store stays flat as the day's order list grows.
+        """
+        self._lock = threading.RLock()
+        self._records = OrderedDict() # (order id, leg) -> OrderStatus, least recently changed first
+        self._by_symbol = {} # symbol -> {(order id, leg): None}, in the order first seen
+        self._by_status = {} # status -> {(order id, leg): None}, in the order first seen
+        self.version = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._records.values()))
+
+    def update(self, orders):
+        """
+            Applies the Orders list of an orders_v2 / todays_orders_v2 response. Returns the
+            OrderStatus records that are new or changed, in response order.
+
+            Orders missing from the response are kept; the listView may be filtered (e.g. open
+            orders only), so a missing order is not necessarily gone.
+        """
+        changed = []
+        with self._lock:
+            for order in orders:
+                for leg, item in enumerate(order.get("OrderList", [])):
+                    order_id = item.get("OrderId")
+                    if order_id is None:
+                        continue
+                    key = (int(order_id), leg)
+                    record = self._records.get(key)
+                    if record is not None and record.item == item:
+                        continue
+                    self.version += 1
+                    new_record = OrderStatus(key[0], leg, item, self.version, record.status if record is not None else None)
+                    self._index(record, new_record)
+                    self._records[key] = new_record
+                    self._records.move_to_end(key)
+                    changed.append(new_record)
+        return changed
+
+    def _index(self, old_record, new_record):
+        key = new_record.key
+        if old_record is None:
+            self._by_symbol.setdefault(new_record.symbol, {})[key] = None
+        elif old_record.symbol != new_record.symbol:
+            self._by_symbol.get(old_record.symbol, {}).pop(key, None)
+            self._by_symbol.setdefault(new_record.symbol, {})[key] = None
+        if old_record is None or old_record.status != new_record.status:
+            if old_record is not None:
+                self._by_status.get(old_record.status, {}).pop(key, None)
+            self._by_status.setdefault(new_record.status, {})[key] = None
+
+    def get(self, order_id, leg=0):
+        """
+            Returns the OrderStatus for order_id, or None if it has not been seen.
+        """
+        return self._records.get((int(order_id), leg))
+
+    def status(self, order_id, leg=0):
+        record = self.get(order_id, leg)
+        return None if record is None else record.status
+
+    def changed_since(self, version):
+        """
+            Returns the OrderStatus records changed after version, oldest change first.
+        """
+        changed = []
+        with self._lock:
+            for record in reversed(self._records.values()):
+                if record.version <= version:
+                    break
+                changed.append(record)
+        changed.reverse()
+        return changed
+
+    def by_symbol(self, symbol, status=None):
+        """
+            Returns the OrderStatus records for symbol (optionally only those with status), in the order
+            they were first seen.
+        """
+        with self._lock:
+            keys = self._by_symbol.get(symbol, {})
+            if status is not None:
+                with_status = self._by_status.get(status, {})
+                keys = [key for key in keys if key in with_status]
+            return [self._records[key] for key in keys]
+
+    def by_status(self, status):
+        """
+            Returns the OrderStatus records whose last seen OrderStatus is status.
+        """
+        with self._lock:
+            return [self._records[key] for key in self._by_status.get(status, {})]
+
+    def symbols(self):
+        with self._lock:
+            return [symbol for symbol, keys in self._by_symbol.items() if keys]
+
+    def poll(self, api, account_id=None, today=True):
+        """
+            Fetches today's orders (or orders_v2 if today is False) using api (a Schwab instance)
+            and applies them. Returns the changed OrderStatus records, or None if the request failed.
+        """
+        if today:
+            orders, success = api.todays_orders_v2(account_id, compact=True)
+        else:
+            orders = api.orders_v2(account_id, compact=True)
+            success = not isinstance(orders, tuple)
+        if not success:
+            print(f"[OrderStore] failed to get orders: {orders}")
+            return None
+        return self.update(orders)
@@ -0,0 +1,515 @@
+import copy
+import json
+import re
+
+from . import urls
+from .fill_tracker import CLOSED_STATUSES, FILLED_STATUS
+from .records import OrderStatus
+
+# Marker values put in an order payload where a per-order value goes. They are replaced with the
+# real values when the payload is rendered, so the rest of the payload is only serialized once.
+LIMIT_PRICE = "@@LimitPrice@@"
+ORDER_ID = "@@OrderId@@"
+ITEM_ISSUE_ID = "@@ItemIssueId@@"
+CANCEL_ORDER_ID = "@@CancelOrderId@@"
+_SLOT_PATTERN = re.compile(r'"@@(\w+)@@"')
+
+# OrderProcessingControl seems to map to verification vs actually placing an order.
+VERIFY = 1
+PLACE = 2
+
+_json_encode = json.JSONEncoder(separators=(",", ":")).encode
+
+
+def normalize_limit_price(limit_price, name="limit_price"):
+    """
+        Rounds limit_price to the precision the gateway accepts: 2 decimal places for prices
+        >= $1 and 4 decimal places for prices < $1.
+
+        round() is exact for floats, so a price that already has few enough decimal places comes
+        back unchanged and a price that doesn't is rounded, without formatting the price as a
+        string to count its decimal places.
+
+        name (str) - The argument name used in the warning.
+
+        Returns limit_price (number), warning (str or None)
+    """
+    places = 2 if limit_price >= 1 else 4
+    rounded = round(limit_price, places)
+    if rounded == limit_price:
+        return limit_price, None
+    bound = ">=" if limit_price >= 1 else "<"
+    return rounded, f"For {name} {bound} 1, Only {places} decimal places allowed. Rounded price_limit to: {rounded}"
+
+
+class _CompiledPayload:
+    def __init__(self, payload):
+        """
+            A payload serialized once, split around its markers. Rendering joins the invariant
+            byte chunks with the encoded values for the markers.
+        """
+        text = _json_encode(payload)
+        self.chunks = []
+        self.slots = []
+        position = 0
+        for match in _SLOT_PATTERN.finditer(text):
+            self.chunks.append(text[position:match.start()].encode("utf-8"))
+            self.slots.append(match.group(1))
+            position = match.end()
+        self.chunks.append(text[position:].encode("utf-8"))
+
+    def render(self, values):
+        parts = [self.chunks[0]]
+        for slot, chunk in zip(self.slots, self.chunks[1:]):
+            parts.append(values[slot])
+            parts.append(chunk)
+        return b"".join(parts)
+
+
+class OrderTemplate:
+    def __init__(self, payload, affirm_order=False):
+        """
+            The OrderTemplate class. A v2 order payload for one (ticker, side, qty, order type,
+            duration, ...) combination, serialized ahead of time so sending an order only patches
+            the limit price, the order id and the processing control into cached bytes.
+
+            payload (dict) - The verification payload, with LIMIT_PRICE where the limit price
+                        goes. OrderProcessingControl is set by the template.
+            affirm_order (bool) - Adds OrderAffrmIn to the placement payload.
+        """
+        self.payload = payload
+        self.affirm_order = affirm_order
+        verify = copy.deepcopy(payload)
+        verify["OrderProcessingControl"] = VERIFY
+        self._verify = _CompiledPayload(verify)
+        self._place = {} # whether the ItemIssueId is included -> _CompiledPayload
+
+    @property
+    def ticker(self):
+        return self.payload["OrderStrategy"]["OrderLegs"][0]["Instrument"]["Symbol"]
+
+    def verify_body(self, limit_price, cancel_order_id=None):
+        """
+            Returns the verification request body (bytes) for limit_price.
+
+            cancel_order_id (int) - The order being replaced, for templates built from
+                        replace_limit_order_payload.
+        """
+        values = {"LimitPrice": _encode_price(limit_price)}
+        if cancel_order_id is not None:
+            values["CancelOrderId"] = _json_encode(int(cancel_order_id)).encode("utf-8")
+        return self._verify.render(values)
+
+    def place_body(self, limit_price, order_id, security_id=None, cancel_order_id=None):
+        """
+            Returns the placement request body (bytes).
+
+            order_id (int) - The orderId from the verification response, or 0 when placing
+                        without verifying first.
+            security_id (int) - The first leg's schwabSecurityId, if known.
+            cancel_order_id (int) - The order being replaced, for templates built from
+                        replace_limit_order_payload.
+        """
+        with_security_id = security_id is not None
+        compiled = self._place.get(with_security_id)
+        if compiled is None:
+            compiled = self._place[with_security_id] = self._compile_place(with_security_id)
+        values = {"LimitPrice": _encode_price(limit_price), "OrderId": _json_encode(int(order_id)).encode("utf-8")}
+        if with_security_id:
+            values["ItemIssueId"] = _json_encode(security_id).encode("utf-8")
+        if cancel_order_id is not None:
+            values["CancelOrderId"] = _json_encode(int(cancel_order_id)).encode("utf-8")
+        return compiled.render(values)
+
+    def _compile_place(self, with_security_id):
+        place = copy.deepcopy(self.payload)
+        if with_security_id:
+            place["OrderStrategy"]["OrderLegs"][0]["Instrument"]["ItemIssueId"] = ITEM_ISSUE_ID
+        place["UserContext"]["CustomerId"] = 0
+        place["OrderStrategy"]["OrderId"] = ORDER_ID
+        place["OrderProcessingControl"] = PLACE
+        if self.affirm_order:
+            place["OrderStrategy"]["OrderAffrmIn"] = True
+        return _CompiledPayload(place)
+
+
+class OrderSubmission:
+    def __init__(
+            self, template, limit_price, valid_return_codes, security_ids, dry_run=False, place_directly=False,
+            warnings=(), replace_order_id=None
+            ):
+        """
+            The OrderSubmission class. The part of sending an order that does not depend on how
+            the requests are sent, shared by Schwab._submit_order_v2 and
+            AsyncSchwab._submit_order_v2: where each request goes, its body, and what its
+            response means. The clients only send the requests and decode the responses.
+
+            template (OrderTemplate) - The order.
+            security_ids (dict) - The client's schwabSecurityId per symbol. Updated from the
+                        gateway's responses.
+            place_directly (bool) - Place the order with a single request if the symbol's
+                        schwabSecurityId is cached.
+            warnings (iterable) - Messages (or None) to put in front of the gateway's messages.
+            replace_order_id (int) - Replace this open order instead of placing a new one.
+        """
+        self.template = template
+        self.ticker = template.ticker
+        self.limit_price = limit_price
+        self.valid_return_codes = valid_return_codes
+        self.security_ids = security_ids
+        self.dry_run = dry_run
+        self.warnings = [warning for warning in warnings if warning is not None]
+        self.replace_order_id = replace_order_id
+        self.account_id = template.payload["UserContext"]["AccountId"]
+        self.order_id = None
+        self.security_id = None
+        self.placement_unclear = False
+
+        self.url = urls.order_verification_v2()
+        self.token_type = 'update'
+        self.resource_version = '1.0'
+        self.verify_endpoint, self.place_endpoint = "verify", "place"
+        if replace_order_id is not None:
+            # replacements go to the replaced order's URL on the same order management service as
+            # new orders, with the same token scope and resource version
+            self.url = urls.replace_order_v2(replace_order_id)
+            self.verify_endpoint, self.place_endpoint = "replace_verify", "replace_confirm"
+            place_directly = False
+        self.place_directly = place_directly and not dry_run
+
+    def direct_body(self):
+        """
+            Returns the body for placing the order without verifying it first (sent to
+            urls.order_verification_v2()), or None if the order has to be verified.
+        """
+        if not self.place_directly or self.ticker not in self.security_ids:
+            return None
+        return self.template.place_body(self.limit_price, 0, self.security_ids[self.ticker])
+
+    def direct_result(self, status_code, response):
+        """
+            Returns the result for the response to the direct_body request, or None if the order
+            has to be verified and placed after all.
+
+            status_code (int) - The response's status, or None if no response came back (e.g.
+                        the request timed out).
+            response (dict) - The decoded response, or None if it could not be decoded.
+
+            Only a response that shows the order was not accepted (a 4xx status, or an
+            orderReturnCode without an orderId) falls back to the two-phase flow. If it is
+            unclear whether the order was placed (no response, a 5xx status, or a body
+            without an orderReturnCode), placement_unclear is set: the caller has to look for the order in
+            today's orders (see unclear_result) before placing it again, or it may be placed twice.
+        """
+        self.placement_unclear = False
+        strategy = response.get("orderStrategy") if status_code == 200 and isinstance(response, dict) else None
+        if strategy is not None and strategy.get("orderId"):
+            return parse_order_placement(response, self.valid_return_codes, self.warnings)
+        rejected = (status_code is not None and 400 <= status_code < 500) or (strategy is not None and strategy.get("orderReturnCode") is not None)
+        self.placement_unclear = not rejected
+        if rejected:
+            # The cached id may be stale; the verification caches a fresh one.
+            self.security_ids.pop(self.ticker, None)
+        return None
+
+    def unclear_result(self, orders):
+        """
+            Returns the result of a direct placement whose response was unclear, or None if the
+            order is not among orders and has to be placed again.
+
+            orders (list) - The Orders of a todays_orders_v2 response for the order's account,
+                        or None if they could not be fetched (the order is then reported as
+                        failed rather than risk placing it twice).
+        """
+        if orders is None:
+            return self.warnings + ["The order may have been placed, but today's orders could not be checked"], False, None
+        order = self.find_order(orders)
+        if order is None:
+            return None
+        return list(self.warnings), True, order.order_id
+
+    def find_order(self, orders):
+        """
+            Returns the OrderStatus of the newest order in orders (a todays_orders_v2 Orders list)
+            that looks like this one: same symbol, side, quantity and limit price, and open or
+            filled. An identical order placed earlier is not told apart from this one.
+        """
+        leg = self.template.payload["OrderStrategy"]["OrderLegs"][0]
+        is_sell = str(leg["Instruction"]) != "49"
+        qty = float(leg["Quantity"])
+        limit_price = round(float(self.limit_price), 2)
+        found = None
+        for order in orders:
+            for item in order.get("OrderList", [])[:1]:
+                if item.get("OrderId") is None:
+                    continue
+                record = OrderStatus(int(item["OrderId"]), 0, item, 0)
+                if record.symbol != self.ticker or ("Sell" in record.action) != is_sell or record.qty != qty:
+                    continue
+                if record.status in CLOSED_STATUSES and record.status != FILLED_STATUS:
+                    continue
+                if not record.is_market and record.price is not None and round(record.price, 2) != limit_price:
+                    continue
+                if found is None or record.order_id > found.order_id:
+                    found = record
+        return found
+
+    def verify_body(self):
+        return self.template.verify_body(self.limit_price, self.replace_order_id)
+
+    def verify_result(self, response):
+        """
+            Reads the orderId and the schwabSecurityId from the verification response. Returns
+            the result if the order is not to be placed (it was rejected or dry_run is set), or
+            None if place_body should be sent next.
+        """
+        self.order_id = response['orderStrategy']['orderId']
+        self.security_id = response['orderStrategy']['orderLegs'][0].get("schwabSecurityId")
+        if self.security_id is not None:
+            self.security_ids[self.ticker] = self.security_id
+
+        messages = list(self.warnings)
+        for message in response["orderStrategy"]["orderMessages"]:
+            messages.append(message["message"])
+
+        # TODO: This needs to be fleshed out and clarified.
+        if response["orderStrategy"]["orderReturnCode"] not in self.valid_return_codes:
+            return messages, False, None
+        if self.dry_run:
+            return messages, True, None
+        return None
+
+    def place_body(self):
+        return self.template.place_body(self.limit_price, self.order_id, self.security_id, self.replace_order_id)
+
+    def place_result(self, response):
+        return parse_order_placement(response, self.valid_return_codes, self.warnings)
+
+
+def parse_order_placement(response, valid_return_codes, warnings=()):
+    """
+        Returns messages (list of strings), is_success (boolean), order_id (or None) for a
+        placement response.
+    """
+    messages = list(warnings)
+    if "orderMessages" in response["orderStrategy"] and response["orderStrategy"]["orderMessages"] is not None:
+        for message in response["orderStrategy"]["orderMessages"]:
+            messages.append(message["message"])
+
+    if response["orderStrategy"]["orderReturnCode"] in valid_return_codes:
+        return messages, True, response['orderStrategy']['orderId']
+
+    return messages, False, None
+
+
+def _encode_price(limit_price):
+    # Limit prices are sent as strings, same as str(limit_price) in the original payloads.
+    return _json_encode(str(limit_price)).encode("utf-8")
+
+
+def limit_order_payload(ticker, instruction, qty, account_id, duration, primary_security_type, costBasis):
+    """
+        Payload for a single-leg limit order. instruction is 49 (Buy) or 50 (Sell).
+    """
+    return {
+        "UserContext": {
+            "AccountId":str(account_id),
+            "AccountColor":0
+        },
+        "OrderStrategy": {
+            # Unclear what the security types map to.
+            "PrimarySecurityType":primary_security_type,
+            "CostBasisRequest": {
+                "costBasisMethod":costBasis,
+                "defaultCostBasisMethod":costBasis
+            },
+            "OrderType":"50", # Limit
+            "LimitPrice":LIMIT_PRICE,
+            "StopPrice":"0",
+            "Duration":str(duration),
+            "AllNoneIn":False,
+            "DoNotReduceIn":False,
+            "OrderStrategyType":1,
+            "MinimumQuantity":0,
+            "OrderLegs":[
+                {
+                    "Quantity":str(qty),
+                    "LeavesQuantity":str(qty),
+                    "Instrument":{"Symbol":ticker},
+                    "SecurityType":primary_security_type,
+                    "Instruction":instruction
+                }
+            ]
+        }
+    }
+
+
+def replace_limit_order_payload(ticker, instruction, qty, account_id, duration, primary_security_type, costBasis):
+    """
+        Payload for replacing an open order with a single-leg limit order: the limit order
+        payload, with CANCEL_ORDER_ID where the id of the order being replaced goes.
+    """
+    payload = limit_order_payload(ticker, instruction, qty, account_id, duration, primary_security_type, costBasis)
+    payload["OrderStrategy"]["CancelOrderId"] = CANCEL_ORDER_ID
+    return payload
+
+
+def order_payload(ticker, instruction, qty, account_id, order_type, duration, stop_price, primary_security_type, costBasis):
+    """
+        Payload for the generic trade_v2 order. instruction is "49" (Buy) or "50" (Sell).
+    """
+    return {
+        "UserContext": {
+            "AccountId":str(account_id),
+            "AccountColor":0
+        },
+        "OrderStrategy": {
+            # Unclear what the security types map to.
+            "PrimarySecurityType":primary_security_type,
+            "CostBasisRequest": {
+                "costBasisMethod":costBasis,
+                "defaultCostBasisMethod":costBasis
+            },
+            "OrderType":str(order_type),
+            "LimitPrice":LIMIT_PRICE,
+            "StopPrice":str(stop_price),
+            "Duration":str(duration),
+            "AllNoneIn":False,
+            "DoNotReduceIn":False,
+            "OrderStrategyType":1,
+            "OrderLegs":[
+                {
+                    "Quantity":str(qty),
+                    "LeavesQuantity":str(qty),
+                    "Instrument":{"Symbol":ticker},
+                    "SecurityType":primary_security_type,
+                    "Instruction":instruction
+                }
+            ]
+        }
+    }
+
+
+def oco_order_payload(ticker, instruction, qty, account_id, duration, primary_security_type, trailing_stop_dollars):
+    """
+        Payload for an OCO bracket of a limit order and a trailing stop on the same side.
+        instruction is 49 (Buy) or 50 (Sell, short sell = 53).
+    """
+    return {
+        "UserContext": {
+            "AccountId":str(account_id),
+            "AccountColor":1,
+            "CustomerId": 0
+        },
+        "OrderStrategy": {
+            "OrderStrategyType":4, # OCO bracket
+            "GroupOrderId":0,
+            "ChildOrders":[
+                {
+                    "AllNoneIn":False,
+                    "DoNotReduceIn":False,
+                    "Duration":str(duration),
+                    "LimitPrice":LIMIT_PRICE,
+                    "MinimumQuantity":0,
+                    "OrderId":0,
+                    "OrderLegs":[
+                        {
+                            "Instruction": instruction,
+                            "LeavesQuantity": str(qty),
+                            "Quantity": str(qty),
+                            "SecurityType": 46,
+                            "Instrument": {"Symbol": ticker}
+                        }
+                    ],
+                    "OrderStrategyType":1,
+                    "OrderType":"50",
+                    "PrimarySecurityType":46,
+                    "StopPrice":"0"
+                },
+                {
+                    "AllNoneIn":False,
+                    "DoNotReduceIn":False,
+                    "Duration":duration,
+                    "LimitPrice":0,
+                    "MinimumQuantity":0,
+                    "OrderId":0,
+                    "OrderLegs":[
+                        {
+                            "Instruction":instruction,
+                            "Instrument":{"Symbol": ticker},
+                            "LeavesQuantity":str(qty),
+                            "Quantity":str(qty),
+                            "SecurityType":46,
+                        }
+                    ],
+                    "OrderStrategyType":1,
+                    "OrderType":84, # Trailing stop
+                    "PrimarySecurityType":46,
+                    "ReinvestDividend": False,
+                    "StopPrice":"0",
+                    "TrailingStop": {
+                        "stopPriceLinkType":1,
+                        "stopPriceOffset":trailing_stop_dollars
+                    }
+                }
+            ],
+            "OrderLegs":[
+                {
+                    "Quantity":str(qty),
+                    "LeavesQuantity":str(qty),
+                    "Instrument":{"Symbol":ticker},
+                    "SecurityType":primary_security_type,
+                    "Instruction":instruction
+                }
+            ]
+        }
+    }
+
+
+def cancel_order_payload(order_id, instrument_type=46):
+    """
+        Verification payload for cancel_order_v2.
+    """
+    return {
+        "TypeOfOrder": 0,
+        "OrderManagementSystem": 2,
+        "Orders": [{
+            "OrderId": order_id,
+            "IsLiveOrder": True,
+            "InstrumentType": instrument_type,
+            "CancelOrderLegs": [{}],
+            }],
+        "ContingentIdToCancel": 0,
+        "OrderIdToCancel": 0,
+        "OrderProcessingControl": VERIFY,
+        "ConfirmCancelOrderId": 0,
+        }
+
+
+def cancel_limit_order_payload(order_id, ticker, buysell, price, qty, instrument_type=46):
+    """
+        Verification payload for cancel_limit_order_v2. buysell is 'Buy' or 'Sell'.
+    """
+    return {
+        "TypeOfOrder": 0,
+        "OrderManagementSystem": 1,
+        "Orders": [{
+            "OrderId": order_id,
+            "IsLiveOrder": True,
+            "InstrumentType": instrument_type,
+            "IsOrphanConditional": False,
+            "Price": "Limit $" + str(round(price, 2)),
+            "CancelOrderLegs": [
+                {
+                    "Action":buysell,
+                    "Quantity":str(qty),
+                    "QuantityUnitCode":qty,
+                    "Symbol":ticker,
+                }
+            ],
+        }],
+        "ContingentIdToCancel": 0,
+        "OrderIdToCancel": 0,
+        "OrderProcessingControl": VERIFY,
+        "ConfirmCancelOrderId": 0,
+        }
@@ -0,0 +1,250 @@
+import asyncio
+import threading
+import time
+
+# Polling cadence. Every symbol is polled at least every max_interval and at most every
+# min_interval; symbols whose quote did not change back off towards max_interval.
+DEFAULT_MIN_INTERVAL = 1.5 # seconds
+DEFAULT_MAX_INTERVAL = 12  # seconds
+DEFAULT_BACKOFF = 2        # interval multiplier after a poll returns an unchanged quote
+# quote_v2 accepts a list of symbols; larger subscriptions are split into requests of this size.
+DEFAULT_MAX_BATCH = 50
+
+
+def quotes_by_symbol(tickers, quotes):
+    """
+        Maps each quote from a quote_v2 response to its symbol. Quotes come back in request order,
+        so the position is used if a quote does not name its symbol.
+
+        Returns a dict of symbol -> quote entry (as returned by quote_v2).
+    """
+    result = {}
+    for i, quote in enumerate(quotes):
+        symbol = quote.get("symbol", tickers[i] if i < len(tickers) else None)
+        if symbol is not None:
+            result[symbol] = quote
+    return result
+
+
+class QuoteSubscription:
+    def __init__(self, symbol, callback, interval):
+        """
+            One subscriber's interest in a symbol. callback(symbol, quote) is called with every
+            new Quote; interval is the slowest cadence (seconds) the subscriber accepts.
+        """
+        self.symbol = symbol
+        self.callback = callback
+        self.interval = interval
+
+
+class _SymbolState:
+    def __init__(self, interval):
+        self.interval = interval
+        self.next_poll = 0
+        self.quote = None
+        self.received_at = None
+        self.version = 0
+
+
+class QuoteService:
+    def __init__(
+            self,
+            account_id,
+            min_interval=DEFAULT_MIN_INTERVAL,
+            max_interval=DEFAULT_MAX_INTERVAL,
+            backoff=DEFAULT_BACKOFF,
+            max_batch=DEFAULT_MAX_BATCH,
+            clock=time.time
+            ):
+        """
+            The QuoteService class. Polls quotes for every subscribed symbol with as few quote_v2
+            requests as possible and fans each result out to the symbol's subscribers, so gateway
+            calls per second stay flat as symbols are added.
+
+            Each tick, every symbol that is due is put in one batched request. A symbol's cadence
+            adapts: it is polled every min_interval while its quote is moving, and backs off by
+            backoff while the quote stays the same, up to max_interval or the smallest interval
+            one of its subscribers accepts. boost(symbol) makes a symbol due on the next tick.
+
+            Drive it with start(api) (a thread using a Schwab instance), run_async(api) (a task
+            using an AsyncSchwab instance), or poll_once / poll_once_async.
+
+            account_id (int) - The account ID passed to quote_v2.
+            min_interval (number) - The tick length and fastest per-symbol cadence, in seconds.
+            max_interval (number) - The slowest per-symbol cadence, in seconds.
+            backoff (number) - Multiplier applied to a symbol's interval when its quote is unchanged.
+            max_batch (int) - The most symbols per quote_v2 request.
+        """
+        self.account_id = account_id
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.max_batch = max_batch
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._subscriptions = {} # symbol -> [QuoteSubscription]
+        self._symbols = {} # symbol -> _SymbolState
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.requests_sent = 0
+
+    def subscribe(self, symbol, callback=None, interval=None):
+        """
+            Subscribes to quotes for symbol. The symbol is polled on the next tick.
+
+            callback (callable) - Called as callback(symbol, quote) from the polling thread/task
+                        with each new Quote. Optional; latest() works without one.
+            interval (number) - The slowest cadence the subscriber accepts. Defaults to
+                        max_interval.
+
+            Returns a QuoteSubscription to pass to unsubscribe.
+        """
+        subscription = QuoteSubscription(symbol, callback, self.max_interval if interval is None else interval)
+        with self._lock:
+            self._subscriptions.setdefault(symbol, []).append(subscription)
+            if symbol not in self._symbols:
+                self._symbols[symbol] = _SymbolState(self.min_interval)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.symbol, [])
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.symbol, None)
+                self._symbols.pop(subscription.symbol, None)
+
+    def symbols(self):
+        return list(self._symbols.keys())
+
+    def boost(self, symbol):
+        """
+            Resets symbol to the fastest cadence and makes it due on the next tick.
+        """
+        state = self._symbols.get(symbol)
+        if state is not None:
+            state.interval = self.min_interval
+            state.next_poll = 0
+
+    def latest(self, symbol):
+        """
+            Returns (Quote, time received, version) for symbol, or None if no quote has
+            been received yet. version increases with every quote received for the symbol.
+        """
+        state = self._symbols.get(symbol)
+        if state is None or state.quote is None:
+            return None
+        return state.quote, state.received_at, state.version
+
+    def due_batches(self, now=None):
+        """
+            Returns the symbols due for a poll at now, split into lists of at most max_batch.
+        """
+        now = self._clock() if now is None else now
+        with self._lock:
+            due = [symbol for symbol, state in self._symbols.items() if state.next_poll <= now]
+        return [due[i:i + self.max_batch] for i in range(0, len(due), self.max_batch)]
+
+    def publish(self, tickers, quotes, now=None):
+        """
+            Records quotes (a dict of symbol -> Quote, as returned by get_quotes) for the
+            requested tickers, adjusts each symbol's cadence and calls the subscribers' callbacks.
+        """
+        now = self._clock() if now is None else now
+        deliveries = []
+        with self._lock:
+            for symbol in tickers:
+                state = self._symbols.get(symbol)
+                if state is None: # unsubscribed while the request was in flight
+                    continue
+                quote = quotes.get(symbol)
+                # the slowest cadence every subscriber of the symbol accepts
+                cap = min([self.max_interval] + [s.interval for s in self._subscriptions.get(symbol, [])])
+                if quote is None or (state.quote is not None and (quote.bid, quote.ask, quote.last) == (state.quote.bid, state.quote.ask, state.quote.last)):
+                    state.interval = min(state.interval * self.backoff, cap)
+                else:
+                    state.interval = self.min_interval
+                state.next_poll = now + state.interval
+                if quote is None:
+                    continue
+                state.quote = quote
+                state.received_at = now
+                state.version += 1
+                for subscription in self._subscriptions.get(symbol, []):
+                    if subscription.callback is not None:
+                        deliveries.append((subscription.callback, symbol, quote))
+        for callback, symbol, quote in deliveries:
+            try:
+                callback(symbol, quote)
+            except Exception as e:
+                print(f"[QuoteService] subscriber callback for '{symbol}' failed: {e}")
+
+    def _failed(self, tickers, now=None):
+        # retry failed symbols on the next tick
+        now = self._clock() if now is None else now
+        with self._lock:
+            for symbol in tickers:
+                state = self._symbols.get(symbol)
+                if state is not None:
+                    state.next_poll = now + self.min_interval
+
+    def poll_once(self, api):
+        """
+            Sends one quote_v2 request per due batch using api (a Schwab instance).
+        """
+        for tickers in self.due_batches():
+            self.requests_sent += 1
+            try:
+                quotes = api.get_quotes(tickers, self.account_id)
+            except Exception as e:
+                print(f"[QuoteService] failed to get quotes for {tickers}: {e}")
+                self._failed(tickers)
+                continue
+            self.publish(tickers, quotes)
+
+    async def poll_once_async(self, api):
+        """
+            Sends the due batches concurrently using api (an AsyncSchwab instance).
+        """
+        batches = self.due_batches()
+        self.requests_sent += len(batches)
+        results = await asyncio.gather(*[api.get_quotes(tickers, self.account_id) for tickers in batches], return_exceptions=True)
+        for tickers, quotes in zip(batches, results):
+            if isinstance(quotes, Exception):
+                print(f"[QuoteService] failed to get quotes for {tickers}: {quotes}")
+                self._failed(tickers)
+                continue
+            self.publish(tickers, quotes)
+
+    def start(self, api):
+        """
+            Polls in a daemon thread using api (a Schwab instance) until stop() is called.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, args=(api,), name="QuoteService", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self, api):
+        while not self._stop_event.is_set():
+            tick_start = self._clock()
+            self.poll_once(api)
+            self._stop_event.wait(max(self.min_interval - (self._clock() - tick_start), 0))
+
+    async def run_async(self, api):
+        """
+            Polls on the running event loop using api (an AsyncSchwab instance) until cancelled.
+        """
+        while True:
+            tick_start = self._clock()
+            await self.poll_once_async(api)
+            await asyncio.sleep(max(self.min_interval - (self._clock() - tick_start), 0))
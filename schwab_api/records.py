@@ -0,0 +1,367 @@
+import datetime
+
+# Marks a lazily decoded field that has not been decoded yet.
+_UNSET = object()
+
+
+def parse_dollars(value):
+    """
+        Parses a listView amount like "$12.34" or "Limit $12.34". Returns None if there is none.
+    """
+    if not value:
+        return None
+    try:
+        return float(str(value).rsplit("$", 1)[-1].replace(",", ""))
+    except ValueError:
+        return None
+
+
+def parse_amount(value):
+    """
+        Parses a signed amount like "-$1,234.56" or "$12.34". Returns None if there is none.
+    """
+    if value is None:
+        return None
+    text = str(value).strip().replace("$", "").replace(",", "")
+    if not text:
+        return None
+    if text.startswith("(") and text.endswith(")"):
+        text = "-" + text[1:-1]
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def parse_date(value):
+    """
+        Parses a transaction date like "01/02/2024" (or "01/02/2024 as of 12/29/2023", which is
+        the first date). Returns None if there is none.
+    """
+    if not value or len(value) < 10:
+        return None
+    try:
+        return datetime.date(int(value[6:10]), int(value[0:2]), int(value[3:5]))
+    except ValueError:
+        return None
+
+
+def _float(value):
+    return None if value is None or value == "" else float(value)
+
+
+class _Record:
+    __slots__ = ()
+    _FIELDS = ()
+
+    def _as_dict(self):
+        return {field: getattr(self, field) for field in self._FIELDS}
+
+    def __getitem__(self, key):
+        # dict-style access to the fields, so records can be used where dicts were
+        if key not in self._FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._FIELDS else default
+
+    def keys(self):
+        return self._FIELDS
+
+    def __contains__(self, key):
+        return key in self._FIELDS
+
+    def __eq__(self, other):
+        if isinstance(other, _Record):
+            other = other._as_dict()
+        return self._as_dict() == other
+
+    def __repr__(self) -> str:
+        return str(self._as_dict())
+
+    def __str__(self) -> str:
+        return str(self._as_dict())
+
+
+class Quote:
+    __slots__ = ("symbol", "bid", "ask", "last", "entry")
+    # the fields of a quote_v2 entry's quote that are decoded
+    QUOTE_FIELDS = ("bid", "ask", "last")
+
+    def __init__(self, symbol, bid, ask, last=None, entry=None):
+        """
+            One symbol's quote. bid, ask and last are decoded once, when the quote is received;
+            every other field stays in the raw quote_v2 entry until it is asked for.
+
+            entry (dict) - The quote_v2 entry the quote was decoded from. Quotes from get_quotes
+                        are decoded with codec.QUOTES_SCHEMA, so their entry only has QUOTE_FIELDS.
+        """
+        self.symbol = symbol
+        self.bid = bid
+        self.ask = ask
+        self.last = last
+        self.entry = entry
+
+    @classmethod
+    def from_entry(cls, entry, symbol=None):
+        """
+            Decodes an entry of a quote_v2 response. symbol is used if the entry does not name one.
+            An entry whose quote is null (e.g. an unknown symbol) decodes with no prices.
+        """
+        quote = entry.get("quote") or {}
+        return cls(entry.get("symbol", symbol), _float(quote.get("bid")), _float(quote.get("ask")), _float(quote.get("last")), entry)
+
+    def field(self, name, default=None):
+        """
+            Returns a field of the raw quote (e.g. 'bidSize'), undecoded.
+        """
+        return (self.entry.get("quote") or {}).get(name, default)
+
+    def __getitem__(self, key):
+        # the raw entry's fields, so quotes can be used where entries were
+        return self.entry[key]
+
+    def get(self, key, default=None):
+        return self.entry.get(key, default)
+
+    def __repr__(self):
+        return f"Quote(symbol={self.symbol!r}, bid={self.bid}, ask={self.ask}, last={self.last})"
+
+
+class Position(_Record):
+    __slots__ = ("symbol", "quantity", "_raw", "_description", "_cost", "_market_value")
+    _FIELDS = ("symbol", "description", "quantity", "cost", "market_value")
+
+    def __init__(self, symbol, description, quantity, cost, market_value):
+        self.symbol = symbol
+        self.quantity = quantity
+        self._raw = None
+        self._description = description
+        self._cost = cost
+        self._market_value = market_value
+
+    @classmethod
+    def from_v2(cls, position):
+        """
+            A position of a Holdings v2 response. Only symbol and quantity are decoded up front;
+            description, cost and market_value are decoded on first use.
+        """
+        record = cls(position["symbolDetail"]["symbol"], _UNSET, float(position["quantity"]), _UNSET, _UNSET)
+        record._raw = position
+        return record
+
+    @property
+    def description(self):
+        if self._description is _UNSET:
+            self._description = self._raw["symbolDetail"]["description"]
+        return self._description
+
+    @property
+    def cost(self):
+        if self._cost is _UNSET:
+            self._cost = 0 if "costDetail" not in self._raw else float(self._raw["costDetail"]["costBasisDetail"]["costBasis"])
+        return self._cost
+
+    @property
+    def market_value(self):
+        if self._market_value is _UNSET:
+            self._market_value = 0 if "priceDetail" not in self._raw else float(self._raw["priceDetail"]["marketValue"])
+        return self._market_value
+
+
+class Account(_Record):
+    __slots__ = ("account_id", "positions", "market_value", "available_cash", "account_value", "cost_basis")
+    _FIELDS = __slots__
+
+    def __init__(self, account_id, positions, market_value, available_cash, account_value, cost_basis):
+        self.account_id = account_id
+        self.positions = positions
+        self.market_value = market_value
+        self.available_cash = available_cash
+        self.account_value = account_value
+        self.cost_basis = cost_basis
+
+    def _as_dict(self):
+        account = super()._as_dict()
+        account["positions"] = [position._as_dict() for position in self.positions]
+        return account
+
+    def position(self, symbol):
+        """
+            Returns the Position of symbol, or None if the account does not hold it.
+        """
+        for position in self.positions:
+            if position.symbol == symbol:
+                return position
+        return None
+
+
+class OrderStatus:
+    __slots__ = ("order_id", "leg", "item", "version", "previous_status", "symbol", "status", "_qty", "_price", "_fill_price")
+    # the fields of a listView entry that are read
+    ITEM_FIELDS = ("OrderId", "DisplaySymbol", "OrderStatus", "OrderAction", "Quantity", "Price", "FillPrice", "TimeStamp")
+
+    def __init__(self, order_id, leg, item, version, previous_status=None):
+        """
+            One entry of a listView OrderList. OCO/bracket orders have an entry per leg.
+
+            Only the symbol and status are decoded up front; the other fields are decoded from
+            the raw entry on first use, since most stored orders are never read again after
+            their status is diffed.
+
+            order_id (int) - The OrderId.
+            leg (int) - The index of the entry in its OrderList.
+            item (dict) - The raw entry, as returned by orders_v2 / todays_orders_v2 (only
+                        ITEM_FIELDS if the orders were requested with compact=True).
+            version (int) - The store version at which the entry was last changed.
+            previous_status (str) - The OrderStatus before that change (None for a new order).
+        """
+        self.order_id = order_id
+        self.leg = leg
+        self.item = item
+        self.version = version
+        self.previous_status = previous_status
+        self.symbol = item.get("DisplaySymbol")
+        self.status = item.get("OrderStatus")
+        self._qty = _UNSET
+        self._price = _UNSET
+        self._fill_price = _UNSET
+
+    @property
+    def key(self):
+        return (self.order_id, self.leg)
+
+    @property
+    def action(self):
+        return self.item.get("OrderAction", "")
+
+    @property
+    def qty(self):
+        if self._qty is _UNSET:
+            self._qty = float(self.item.get("Quantity") or 0)
+        return self._qty
+
+    @property
+    def price(self):
+        if self._price is _UNSET:
+            self._price = parse_dollars(self.item.get("Price"))
+        return self._price
+
+    @property
+    def is_market(self):
+        return "Limit" not in str(self.item.get("Price", ""))
+
+    @property
+    def fill_price(self):
+        if self._fill_price is _UNSET:
+            self._fill_price = parse_dollars(self.item.get("FillPrice"))
+        return self._fill_price
+
+    @property
+    def timestamp(self):
+        return self.item.get("TimeStamp")
+
+    def __getitem__(self, key):
+        # the raw listView fields, so records can be used where entries were
+        return self.item[key]
+
+    def __repr__(self):
+        return f"OrderStatus(order_id={self.order_id}, leg={self.leg}, symbol={self.symbol!r}, action={self.action!r}, status={self.status!r}, version={self.version})"
+
+
+class Fill:
+    __slots__ = ("order_id", "symbol", "action", "qty", "price", "received_at", "leg", "order")
+
+    def __init__(self, order_id, symbol, action, qty, price, received_at, leg=0, order=None):
+        """
+            An order that was seen changing to Filled.
+
+            order_id (int) - The OrderId from todays_orders_v2.
+            action (str) - The OrderAction, e.g. 'Buy' or 'Sell'.
+            qty (float) - The filled quantity.
+            price (float) - The fill price, or None if the gateway did not report one.
+            received_at (float) - When the poll that saw the fill returned.
+            leg (int) - The index of the order in its OrderList (non-zero for OCO/bracket legs).
+            order (OrderStatus) - The order as stored in the tracker's OrderStore.
+        """
+        self.order_id = order_id
+        self.symbol = symbol
+        self.action = action
+        self.qty = qty
+        self.price = price
+        self.received_at = received_at
+        self.leg = leg
+        self.order = order
+
+    @property
+    def signed_qty(self):
+        # positive for buys, negative for sells (including sell short)
+        return -self.qty if "Sell" in self.action else self.qty
+
+    def __repr__(self):
+        return f"Fill(order_id={self.order_id}, symbol={self.symbol!r}, action={self.action!r}, qty={self.qty}, price={self.price})"
+
+
+class Transaction:
+    __slots__ = ("date", "action", "symbol", "quantity", "price", "amount", "entry", "_fees")
+    # the fields of a BrokerageTransactions entry
+    ENTRY_FIELDS = ("Date", "Action", "Symbol", "Description", "Quantity", "Price", "Fees & Comm", "Amount")
+
+    def __init__(self, date, action, symbol, quantity, price, amount, entry=None):
+        """
+            One entry of the transaction history export. The fields used for P&L are decoded
+            up front; description, fees and the as-of date are decoded from entry on first use.
+
+            date (datetime.date) - The date the transaction posted.
+            quantity (float) - The quantity, or None for transactions without one (e.g. interest).
+            price (float) - The price per share, or None.
+            amount (float) - The signed cash amount (negative for buys and fees), or None.
+            entry (dict) - The raw export entry.
+        """
+        self.date = date
+        self.action = action
+        self.symbol = symbol
+        self.quantity = quantity
+        self.price = price
+        self.amount = amount
+        self.entry = entry
+        self._fees = _UNSET
+
+    @classmethod
+    def from_entry(cls, entry):
+        quantity = entry.get("Quantity")
+        return cls(
+            parse_date(entry.get("Date")),
+            entry.get("Action", ""),
+            entry.get("Symbol", ""),
+            float(quantity.replace(",", "")) if quantity else None,
+            parse_amount(entry.get("Price")),
+            parse_amount(entry.get("Amount")),
+            entry
+        )
+
+    @property
+    def description(self):
+        return self.entry.get("Description", "")
+
+    @property
+    def fees(self):
+        if self._fees is _UNSET:
+            self._fees = parse_amount(self.entry.get("Fees & Comm"))
+        return self._fees
+
+    @property
+    def as_of_date(self):
+        """
+            The "as of" date of a transaction that posted later than it happened, else date.
+        """
+        date = self.entry.get("Date", "")
+        return parse_date(date[-10:]) if " as of " in date else self.date
+
+    def __getitem__(self, key):
+        # the raw export fields, so records can be used where entries were
+        return self.entry[key]
+
+    def __repr__(self):
+        return f"Transaction(date={self.date}, action={self.action!r}, symbol={self.symbol!r}, quantity={self.quantity}, price={self.price}, amount={self.amount})"
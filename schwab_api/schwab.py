@@ -4,26 +4,138 @@ import urllib.parse
 import requests
 
 from . import urls
-from .account_information import Position, Account
+from .records import Position, Account, Quote, Transaction
+from .account_context import AccountContext, HeaderSet
 from .authentication import SessionManager
+from .batch import BatchRunner, DEFAULT_MAX_CONCURRENCY
+from .codec import Codec, QUOTES_SCHEMA, ORDERS_SCHEMA
+from .metrics import GatewayMetrics
+from .order_templates import (
+    OrderTemplate,
+    OrderSubmission,
+    normalize_limit_price,
+    limit_order_payload,
+    replace_limit_order_payload,
+    order_payload,
+    oco_order_payload,
+    cancel_order_payload,
+    cancel_limit_order_payload
+)
+from .quote_service import quotes_by_symbol
+from .transactions import transaction_export_request, iter_json_array, TRANSACTIONS_KEY, DEFAULT_CHUNK_SIZE
+from .token_cache import TokenCache, TokenRefresher, TOKEN_SCOPES, TOKEN_LIFETIME, DEFAULT_SAFETY_MARGIN, DEFAULT_REFRESH_LEAD
+from .transport import (
+    GatewayTransport,
+    DEFAULT_POOL_CONNECTIONS,
+    DEFAULT_POOL_MAXSIZE,
+    DEFAULT_KEEP_ALIVE_IDLE,
+    DEFAULT_KEEP_ALIVE_INTERVAL
+)
 import time
+import warnings
 
 REQUEST_TIMEOUT = 5 # seconds
 
+
+def _with_token(headers, entry):
+    if isinstance(headers, HeaderSet):
+        return headers.with_token(entry)
+    headers = dict(headers)
+    headers['authorization'] = f"Bearer {entry.token}"
+    return headers
+
+
+def _checked(response):
+    # the v2 listing methods return ([error text], False) when the request failed
+    if isinstance(response, tuple) and response[-1] is False:
+        raise ValueError(response[0][0])
+    return response
+
+
 class Schwab(SessionManager):
     def __init__(self, **kwargs):
         """
             The Schwab class. Used to interact with schwab.
 
+            Connection pool settings (all optional keyword arguments):
+            pool_connections (int) - The number of per-host connection pools to keep.
+            pool_maxsize (int) - The maximum number of connections kept open per host. Should be at
+                        least the number of threads using this instance at the same time.
+            pool_block (bool) - Wait for a free pooled connection instead of opening an extra one.
+            keep_alive (bool) - Enables TCP keep-alive probes on pooled connections.
+            keep_alive_idle (int) - Seconds a connection is idle before keep-alive probes start.
+            keep_alive_interval (int) - Seconds between keep-alive probes.
+
+            Bearer token settings (all optional keyword arguments):
+            token_lifetime (number) - Seconds a bearer token is valid for after it is issued.
+            token_safety_margin (number) - Seconds before expiry at which a cached token is
+                        refreshed instead of reused.
+
+            launch_browser (bool) - Allows login to start the playwright browser. The browser is
+                        only started (and playwright only imported) by the first login() or
+                        sms_login(), not by the constructor. Defaults to True; with False, login
+                        raises instead.
+
+            session_vault (SessionVault or str) - Restores the session saved by the last login
+                        (a SessionVault, or the path of one keyed by SCHWAB_SESSION_VAULT_KEY).
+                        If the restored session passes check_auth, no browser is launched and
+                        login() returns True right away; otherwise login works as usual and saves
+                        the new session to the vault.
+
+            place_orders_directly (bool) - Default for the place_directly argument of the trade_v2
+                        order methods. When True, orders for symbols whose schwabSecurityId is
+                        already known skip the verification request.
+
+            max_concurrency (int) - The most requests the batch methods (cancel_orders_v2, ...)
+                        keep in flight at once. Should not be more than pool_maxsize.
+
+            metrics (GatewayMetrics) - Records per-endpoint latency histograms and counters for
+                        every gateway call and token fetch; read them with self.metrics.snapshot().
+                        Defaults to a new GatewayMetrics. Pass None to disable, or share one
+                        instance between several clients.
+
+            codec (Codec) - Parses the gateway's JSON responses. Defaults to a Codec using the
+                        fastest JSON backend installed (orjson, msgspec, or the json module).
         """
         self.headless = kwargs.get("headless", True)
         self.browserType = kwargs.get("browserType", "firefox")
-        self.headers = {}
+        # Without a browser there is no login; cookies and headers have to be provided another
+        # way (e.g. when running against a GatewaySimulator).
+        self.launchBrowser = kwargs.get("launch_browser", True)
+        self.session_vault = kwargs.get("session_vault")
         self.lastTimeTokenUpdated = None
-        self.apiToken = None
-        self.updateToken = None
+        # Bearer tokens are cached per scope and reused until shortly before they expire.
+        self.token_cache = TokenCache(
+            self._fetch_token,
+            lifetime=kwargs.get("token_lifetime", TOKEN_LIFETIME),
+            safety_margin=kwargs.get("token_safety_margin", DEFAULT_SAFETY_MARGIN)
+        )
+        self.token_refresher = None
+        # schwabSecurityId (ItemIssueId) per symbol, learned from order verification responses.
+        self.security_ids = {}
+        self.place_orders_directly = kwargs.get("place_orders_directly", False)
+        # Pre-serialized payloads for the trade_v2 order methods, keyed by everything but the price.
+        self.order_templates = {}
+        self.metrics = kwargs.get("metrics", GatewayMetrics())
+        self.codec = kwargs.get("codec", Codec())
+        # Thread pool for the batch methods (cancel_orders_v2, ...).
+        self.batch_runner = BatchRunner(kwargs.get("max_concurrency", DEFAULT_MAX_CONCURRENCY))
+        # AccountContext per account id (see account()), None for requests not tied to an account.
+        self._account_contexts = {}
         super(Schwab, self).__init__()
 
+        # One pooled keep-alive transport shared by every gateway call. The cookie session used
+        # for update_token is routed through the same pools.
+        self.transport = GatewayTransport(
+            pool_connections=kwargs.get("pool_connections", DEFAULT_POOL_CONNECTIONS),
+            pool_maxsize=kwargs.get("pool_maxsize", DEFAULT_POOL_MAXSIZE),
+            pool_block=kwargs.get("pool_block", False),
+            keep_alive=kwargs.get("keep_alive", True),
+            keep_alive_idle=kwargs.get("keep_alive_idle", DEFAULT_KEEP_ALIVE_IDLE),
+            keep_alive_interval=kwargs.get("keep_alive_interval", DEFAULT_KEEP_ALIVE_INTERVAL)
+        )
+        self.transport.mount(self.session)
+
     def get_account_info(self):
         """
             Returns a dictionary of Account objects where the key is the account number
@@ -45,7 +157,7 @@ class Schwab(SessionManager):
                     cookie.value += 'AllAccts'
                     self.session.cookies.set_cookie(cookie)
         r = self.session.get(urls.positions_data())
-        response = json.loads(r.text)
+        response = self.codec.loads(r.content)
         for account in response['Accounts']:
             positions = list()
             for security_group in account["SecurityGroupings"]:
@@ -57,7 +169,7 @@ class Schwab(SessionManager):
                             float(position["Quantity"]),
                             float(position["Cost"]),
                             float(position["MarketValue"])
-                        )._as_dict()
+                        )
                     )
 
                     if not "ChildOptionPositions" in position:
@@ -72,7 +184,7 @@ class Schwab(SessionManager):
                                 float(child_position["Quantity"]),
                                 float(child_position["Cost"]),
                                 float(child_position["MarketValue"])
-                            )._as_dict()
+                            )
                         )
             account_info[int(account["AccountId"])] = Account(
                 account["AccountId"],
@@ -81,7 +193,7 @@ class Schwab(SessionManager):
                 account["Totals"]["CashInvestments"],
                 account["Totals"]["AccountValue"],
                 account["Totals"]["Cost"],
-            )._as_dict()
+            )
 
         return account_info
 
@@ -93,35 +205,30 @@ class Schwab(SessionManager):
             Returns a dictionary of transaction history entries for the provided account ID.
         """
 
-        data = {
-            "timeFrame": "All",
-            "selectedTransactionTypes": [
-                "Adjustments",
-                "AtmActivity",
-                "BillPay",
-                "CorporateActions",
-                "Checks",
-                "Deposits",
-                "DividendsAndCapitalGains",
-                "ElectronicTransfers",
-                "Fees",
-                "Interest",
-                "Misc",
-                "SecurityTransfers",
-                "Taxes",
-                "Trades",
-                "VisaDebitCard",
-                "Withdrawals"
-            ],
-            "exportType": "Json",
-            "selectedAccountId": str(account_id),
-            "sortColumn": "Date",
-            "sortDirection": "Descending"
-        }
-        r = requests.post(urls.transaction_history_v2(), json=data, headers=self.headers)
+        data = transaction_export_request(account_id)
+        r = self._gateway_request("POST", urls.transaction_history_v2(), self.account(None).headers(), token_type='api', endpoint="transactions", json=data)
         if r.status_code != 200:
             return [r.text], False
-        return json.loads(r.text)
+        return self.codec.loads(r.content)
+
+    def iter_transaction_history_v2(self, account_id, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+            Streams the transaction history export of account_id and yields a Transaction for
+            each entry, newest first, while the export is still downloading. Only the entry being
+            parsed is held in memory, and closing the generator early (e.g. once the
+            transactions are older than needed) closes the connection instead of reading the rest.
+
+            Raises ValueError if the export request fails.
+        """
+        data = transaction_export_request(account_id)
+        r = self._gateway_request("POST", urls.transaction_history_v2(), self.account(None).headers(), token_type='api', endpoint="transactions", json=data, stream=True)
+        try:
+            if r.status_code != 200:
+                raise ValueError("error getting transaction history: " + r.text)
+            for entry in iter_json_array(r.iter_content(chunk_size), TRANSACTIONS_KEY):
+                yield Transaction.from_entry(self.codec.loads(entry))
+        finally:
+            r.close()
 
     def trade(self, ticker, side, qty, account_id, dry_run=True):
         """
@@ -160,7 +267,7 @@ class Schwab(SessionManager):
         if r.status_code != 200:
             return [r.text], False
 
-        response = json.loads(r.text)
+        response = self.codec.loads(r.content)
 
         messages = list()
         for message in response["Messages"]:
@@ -194,7 +301,7 @@ class Schwab(SessionManager):
             messages.append(r.text)
             return messages, False
 
-        response = json.loads(r.text)
+        response = self.codec.loads(r.content)
         if response["ReturnCode"] == 0:
             return messages, True
 
@@ -214,7 +321,8 @@ class Schwab(SessionManager):
         primary_security_type=46,
         valid_return_codes = {0,10},
         affirm_order=False,
-        costBasis='FIFO'
+        costBasis='FIFO',
+        place_directly=None
         ):
         """
             ticker (Str) - The symbol you want to trade,
@@ -276,6 +384,10 @@ class Schwab(SessionManager):
                         'LIFO': Last In First Out
                         'BTAX': Tax Lot Optimizer
                         ('VSP': Specific Lots -> just for reference. Not implemented: Requires to select lots manually.)
+            place_directly (bool) - Skips the verification request when the symbol's
+                        schwabSecurityId is already cached, falling back to verify-then-place if
+                        the gateway rejects the order. None uses the instance default
+                        (place_orders_directly).
             Note: this function calls the new Schwab API, which is flakier and seems to have stricter authentication requirements.
             For now, only use this function if the regular trade function doesn't work for your use case.
 
@@ -289,105 +401,23 @@ class Schwab(SessionManager):
         else:
             raise Exception("side must be either Buy or Sell")
 
-        # Handling formating of limit_price to avoid error.
-        # Checking how many decimal places are in limit_price. 
-        decimal_places = len(str(float(limit_price)).split('.')[1])
-        limit_price_warning = None
-        # Max 2 decimal places allowed for price >= $1 and 4 decimal places for price < $1.
-        if limit_price >= 1:
-            if decimal_places > 2:
-                limit_price = round(limit_price,2)
-                limit_price_warning = f"For limit_price >= 1, Only 2 decimal places allowed. Rounded price_limit to: {limit_price}"
-        else:
-            if decimal_places > 4:
-                limit_price = round(limit_price,4)
-                limit_price_warning = f"For limit_price < 1, Only 4 decimal places allowed. Rounded price_limit to: {limit_price}"
-
-        self.update_token(token_type='update')
-
-        data = {
-            "UserContext": {
-                "AccountId":str(account_id),
-                "AccountColor":0
-            },
-            "OrderStrategy": {
-                # Unclear what the security types map to.
-                "PrimarySecurityType":primary_security_type,
-                "CostBasisRequest": {
-                    "costBasisMethod":costBasis,
-                    "defaultCostBasisMethod":costBasis
-                },
-                "OrderType":str(order_type),
-                "LimitPrice":str(limit_price),
-                "StopPrice":str(stop_price),
-                "Duration":str(duration),
-                "AllNoneIn":False,
-                "DoNotReduceIn":False,
-                "OrderStrategyType":1,
-                "OrderLegs":[
-                    {
-                        "Quantity":str(qty),
-                        "LeavesQuantity":str(qty),
-                        "Instrument":{"Symbol":ticker},
-                        "SecurityType":primary_security_type,
-                        "Instruction":buySellCode
-                    }
-                    ]},
-            # OrderProcessingControl seems to map to verification vs actually placing an order.
-            "OrderProcessingControl":1
-        }
-
-        # Adding this header seems to be necessary.
-        self.headers['schwab-resource-version'] = '1.0'
-
-        r = requests.post(urls.order_verification_v2(), json=data, headers=self.headers)
-        if r.status_code != 200:
-            return [r.text], False
-
-        response = json.loads(r.text)
-
-        orderId = response['orderStrategy']['orderId']
-        firstOrderLeg = response['orderStrategy']['orderLegs'][0]
-        if "schwabSecurityId" in firstOrderLeg:
-            data["OrderStrategy"]["OrderLegs"][0]["Instrument"]["ItemIssueId"] = firstOrderLeg["schwabSecurityId"]
-
-        messages = list()
-        if limit_price_warning is not None:
-            messages.append(limit_price_warning)
-        for message in response["orderStrategy"]["orderMessages"]:
-            messages.append(message["message"])
-
-        # TODO: This needs to be fleshed out and clarified.
-        if response["orderStrategy"]["orderReturnCode"] not in valid_return_codes:
-            return messages, False
-        if dry_run:
-            return messages, True
-
-        # Make the same POST request, but for real this time.
-        data["UserContext"]["CustomerId"] = 0
-        data["OrderStrategy"]["OrderId"] = int(orderId)
-        data["OrderProcessingControl"] = 2
-        if affirm_order:
-            data["OrderStrategy"]["OrderAffrmIn"] = True
-        self.update_token(token_type='update')
-        r = requests.post(urls.order_verification_v2(), json=data, headers=self.headers)
-
-        if r.status_code != 200:
-            return [r.text], False
+        limit_price, limit_price_warning = normalize_limit_price(limit_price)
+        template = self._order_template(
+            ("order", ticker, buySellCode, qty, account_id, order_type, duration, stop_price, primary_security_type, costBasis, affirm_order),
+            lambda: order_payload(ticker, buySellCode, qty, account_id, order_type, duration, stop_price, primary_security_type, costBasis),
+            affirm_order
+        )
 
-        response = json.loads(r.text)
+        messages, success, _ = self._submit_order_v2(
+            template,
+            limit_price,
+            valid_return_codes,
+            dry_run=dry_run,
+            place_directly=place_directly,
+            warnings=[limit_price_warning]
+        )
+        return messages, success
 
-        messages = list()
-        if limit_price_warning is not None:
-            messages.append(limit_price_warning)
-        if "orderMessages" in response["orderStrategy"] and response["orderStrategy"]["orderMessages"] is not None:
-            for message in response["orderStrategy"]["orderMessages"]:
-                messages.append(message["message"])
-
-        if response["orderStrategy"]["orderReturnCode"] in valid_return_codes:
-            return messages, True
-
-        return messages, False
 
     def trade_v2_2(self,
         ticker,
@@ -493,8 +523,6 @@ class Schwab(SessionManager):
                 limit_price = round(limit_price,4)
                 limit_price_warning = f"For limit_price < 1, Only 4 decimal places allowed. Rounded price_limit to: {limit_price}"
 
-        self.update_token(token_type='update')
-
         data = {
             "UserContext": {
                 "AccountId":str(account_id),
@@ -531,13 +559,13 @@ class Schwab(SessionManager):
         print("data: ", json.dumps(data))
 
         # Adding this header seems to be necessary.
-        self.headers['schwab-resource-version'] = '1.0'
+        headers = self.account(None).headers('1.0')
 
-        r = requests.post(urls.order_verification_v2(), json=data, headers=self.headers)
+        r = self._gateway_request("POST", urls.order_verification_v2(), headers, token_type='update', endpoint="verify", json=data)
         if r.status_code != 200:
             return [r.text], False
 
-        response = json.loads(r.text)
+        response = self.codec.loads(r.content)
 
         orderId = response['orderStrategy']['orderId']
         firstOrderLeg = response['orderStrategy']['orderLegs'][0]
@@ -563,13 +591,12 @@ class Schwab(SessionManager):
         data["OrderProcessingControl"] = 2
         if affirm_order:
             data["OrderStrategy"]["OrderAffrmIn"] = True
-        self.update_token(token_type='update')
-        r = requests.post(urls.order_verification_v2(), json=data, headers=self.headers)
+        r = self._gateway_request("POST", urls.order_verification_v2(), headers, token_type='update', endpoint="place", json=data)
 
         if r.status_code != 200:
             return [r.text], False
 
-        response = json.loads(r.text)
+        response = self.codec.loads(r.content)
         print("response: ", response)
 
         messages = list()
@@ -628,8 +655,6 @@ class Schwab(SessionManager):
                 limit_sell_price = round(limit_sell_price,4)
                 limit_price_warning_sell = f"For limit_sell_price < 1, Only 4 decimal places allowed. Rounded price_limit to: {limit_sell_price}"
 
-        self.update_token(token_type='update')
-
         data = {
             "UserContext": {
                 "AccountId":str(account_id),
@@ -720,13 +745,13 @@ class Schwab(SessionManager):
         }
 
         # Adding this header seems to be necessary.
-        self.headers['schwab-resource-version'] = '1.0'
+        headers = self.account(None).headers('1.0')
 
-        r = requests.post(urls.order_verification_v2(), json=data, headers=self.headers)
+        r = self._gateway_request("POST", urls.order_verification_v2(), headers, token_type='update', endpoint="verify", json=data)
         if r.status_code != 200:
             return [r.text], False
 
-        response = json.loads(r.text)
+        response = self.codec.loads(r.content)
 
         orderId = response['orderStrategy']['orderId']
         firstOrderLeg = response['orderStrategy']['orderLegs'][0]
@@ -752,13 +777,12 @@ class Schwab(SessionManager):
         data["OrderProcessingControl"] = 2
         if affirm_order:
             data["OrderStrategy"]["OrderAffrmIn"] = True
-        self.update_token(token_type='update')
-        r = requests.post(urls.order_verification_v2(), json=data, headers=self.headers)
+        r = self._gateway_request("POST", urls.order_verification_v2(), headers, token_type='update', endpoint="place", json=data)
 
         if r.status_code != 200:
             return [r.text], False
 
-        response = json.loads(r.text)
+        response = self.codec.loads(r.content)
 
         messages = list()
         if limit_price_warning_buy is not None:
@@ -787,12 +811,43 @@ class Schwab(SessionManager):
         valid_return_codes = {0,10},
         affirm_order=False,
         costBasis='FIFO',
-        usingTokenAutoUpdate = False
+        usingTokenAutoUpdate = False,
+        place_directly=None,
+        use_replace=False
         ):
         """
             buy at limit_buy_price
+
+            place_directly (bool) - Skips the verification request when the symbol's
+                        schwabSecurityId is already cached, falling back to verify-then-place if
+                        the gateway rejects the order. None uses the instance default
+                        (place_orders_directly).
+
+            old_order_id (int) - An open buy order to cancel before placing this one.
+            old_price (number) - The old order's limit price, needed by the cancel.
+            use_replace (bool) - Replaces old_order_id with this order using
+                        replace_limit_order_v2 (one verify/confirm replace) instead of cancelling
+                        it and placing a new order. old_price is not needed then.
+
+            usingTokenAutoUpdate (bool) - Deprecated and ignored. Bearer tokens are cached per scope
+                        and refreshed automatically before they expire.
         """
 
+        if old_order_id != None and use_replace:
+            return self.replace_limit_order_v2(
+                account_id,
+                old_order_id,
+                True,
+                limit_price,
+                ticker=ticker,
+                qty=qty,
+                duration=duration,
+                primary_security_type=primary_security_type,
+                valid_return_codes=valid_return_codes,
+                affirm_order=affirm_order,
+                costBasis=costBasis
+            )
+
         if old_order_id != None and old_price != None:
             messages, success = self.cancel_limit_order_v2(
                 account_id=account_id,
@@ -807,121 +862,22 @@ class Schwab(SessionManager):
                 print("cancel order in trade_v2_limit_buy_order unsuccessful. leaving function. messages: ", messages)
                 return ["same message as above..", ], False, None
         
-        # Handling formating of limit_price to avoid error.
-        # Checking how many decimal places are in limit prices. 
-        decimal_places = len(str(float(limit_price)).split('.')[1])
-        limit_price_warning_buy = None
-        # Max 2 decimal places allowed for price >= $1 and 4 decimal places for price < $1.
-        if limit_price >= 1:
-            if decimal_places > 2:
-                limit_price = round(limit_price,2)
-                limit_price_warning_buy = f"For limit_buy_price >= 1, Only 2 decimal places allowed. Rounded price_limit to: {limit_price}"
-        else:
-            if decimal_places > 4:
-                limit_price = round(limit_price,4)
-                limit_price_warning_buy = f"For limit_buy_price < 1, Only 4 decimal places allowed. Rounded price_limit to: {limit_price}"
-        if not usingTokenAutoUpdate:
-            self.update_token(token_type='update')
-        else:
-            self.setHeaderToken(self.updateToken)
-
-        data = {
-            "UserContext": {
-                "AccountId":str(account_id),
-                "AccountColor":0
-            },
-            "OrderStrategy": {
-                # Unclear what the security types map to.
-                "PrimarySecurityType":primary_security_type,
-                "CostBasisRequest": {
-                    "costBasisMethod":costBasis,
-                    "defaultCostBasisMethod":costBasis
-                },
-                "OrderType":"50", # Limit
-                "LimitPrice":str(limit_price),
-                "StopPrice":"0",
-                "Duration":str(duration),
-                "AllNoneIn":False,
-                "DoNotReduceIn":False,
-                # "OrderId":old_order_id,
-                # "OrderSystem":"1" if old_order_id else None,
-                "OrderStrategyType":1,
-                "MinimumQuantity":0,
-                "OrderLegs":[
-                    {
-                        "Quantity":str(qty),
-                        "LeavesQuantity":str(qty),
-                        "Instrument":{"Symbol":ticker},
-                        "SecurityType":primary_security_type,
-                        "Instruction":49 # Buy
-                    }
-                ]
-            },
-            # OrderProcessingControl seems to map to verification vs actually placing an order.
-            "OrderProcessingControl":1
-        }
-
-        # Adding this header seems to be necessary.
-        
-        headers = dict(self.headers)
-        headers['schwab-resource-version'] = '1.0'
-        r = requests.post(urls.order_verification_v2(), json=data, headers=headers, timeout=REQUEST_TIMEOUT)
-        if r.status_code != 200:
-            print("bad status code. response: ", r.headers, ", ", r.content,  ", r status code: ", r.status_code)
-            return [r.text], False, None
-
-        response = json.loads(r.text)
-
-        orderId = response['orderStrategy']['orderId']
-        firstOrderLeg = response['orderStrategy']['orderLegs'][0]
-        if "schwabSecurityId" in firstOrderLeg:
-            data["OrderStrategy"]["OrderLegs"][0]["Instrument"]["ItemIssueId"] = firstOrderLeg["schwabSecurityId"]
-
-        
-        messages = list()
-        if limit_price_warning_buy is not None:
-            messages.append(limit_price_warning_buy)
-        for message in response["orderStrategy"]["orderMessages"]:
-            messages.append(message["message"])
-
-        # TODO: This needs to be fleshed out and clarified.
-        if response["orderStrategy"]["orderReturnCode"] not in valid_return_codes:
-            print("invalid return code: ", response["orderStrategy"]["orderReturnCode"])
-            return messages, False, None
-
-        # Make the same POST request, but for real this time.
-        data["UserContext"]["CustomerId"] = 0
-        data["OrderStrategy"]["OrderId"] = int(orderId)
-        data["OrderProcessingControl"] = 2
-        if affirm_order:
-            data["OrderStrategy"]["OrderAffrmIn"] = True
-        if not usingTokenAutoUpdate:
-            self.update_token(token_type='update')
-        # if old_order_id != None:
-        #     data["OrderStrategy"]["CancelOrderId"] = old_order_id
-        #     data["OrderStrategy"]["OrderId"] = old_order_id
-        headers = dict(self.headers)
-        headers['schwab-resource-version'] = '1.0'
-        r = requests.post(urls.order_verification_v2(), json=data, headers=headers, timeout=REQUEST_TIMEOUT)
-
-        if r.status_code != 200:
-            print("limit buy status code wrong. r.text: ", r.text)
-            return [r.text], False, None
+        limit_price, limit_price_warning = normalize_limit_price(limit_price, "limit_buy_price")
+        template = self._order_template(
+            ("limit", ticker, 49, qty, account_id, duration, primary_security_type, costBasis, affirm_order),
+            lambda: limit_order_payload(ticker, 49, qty, account_id, duration, primary_security_type, costBasis),
+            affirm_order
+        )
+
+        return self._submit_order_v2(
+            template,
+            limit_price,
+            valid_return_codes,
+            place_directly=place_directly,
+            warnings=[limit_price_warning],
+            timeout=REQUEST_TIMEOUT
+        )
 
-        response = json.loads(r.text)
-
-        messages = list()
-        if limit_price_warning_buy is not None:
-            messages.append(limit_price_warning_buy)
-        if "orderMessages" in response["orderStrategy"] and response["orderStrategy"]["orderMessages"] is not None:
-            for message in response["orderStrategy"]["orderMessages"]:
-                messages.append(message["message"])
-
-        if response["orderStrategy"]["orderReturnCode"] in valid_return_codes:
-            return messages, True, response['orderStrategy']['orderId']
-
-        print("returning with no valid return codes at end: ", response["orderStrategy"]["orderReturnCode"])
-        return messages, False, None
     
     def trade_v2_limit_sell_order(
         self,
@@ -936,12 +892,43 @@ class Schwab(SessionManager):
         valid_return_codes = {0,10},
         affirm_order=False,
         costBasis='FIFO',
-        usingTokenAutoUpdate = False
+        usingTokenAutoUpdate = False,
+        place_directly=None,
+        use_replace=False
         ):
         """
             sell at limit_price
+
+            place_directly (bool) - Skips the verification request when the symbol's
+                        schwabSecurityId is already cached, falling back to verify-then-place if
+                        the gateway rejects the order. None uses the instance default
+                        (place_orders_directly).
+
+            old_order_id (int) - An open sell order to cancel before placing this one.
+            old_price (number) - The old order's limit price, needed by the cancel.
+            use_replace (bool) - Replaces old_order_id with this order using
+                        replace_limit_order_v2 (one verify/confirm replace) instead of cancelling
+                        it and placing a new order. old_price is not needed then.
+
+            usingTokenAutoUpdate (bool) - Deprecated and ignored. Bearer tokens are cached per scope
+                        and refreshed automatically before they expire.
         """
 
+        if old_order_id != None and use_replace:
+            return self.replace_limit_order_v2(
+                account_id,
+                old_order_id,
+                False,
+                limit_price,
+                ticker=ticker,
+                qty=qty,
+                duration=duration,
+                primary_security_type=primary_security_type,
+                valid_return_codes=valid_return_codes,
+                affirm_order=affirm_order,
+                costBasis=costBasis
+            )
+
         if old_order_id != None:
             messages, success = self.cancel_limit_order_v2(
                 account_id=account_id,
@@ -957,275 +944,92 @@ class Schwab(SessionManager):
                 print("cancel order in trade_v2_limit_sell_order unsuccessful. leaving function. messages: ", messages)
                 return ["same message as above..", ], False, None
         
-        # Handling formating of limit_price to avoid error.
-        # Checking how many decimal places are in limit prices. 
-        decimal_places = len(str(float(limit_price)).split('.')[1])
-        limit_price_warning = None
-        # Max 2 decimal places allowed for price >= $1 and 4 decimal places for price < $1.
-        if limit_price >= 1:
-            if decimal_places > 2:
-                limit_price = round(limit_price,2)
-                limit_price_warning = f"For limit_price >= 1, Only 2 decimal places allowed. Rounded price_limit to: {limit_price}"
-        else:
-            if decimal_places > 4:
-                limit_price = round(limit_price,4)
-                limit_price_warning = f"For limit_price < 1, Only 4 decimal places allowed. Rounded price_limit to: {limit_price}"
+        limit_price, limit_price_warning = normalize_limit_price(limit_price, "limit_price")
+        template = self._order_template(
+            ("limit", ticker, 50, qty, account_id, duration, primary_security_type, costBasis, affirm_order),
+            lambda: limit_order_payload(ticker, 50, qty, account_id, duration, primary_security_type, costBasis),
+            affirm_order
+        )
+
+        return self._submit_order_v2(
+            template,
+            limit_price,
+            valid_return_codes,
+            place_directly=place_directly,
+            warnings=[limit_price_warning],
+            timeout=REQUEST_TIMEOUT
+        )
+
+    def submit_orders(self, orders, max_concurrency=None):
+        """
+        Places several limit orders at once, e.g. a ladder of bids and asks, or both sides across
+        many tickers. Each order is verified and placed like trade_v2_limit_buy_order /
+        trade_v2_limit_sell_order, but the orders run concurrently, up to max_concurrency in
+        flight at a time.
+
+        orders (list of dict) - One dict per order with ticker, side ('Buy' or 'Sell'), qty,
+            account_id and limit_price. Any other keys (duration, affirm_order, place_directly,
+            old_order_id, ...) are passed on to the trade_v2_limit method.
+        max_concurrency (int) - The most orders in flight at once. Defaults to the instance's
+            max_concurrency.
+
+        Returns a list of (messages, is_success, order_id), in the order of orders. An order that
+        fails, or whose spec is invalid, only fails its own entry: ([error text], False, None).
+        """
+        calls = []
+        for order in orders:
+            calls.append(lambda order=order: self._submit_order_spec(order))
+        return self.batch_runner.run(calls, lambda e: ([str(e)], False, None), max_concurrency)
+
+    def _submit_order_spec(self, order):
+        kwargs = dict(order)
+        side = kwargs.pop("side")
+        if side == "Buy":
+            return self.trade_v2_limit_buy_order(**kwargs)
+        if side == "Sell":
+            return self.trade_v2_limit_sell_order(**kwargs)
+        raise ValueError(f"side must be 'Buy' or 'Sell', not {side!r}")
 
-        if not usingTokenAutoUpdate:
-            self.update_token(token_type='update')
-        else:
-            self.setHeaderToken(self.updateToken)
+    
+    def trade_v2_buy_OCO_ONLY(
+        self,
+        ticker,
+        qty,
+        account_id,
+        limit_price,
+        trailing_stop_dollars=0.07,
+        duration=48,
+        primary_security_type=46,
+        valid_return_codes = {0,10, 20},
+        affirm_order=False,
+        costBasis='FIFO',
+        place_directly=None
+        ):
+        """
+            trigger OCO with buy limit and trailing stop
 
-        data = {
-            "UserContext": {
-                "AccountId":str(account_id),
-                "AccountColor":0
-            },
-            "OrderStrategy": {
-                # Unclear what the security types map to.
-                "PrimarySecurityType":primary_security_type,
-                "CostBasisRequest": {
-                    "costBasisMethod":costBasis,
-                    "defaultCostBasisMethod":costBasis
-                },
-                "OrderType":"50", # Limit
-                "LimitPrice":str(limit_price),
-                "StopPrice":"0",
-                "Duration":str(duration),
-                "AllNoneIn":False,
-                "DoNotReduceIn":False,
-                "OrderStrategyType":1,
-                "MinimumQuantity":0,
-                "OrderLegs":[
-                    {
-                        "Quantity":str(qty),
-                        "LeavesQuantity":str(qty),
-                        "Instrument":{"Symbol":ticker},
-                        "SecurityType":primary_security_type,
-                        "Instruction":50 # Sell
-                    }
-                ]
-            },
-            # OrderProcessingControl seems to map to verification vs actually placing an order.
-            "OrderProcessingControl":1
-        }
-
-        # Adding this header seems to be necessary.
-        
-        headers = dict(self.headers)
-        headers['schwab-resource-version'] = '1.0'
-        r = requests.post(urls.order_verification_v2(), json=data, headers=headers, timeout=REQUEST_TIMEOUT)
-        if r.status_code != 200:
-            print("bad status code. response: ", r.headers, ", ", r.content,  ", r status code: ", r.status_code)
-            return [r.text], False, None
-
-        response = json.loads(r.text)
-
-        orderId = response['orderStrategy']['orderId']
-        firstOrderLeg = response['orderStrategy']['orderLegs'][0]
-        if "schwabSecurityId" in firstOrderLeg:
-            data["OrderStrategy"]["OrderLegs"][0]["Instrument"]["ItemIssueId"] = firstOrderLeg["schwabSecurityId"]
-
-        
-        messages = list()
-        if limit_price_warning is not None:
-            messages.append(limit_price_warning)
-        for message in response["orderStrategy"]["orderMessages"]:
-            messages.append(message["message"])
-
-        # TODO: This needs to be fleshed out and clarified.
-        if response["orderStrategy"]["orderReturnCode"] not in valid_return_codes:
-            print("invalid return code: ", response["orderStrategy"]["orderReturnCode"])
-            return messages, False, None
-
-        # Make the same POST request, but for real this time.
-        data["UserContext"]["CustomerId"] = 0
-        data["OrderStrategy"]["OrderId"] = int(orderId)
-        data["OrderProcessingControl"] = 2
-        if affirm_order:
-            data["OrderStrategy"]["OrderAffrmIn"] = True
-        if not usingTokenAutoUpdate:
-            self.update_token(token_type='update')
-        
-        headers = dict(self.headers)
-        headers['schwab-resource-version'] = '1.0'
-        r = requests.post(urls.order_verification_v2(), json=data, headers=headers, timeout=REQUEST_TIMEOUT)
-
-        if r.status_code != 200:
-            print("limit sell status code wrong. r.text: ", r.text)
-            return [r.text], False, None
-
-        response = json.loads(r.text)
-
-        messages = list()
-        if limit_price_warning is not None:
-            messages.append(limit_price_warning)
-        if "orderMessages" in response["orderStrategy"] and response["orderStrategy"]["orderMessages"] is not None:
-            for message in response["orderStrategy"]["orderMessages"]:
-                messages.append(message["message"])
-
-        if response["orderStrategy"]["orderReturnCode"] in valid_return_codes:
-            return messages, True, response['orderStrategy']['orderId']
-
-        return messages, False, None
-    
-    def trade_v2_buy_OCO_ONLY(
-        self,
-        ticker,
-        qty,
-        account_id,
-        limit_price,
-        trailing_stop_dollars=0.07,
-        duration=48,
-        primary_security_type=46,
-        valid_return_codes = {0,10, 20},
-        affirm_order=False,
-        costBasis='FIFO'
-        ):
+            place_directly (bool) - Skips the verification request when the symbol's
+                        schwabSecurityId is already cached, falling back to verify-then-place if
+                        the gateway rejects the order. None uses the instance default
+                        (place_orders_directly).
         """
-            trigger OCO with buy limit and trailing stop
-        """
-        
-        # Handling formating of limit_price to avoid error.
-        # Checking how many decimal places are in limit prices.
-        
-        decimal_places = len(str(float(limit_price)).split('.')[1])
-        limit_price_warning = None
-        # Max 2 decimal places allowed for price >= $1 and 4 decimal places for price < $1.
-        if limit_price >= 1:
-            if decimal_places > 2:
-                limit_price = round(limit_price,2)
-                limit_price_warning = f"For limit_buy_price >= 1, Only 2 decimal places allowed. Rounded price_limit to: {limit_price}"
-        else:
-            if decimal_places > 4:
-                limit_price = round(limit_price,4)
-                limit_price_warning = f"For limit_buy_price < 1, Only 4 decimal places allowed. Rounded price_limit to: {limit_price}"
-
-        self.update_token(token_type='update')
-
-        data = {
-            "UserContext": {
-                "AccountId":str(account_id),
-                "AccountColor":1,
-                "CustomerId": 0
-            },
-            "OrderStrategy": {
-                "OrderStrategyType":4, # OCO bracket
-                "GroupOrderId":0,
-                "ChildOrders":[
-                    {
-                        "AllNoneIn":False,
-                        "DoNotReduceIn":False,
-                        "Duration":str(duration),
-                        "LimitPrice":str(limit_price),
-                        "MinimumQuantity":0,
-                        "OrderId":0,
-                        "OrderLegs":[
-                            {
-                                "Instruction": 49,
-                                "LeavesQuantity": str(qty),
-                                "Quantity": str(qty),
-                                "SecurityType": 46,
-                                "Instrument": {"Symbol": ticker}
-                            }
-                        ],
-                        "OrderStrategyType":1,
-                        "OrderType":"50",
-                        "PrimarySecurityType":46,
-                        "StopPrice":"0"
-                    },
-                    {
-                        "AllNoneIn":False,
-                        "DoNotReduceIn":False,
-                        "Duration":duration,
-                        "LimitPrice":0,
-                        "MinimumQuantity":0,
-                        "OrderId":0,
-                        "OrderLegs":[
-                            {
-                                "Instruction":49,
-                                "Instrument":{"Symbol": ticker},
-                                "LeavesQuantity":str(qty),
-                                "Quantity":str(qty),
-                                "SecurityType":46,
-                            }
-                        ],
-                        "OrderStrategyType":1,
-                        "OrderType":84,
-                        "PrimarySecurityType":46,
-                        "ReinvestDividend": False,
-                        "StopPrice":"0",
-                        "TrailingStop": {       
-                            "stopPriceLinkType":1,
-                            "stopPriceOffset":trailing_stop_dollars
-                        }
-                    }
-                ],
-                "OrderLegs":[
-                    {
-                        "Quantity":str(qty),
-                        "LeavesQuantity":str(qty),
-                        "Instrument":{"Symbol":ticker},
-                        "SecurityType":primary_security_type,
-                        "Instruction":49 # Buy
-                    }
-                ]
-            },
-            # OrderProcessingControl seems to map to verification vs actually placing an order.
-            "OrderProcessingControl":1
-        }
-
-        # Adding this header seems to be necessary.
-        self.headers['schwab-resource-version'] = '1.0'
-
-        r = requests.post(urls.order_verification_v2(), json=data, headers=self.headers)
-        if r.status_code != 200:
-            return [r.text], False
-
-        response = json.loads(r.text)
-
-        orderId = response['orderStrategy']['orderId']
-        firstOrderLeg = response['orderStrategy']['orderLegs'][0]
-        if "schwabSecurityId" in firstOrderLeg:
-            data["OrderStrategy"]["OrderLegs"][0]["Instrument"]["ItemIssueId"] = firstOrderLeg["schwabSecurityId"]
-
         
-        messages = list()
-        if limit_price_warning is not None:
-            messages.append(limit_price_warning)
-        for message in response["orderStrategy"]["orderMessages"]:
-            messages.append(message["message"])
-
-        # TODO: This needs to be fleshed out and clarified.
-        if response["orderStrategy"]["orderReturnCode"] not in valid_return_codes:
-            return messages, False
-
-        # Make the same POST request, but for real this time.
-        data["UserContext"]["CustomerId"] = 0
-        data["OrderStrategy"]["OrderId"] = orderId
-        data["OrderProcessingControl"] = 2
-        if affirm_order:
-            data["OrderStrategy"]["OrderAffrmIn"] = True
-        self.update_token(token_type='update')
-        self.headers['schwab-resource-version'] = '1.0'
-        r = requests.post(urls.order_verification_v2(), json=data, headers=self.headers)
-
-        if r.status_code != 200:
-            return [r.text], False
-
-        response = json.loads(r.text)
-
-        messages = list()
-        if limit_price_warning is not None:
-            messages.append(limit_price_warning)
-        if "orderMessages" in response["orderStrategy"] and response["orderStrategy"]["orderMessages"] is not None:
-            for message in response["orderStrategy"]["orderMessages"]:
-                messages.append(message["message"])
-
-        if response["orderStrategy"]["orderReturnCode"] in valid_return_codes:
-            return messages, True
+        limit_price, limit_price_warning = normalize_limit_price(limit_price, "limit_buy_price")
+        template = self._order_template(
+            ("oco", ticker, 49, qty, account_id, duration, primary_security_type, trailing_stop_dollars, affirm_order),
+            lambda: oco_order_payload(ticker, 49, qty, account_id, duration, primary_security_type, trailing_stop_dollars),
+            affirm_order
+        )
+
+        messages, success, _ = self._submit_order_v2(
+            template,
+            limit_price,
+            valid_return_codes,
+            place_directly=place_directly,
+            warnings=[limit_price_warning]
+        )
+        return messages, success
 
-        return messages, False
     
     def trade_v2_sell_OCO_ONLY(
         self,
@@ -1238,152 +1042,34 @@ class Schwab(SessionManager):
         primary_security_type=46,
         valid_return_codes = {0,10,20},
         affirm_order=False,
-        costBasis='FIFO'
+        costBasis='FIFO',
+        place_directly=None
         ):
         """
             trigger OCO with sell limit and trailing stop
-        """
-        
-        # Handling formating of limit_price to avoid error.
-        # Checking how many decimal places are in limit prices.
-        
-        decimal_places = len(str(float(limit_price)).split('.')[1])
-        limit_price_warning = None
-        # Max 2 decimal places allowed for price >= $1 and 4 decimal places for price < $1.
-        if limit_price >= 1:
-            if decimal_places > 2:
-                limit_price = round(limit_price,2)
-                limit_price_warning = f"For limit_price >= 1, Only 2 decimal places allowed. Rounded price_limit to: {limit_price}"
-        else:
-            if decimal_places > 4:
-                limit_price = round(limit_price,4)
-                limit_price_warning = f"For limit_price < 1, Only 4 decimal places allowed. Rounded price_limit to: {limit_price}"
-
-        self.update_token(token_type='update')
-
-        data = {
-            "UserContext": {
-                "AccountId":str(account_id),
-                "AccountColor":1,
-                "CustomerId": 0
-            },
-            "OrderStrategy": {
-                "OrderStrategyType":4, # OCO bracket
-                "GroupOrderId":0,
-                "ChildOrders":[
-                    {
-                        "AllNoneIn":False,
-                        "DoNotReduceIn":False,
-                        "Duration":str(duration),
-                        "LimitPrice":str(limit_price),
-                        "MinimumQuantity":0,
-                        "OrderId":0,
-                        "OrderLegs":[
-                            {
-                                "Instruction": 50, # sell (short sell = 53)
-                                "LeavesQuantity": str(qty),
-                                "Quantity": str(qty),
-                                "SecurityType": 46,
-                                "Instrument": {"Symbol": ticker}
-                            }
-                        ],
-                        "OrderStrategyType":1,
-                        "OrderType":"50",
-                        "PrimarySecurityType":46,
-                        "StopPrice":"0"
-                    },
-                    {
-                        "AllNoneIn":False,
-                        "DoNotReduceIn":False,
-                        "Duration":duration,
-                        "LimitPrice":0,
-                        "MinimumQuantity":0,
-                        "OrderId":0,
-                        "OrderLegs":[
-                            {
-                                "Instruction":50, # sell (short sell = 53)
-                                "Instrument":{"Symbol": ticker},
-                                "LeavesQuantity":str(qty),
-                                "Quantity":str(qty),
-                                "SecurityType":46,
-                            }
-                        ],
-                        "OrderStrategyType":1,
-                        "OrderType":84,
-                        "PrimarySecurityType":46,
-                        "ReinvestDividend": False,
-                        "StopPrice":"0",
-                        "TrailingStop": {       
-                            "stopPriceLinkType":1,
-                            "stopPriceOffset":trailing_stop_dollars
-                        }
-                    }
-                ],
-                "OrderLegs":[
-                    {
-                        "Quantity":str(qty),
-                        "LeavesQuantity":str(qty),
-                        "Instrument":{"Symbol":ticker},
-                        "SecurityType":primary_security_type,
-                        "Instruction":50 # sell (short sell = 53)
-                    }
-                ]
-            },
-            # OrderProcessingControl seems to map to verification vs actually placing an order.
-            "OrderProcessingControl":1
-        }
-
-        # Adding this header seems to be necessary.
-        self.headers['schwab-resource-version'] = '1.0'
-
-        r = requests.post(urls.order_verification_v2(), json=data, headers=self.headers)
-        if r.status_code != 200:
-            return [r.text], False
-
-        response = json.loads(r.text)
-
-        orderId = response['orderStrategy']['orderId']
-        firstOrderLeg = response['orderStrategy']['orderLegs'][0]
-        if "schwabSecurityId" in firstOrderLeg:
-            data["OrderStrategy"]["OrderLegs"][0]["Instrument"]["ItemIssueId"] = firstOrderLeg["schwabSecurityId"]
 
+            place_directly (bool) - Skips the verification request when the symbol's
+                        schwabSecurityId is already cached, falling back to verify-then-place if
+                        the gateway rejects the order. None uses the instance default
+                        (place_orders_directly).
+        """
         
-        messages = list()
-        if limit_price_warning is not None:
-            messages.append(limit_price_warning)
-        for message in response["orderStrategy"]["orderMessages"]:
-            messages.append(message["message"])
-
-        # TODO: This needs to be fleshed out and clarified.
-        if response["orderStrategy"]["orderReturnCode"] not in valid_return_codes:
-            return messages, False
-
-        # Make the same POST request, but for real this time.
-        data["UserContext"]["CustomerId"] = 0
-        data["OrderStrategy"]["OrderId"] = orderId
-        data["OrderProcessingControl"] = 2
-        if affirm_order:
-            data["OrderStrategy"]["OrderAffrmIn"] = True
-        self.update_token(token_type='update')
-        self.headers['schwab-resource-version'] = '1.0'
-        r = requests.post(urls.order_verification_v2(), json=data, headers=self.headers)
-
-        if r.status_code != 200:
-            return [r.text], False
+        limit_price, limit_price_warning = normalize_limit_price(limit_price, "limit_price")
+        template = self._order_template(
+            ("oco", ticker, 50, qty, account_id, duration, primary_security_type, trailing_stop_dollars, affirm_order),
+            lambda: oco_order_payload(ticker, 50, qty, account_id, duration, primary_security_type, trailing_stop_dollars),
+            affirm_order
+        )
+
+        messages, success, _ = self._submit_order_v2(
+            template,
+            limit_price,
+            valid_return_codes,
+            place_directly=place_directly,
+            warnings=[limit_price_warning]
+        )
+        return messages, success
 
-        response = json.loads(r.text)
-
-        messages = list()
-        if limit_price_warning is not None:
-            messages.append(limit_price_warning)
-        if "orderMessages" in response["orderStrategy"] and response["orderStrategy"]["orderMessages"] is not None:
-            for message in response["orderStrategy"]["orderMessages"]:
-                messages.append(message["message"])
-
-        if response["orderStrategy"]["orderReturnCode"] in valid_return_codes:
-            return messages, True
-
-        return messages, False
 
     def trade_v2_sell_OCO_ONLY_OLD(
         self,
@@ -1417,8 +1103,6 @@ class Schwab(SessionManager):
                 limit_price = round(limit_price,4)
                 limit_price_warning_sell = f"For limit_sell_price < 1, Only 4 decimal places allowed. Rounded price_limit to: {limit_price}"
 
-        self.update_token(token_type='update')
-
         data = {
             "UserContext": {
                 "AccountId":str(account_id),
@@ -1490,13 +1174,13 @@ class Schwab(SessionManager):
         }
 
         # Adding this header seems to be necessary.
-        self.headers['schwab-resource-version'] = '1.0'
+        headers = self.account(None).headers('1.0')
 
-        r = requests.post(urls.order_verification_v2(), json=data, headers=self.headers)
+        r = self._gateway_request("POST", urls.order_verification_v2(), headers, token_type='update', endpoint="verify", json=data)
         if r.status_code != 200:
             return [r.text], False
 
-        response = json.loads(r.text)
+        response = self.codec.loads(r.content)
 
         orderId = response['orderStrategy']['orderId']
         firstOrderLeg = response['orderStrategy']['orderLegs'][0]
@@ -1520,14 +1204,13 @@ class Schwab(SessionManager):
         data["OrderProcessingControl"] = 2
         if affirm_order:
             data["OrderStrategy"]["OrderAffrmIn"] = True
-        self.update_token(token_type='update')
-        self.headers['schwab-resource-version'] = '1.0'
-        r = requests.post(urls.order_verification_v2(), json=data, headers=self.headers)
+        headers = self.account(None).headers('1.0')
+        r = self._gateway_request("POST", urls.order_verification_v2(), headers, token_type='update', endpoint="place", json=data)
 
         if r.status_code != 200:
             return [r.text], False
 
-        response = json.loads(r.text)
+        response = self.codec.loads(r.content)
 
         messages = list()
         if limit_price_warning_sell is not None:
@@ -1557,47 +1240,25 @@ class Schwab(SessionManager):
             Note: the order IDs listed in the v1 orders() are different
         instrument_type (int) - It is unclear what this means or when it should be different
         """
-        data = {
-            "TypeOfOrder": 0,
-            "OrderManagementSystem": 2,
-            "Orders": [{
-                "OrderId": order_id,
-                "IsLiveOrder": True,
-                "InstrumentType": instrument_type,
-                "CancelOrderLegs": [{}],
-                }],
-            "ContingentIdToCancel": 0,
-            "OrderIdToCancel": 0,
-            "OrderProcessingControl": 1,
-            "ConfirmCancelOrderId": 0,
-            }
-        self.headers["schwab-client-account"] = account_id
-        self.headers['schwab-resource-version'] = '2.0'
-        # Web interface uses bearer token retrieved from:
-        # https://client.schwab.com/api/auth/authorize/scope/api
-        # and it seems to be good for 1800s (30min)
-        self.update_token(token_type='api')
-        r1 = requests.post(urls.cancel_order_v2(), json=data, headers=self.headers)
+        data = cancel_order_payload(order_id, instrument_type)
+        headers = self.account(account_id).headers('2.0')
+        r1 = self._gateway_request("POST", urls.cancel_order_v2(), headers, token_type='api', endpoint="cancel_request", json=data)
         if r1.status_code not in (200, 202):
             return [r1.text], False
 
         try:
-            response = json.loads(r1.text)
+            response = self.codec.loads(r1.content)
             cancel_order_id = response['CancelOrderId']
         except (json.decoder.JSONDecodeError, KeyError):
             return [r1.text], False
 
         data['ConfirmCancelOrderId'] = cancel_order_id
         data['OrderProcessingControl'] = 2
-        # Web interface uses bearer token retrieved from:
-        # https://client.schwab.com/api/auth/authorize/scope/api
-        # and it seems to be good for 1800s (30min)
-        self.update_token(token_type='api')
-        r2 = requests.post(urls.cancel_order_v2(), json=data, headers=self.headers)
+        r2 = self._gateway_request("POST", urls.cancel_order_v2(), headers, token_type='api', endpoint="cancel_confirm", json=data)
         if r2.status_code not in (200, 202):
             return [r2.text], False
         try:
-            response = json.loads(r2.text)
+            response = self.codec.loads(r2.content)
             if response["CancelOperationSuccessful"]:
                 return response, True
         except (json.decoder.JSONDecodeError, KeyError):
@@ -1620,48 +1281,18 @@ class Schwab(SessionManager):
             orders_v2(account_id=account_id)[0]['OrderList'][0]['OrderId'].
             Note: the order IDs listed in the v1 orders() are different
         instrument_type (int) - It is unclear what this means or when it should be different
+        usingTokenAutoUpdate (bool) - Deprecated and ignored. Bearer tokens are cached per scope
+            and refreshed automatically before they expire.
         """
 
-        data = {
-            "TypeOfOrder": 0,
-            "OrderManagementSystem": 1,
-            "Orders": [{
-                "OrderId": order_id,
-                "IsLiveOrder": True,
-                "InstrumentType": instrument_type,
-                "IsOrphanConditional": False,
-                "Price": "Limit $" + str(round(price, 2)),
-                "CancelOrderLegs": [
-                    {
-                        "Action":buysell,
-                        "Quantity":str(qty),
-                        "QuantityUnitCode":qty,
-                        "Symbol":ticker,
-                    }
-                ],
-            }],
-            "ContingentIdToCancel": 0,
-            "OrderIdToCancel": 0,
-            "OrderProcessingControl": 1,
-            "ConfirmCancelOrderId": 0,
-            }
-        self.headers["schwab-client-account"] = account_id
-        
-        headers = dict(self.headers)
-        headers['schwab-resource-version'] = '2.0'
-        # Web interface uses bearer token retrieved from:
-        # https://client.schwab.com/api/auth/authorize/scope/api
-        # and it seems to be good for 1800s (30min)
-        if not usingTokenAutoUpdate:
-            self.update_token(token_type='api')
-        else:
-            self.setHeaderToken(self.apiToken)
-        r1 = requests.post(urls.cancel_order_v2(), json=data, headers=headers, timeout=REQUEST_TIMEOUT)
+        data = cancel_limit_order_payload(order_id, ticker, buysell, price, qty, instrument_type)
+        headers = self.account(account_id).headers('2.0')
+        r1 = self._gateway_request("POST", urls.cancel_order_v2(), headers, token_type='api', endpoint="cancel_request", json=data, timeout=REQUEST_TIMEOUT)
         if r1.status_code not in (200, 202):
             return [r1.text], False
 
         try:
-            response = json.loads(r1.text)
+            response = self.codec.loads(r1.content)
             cancel_order_id = response['CancelOrderId']
         except (json.decoder.JSONDecodeError, KeyError):
             print("cancel json decode key error")
@@ -1669,17 +1300,12 @@ class Schwab(SessionManager):
 
         data['ConfirmCancelOrderId'] = cancel_order_id
         data['OrderProcessingControl'] = 2
-        # Web interface uses bearer token retrieved from:
-        # https://client.schwab.com/api/auth/authorize/scope/api
-        # and it seems to be good for 1800s (30min)
-        if not usingTokenAutoUpdate:
-            self.update_token(token_type='api')
-        r2 = requests.post(urls.cancel_order_v2(), json=data, headers=headers, timeout=REQUEST_TIMEOUT)
+        r2 = self._gateway_request("POST", urls.cancel_order_v2(), headers, token_type='api', endpoint="cancel_confirm", json=data, timeout=REQUEST_TIMEOUT)
         if r2.status_code not in (200, 202):
             print("bad status code, in cancel")
             return [r2.text], False
         try:
-            response = json.loads(r2.text)
+            response = self.codec.loads(r2.content)
             if response["CancelOperationSuccessful"]:
                 return response, True
         except (json.decoder.JSONDecodeError, KeyError):
@@ -1688,153 +1314,265 @@ class Schwab(SessionManager):
         print("err reached end of cancel")
         return response, False
 
+    def cancel_orders_v2(self, cancels, max_concurrency=None):
+        """
+        Cancels several orders at once, e.g. both sides of every ticker at the end of a
+        timeBeforeCancel window. Each cancel still sends its request (OrderProcessingControl 1)
+        and then its confirmation (OrderProcessingControl 2), but the cancels run concurrently, so
+        every request is in flight together and each order is confirmed as soon as its own
+        CancelOrderId comes back.
+
+        cancels (list of dict) - Keyword arguments for cancel_limit_order_v2 (account_id,
+            order_id, ticker, buysell, price, qty), or for cancel_order_v2 (account_id, order_id)
+            if there is no ticker.
+        max_concurrency (int) - The most cancels in flight at once. Defaults to the instance's
+            max_concurrency.
+
+        Returns a list of (messages, is_success), in the order of cancels. A cancel that raised
+        (e.g. timed out) returns ([error text], False).
+        """
+        calls = []
+        for cancel in cancels:
+            method = self.cancel_limit_order_v2 if "ticker" in cancel else self.cancel_order_v2
+            calls.append(lambda method=method, cancel=cancel: method(**cancel))
+        return self.batch_runner.run(calls, lambda e: ([str(e)], False), max_concurrency)
+
 
-    def replace_limit_order_v2( # ERR _ NOTE _  NOT WORKING
+    def replace_limit_order_v2(
             self,
             account_id,
             order_id,
             isBuy,
             new_price,
-            # The fields below are experimental and should only be changed if you know what
-            # you're doing.
-            instrument_type=46,
+            ticker=None,
+            qty=None,
+            duration=48,
+            primary_security_type=46,
+            valid_return_codes={0,10},
+            affirm_order=False,
+            costBasis='FIFO',
+            dry_run=False
             ):
         """
-        Replaces an open order (specified by order ID) using the v2 API
+        Replaces an open limit order (specified by order ID) with a limit order at new_price using
+        the v2 API. The replacement is verified and then confirmed against the order's replace
+        endpoint, so re-pricing takes two requests instead of a two-phase cancel followed by a
+        two-phase new order. The replace endpoint did not work with the old cancel-style request,
+        so trade_v2_limit_buy_order / trade_v2_limit_sell_order only use this with use_replace.
 
         account_id (int) - The account ID of the order. If the ID is XXXX-XXXX, we're looking for
             just XXXXXXXX.
         order_id (int) - The order ID as listed in orders_v2. The most recent order ID is likely:
             orders_v2(account_id=account_id)[0]['OrderList'][0]['OrderId'].
             Note: the order IDs listed in the v1 orders() are different
-        instrument_type (int) - It is unclear what this means or when it should be different
+        isBuy (bool) - Whether the order is a buy (True) or a sell (False).
+        new_price (number) - The new limit price.
+        ticker (str) - The order's symbol. Required.
+        qty (int) - The order's quantity. Required.
+        dry_run (bool) - Only verifies the replacement.
+
+        Returns messages (list of strings), is_success (boolean), new_order_id (the replacement's
+        order id, or None)
         """
-        data = {
-            "TypeOfOrder": 0,
-            "OrderManagementSystem": 2,
-            "Orders": [{
-                "OrderId": order_id,
-                "IsLiveOrder": True,
-                "InstrumentType": instrument_type,
-                "CancelOrderLegs": [{}],
-                }],
-            "ContingentIdToCancel": 0,
-            "OrderIdToCancel": 0,
-            "OrderProcessingControl": 1,
-            "ConfirmCancelOrderId": 0,
-            }
-        self.headers["schwab-client-account"] = account_id
-        self.headers['schwab-resource-version'] = '2.0'
-        # Web interface uses bearer token retrieved from:
-        # https://client.schwab.com/api/auth/authorize/scope/api
-        # and it seems to be good for 1800s (30min)
-        self.update_token(token_type='api')
-        r1 = requests.post(urls.replace_order_v2(order_id), json=data, headers=self.headers)
-        if r1.status_code not in (200, 202):
-            return [r1.text], False
-
-        try:
-            response = json.loads(r1.text)
-            cancel_order_id = response['CancelOrderId']
-        except (json.decoder.JSONDecodeError, KeyError):
-            return [r1.text], False
-
-        data['ConfirmCancelOrderId'] = cancel_order_id
-        data['OrderProcessingControl'] = 2
-        # Web interface uses bearer token retrieved from:
-        # https://client.schwab.com/api/auth/authorize/scope/api
-        # and it seems to be good for 1800s (30min)
-        self.update_token(token_type='api')
-        r2 = requests.post(urls.replace_order_v2(order_id), json=data, headers=self.headers)
-        if r2.status_code not in (200, 202):
-            return [r2.text], False
-        try:
-            response = json.loads(r2.text)
-            if response["CancelOperationSuccessful"]:
-                return response, True
-        except (json.decoder.JSONDecodeError, KeyError):
-            return [r2.text], False
-        return response, False
+        if ticker is None or qty is None:
+            raise ValueError("replace_limit_order_v2 needs the ticker and qty of the order")
+        instruction = 49 if isBuy else 50
+        new_price, new_price_warning = normalize_limit_price(new_price, "new_price")
+        template = self._order_template(
+            ("replace", ticker, instruction, qty, account_id, duration, primary_security_type, costBasis, affirm_order),
+            lambda: replace_limit_order_payload(ticker, instruction, qty, account_id, duration, primary_security_type, costBasis),
+            affirm_order
+        )
+
+        return self._submit_order_v2(
+            template,
+            new_price,
+            valid_return_codes,
+            dry_run=dry_run,
+            place_directly=False,
+            warnings=[new_price_warning],
+            timeout=REQUEST_TIMEOUT,
+            replace_order_id=order_id,
+            account_id=account_id
+        )
 
 
     def getBidAsk(self, ticker, account_id, usingTokenAutoUpdate=False):
         try:
-            quotes = self.quote_v2([ticker,], account_id, usingTokenAutoUpdate) # assume 'symbol' (in data) is correct - only getting one ticker
-            if quotes == None:
-                raise Exception("quotes is None in getBidAsk")
-            quote = quotes[0]["quote"]
+            quotes = self.get_quotes([ticker,], account_id)
+            quote = list(quotes.values())[0] # only getting one ticker
+            if quote.bid == None or quote.ask == None:
+                raise ValueError("no bid/ask in quote " + str(quote.entry))
         except Exception as e:
-            print("error getting bid/ask. quotes: " + str(quotes) + ", exception: ", e)
-        return float(quote["bid"]), float(quote['ask'])
+            print("error getting bid/ask for " + ticker + ", exception: ", e)
+            raise
+        return quote.bid, quote.ask
+
+
+    def getBidAsks(self, tickers, account_id):
+        """
+        Returns a dict of ticker -> (bid, ask) for every ticker in tickers, using one quote_v2
+        request instead of one getBidAsk call per ticker.
+        """
+        return {symbol: (quote.bid, quote.ask) for symbol, quote in self.get_quotes(tickers, account_id).items()}
+
+
+    def get_quotes(self, tickers, account_id):
+        """
+        Returns a dict of ticker -> Quote for every ticker in tickers, using one quote_v2 request.
+        Only the fields a Quote decodes are parsed (QUOTES_SCHEMA).
+        """
+        r = self._quote_request(tickers, account_id)
+        if r.status_code != 200:
+            raise ValueError("error getting bid/ask: " + str([r.text]))
+        quotes = self.codec.decode(r.content, QUOTES_SCHEMA)["quotes"]
+        return {symbol: Quote.from_entry(quote, symbol) for symbol, quote in quotes_by_symbol(tickers, quotes).items()}
 
 
     def quote_v2(self, tickers, account_id, usingTokenAutoUpdate=False):
         """
         quote_v2 takes a list of Tickers, and returns Quote information through the Schwab API.
+
+        usingTokenAutoUpdate (bool) - Deprecated and ignored. Bearer tokens are cached per scope
+            and refreshed automatically before they expire.
         """
+        r = self._quote_request(tickers, account_id)
+        if r.status_code != 200:
+            return [r.text], False
+
+        response = self.codec.loads(r.content)
+        return response["quotes"]
+
+    def _quote_request(self, tickers, account_id):
         data = {
             "Symbols":tickers,
             "IsIra":False,
             "AccountRegType":"S3"
         }
 
-        # Adding this header seems to be necessary.
-        self.headers["schwab-client-account"] = account_id
-        headers = dict(self.headers)
-        headers['schwab-resource-version'] = '1.0'
+        # The schwab-client-account header seems to be necessary.
+        headers = self.account(account_id).headers('1.0')
 
-        if not usingTokenAutoUpdate:
-            self.update_token(token_type='update')
-        else:
-            self.setHeaderToken(self.updateToken)
-        r = requests.post(urls.ticker_quotes_v2(), json=data, headers=headers, timeout=REQUEST_TIMEOUT)
-        if r.status_code != 200:
-            return [r.text], False
+        return self._gateway_request("POST", urls.ticker_quotes_v2(), headers, token_type='update', endpoint="quotes", json=data, timeout=REQUEST_TIMEOUT)
 
-        response = json.loads(r.text)
-        return response["quotes"]
-
-    def orders_v2(self, account_id=None, openOnly=False):
+    def orders_v2(self, account_id=None, openOnly=False, compact=False):
         """
         orders_v2 returns a list of orders for a Schwab Account. It is unclear to me how to filter by specific account.
 
         Currently, the query parameters are hard coded to return ALL orders, but this can be easily adjusted.
+
+        compact (bool) - Only parse the fields OrderStatus reads (ORDERS_SCHEMA), for pollers that
+            keep the orders in an OrderStore.
         """
 
-        self.update_token(token_type='api')
-        self.headers['schwab-resource-version'] = '2.0'
-        if account_id:
-            self.headers["schwab-client-account"] = account_id
-        r = requests.get(urls.orders_v2(), headers=self.headers)
+        headers = self.account(account_id or None).headers('2.0')
+        r = self._gateway_request("GET", urls.orders_v2(), headers, token_type='api', endpoint="orders")
         if r.status_code != 200:
             return [r.text], False
 
-        response = json.loads(r.text)
+        response = self.codec.decode(r.content, ORDERS_SCHEMA) if compact else self.codec.loads(r.content)
         return response["Orders"]
     
-    def todays_orders_v2(self, account_id=None) -> tuple[list, bool]:
+    def todays_orders_v2(self, account_id=None, compact=False) -> tuple[list, bool]:
         """
         orders_v2 returns a list of orders for a Schwab Account. It is unclear to me how to filter by specific account.
 
         Currently, the query parameters are hard coded to return ALL orders, but this can be easily adjusted.
+
+        compact (bool) - Only parse the fields OrderStatus reads (ORDERS_SCHEMA), for pollers that
+            keep the orders in an OrderStore.
         """
 
-        self.update_token(token_type='api')
-        self.headers['schwab-resource-version'] = '2.0'
-        if account_id:
-            self.headers["schwab-client-account"] = account_id
-        r = requests.get(urls.todays_orders_v2(), headers=self.headers, timeout=REQUEST_TIMEOUT)
+        headers = self.account(account_id or None).headers('2.0')
+        r = self._gateway_request("GET", urls.todays_orders_v2(), headers, token_type='api', endpoint="todays_orders", timeout=REQUEST_TIMEOUT)
         if r.status_code != 200:
             return [r.text], False
 
-        response = json.loads(r.text)
+        response = self.codec.decode(r.content, ORDERS_SCHEMA) if compact else self.codec.loads(r.content)
         return response["Orders"], True
 
+    def account(self, account_id):
+        """
+        Returns the AccountContext of account_id (created on first use), whose requests carry
+        their own schwab-client-account header. None gives the context for requests that are
+        not for one account.
+        """
+        key = None if account_id is None else str(account_id)
+        context = self._account_contexts.get(key)
+        if context is None:
+            context = self._account_contexts.setdefault(key, AccountContext(self, key))
+        return context
+
+    def orders_for_accounts(self, account_ids, openOnly=False, compact=False, max_concurrency=None):
+        """
+        Fetches the orders (see orders_v2) of every account in account_ids concurrently.
+
+        Returns (orders, errors): orders maps each account id to its Orders, and errors maps
+        each account whose request failed to the error text.
+        """
+        return self._fan_out(account_ids, lambda context: _checked(context.orders(openOnly=openOnly, compact=compact)), max_concurrency)
+
+    def todays_orders_for_accounts(self, account_ids, compact=False, max_concurrency=None):
+        """
+        Fetches today's orders (see todays_orders_v2) of every account in account_ids
+        concurrently. Returns (orders, errors) like orders_for_accounts.
+        """
+        return self._fan_out(account_ids, lambda context: _checked(context.todays_orders(compact=compact))[0], max_concurrency)
+
+    def transactions_for_accounts(self, account_ids, max_concurrency=None):
+        """
+        Fetches the transaction history of every account in account_ids concurrently, as lists
+        of Transactions (newest first). Returns (transactions, errors) like orders_for_accounts.
+        """
+        return self._fan_out(account_ids, lambda context: context.transactions(), max_concurrency)
+
+    def positions_for_accounts(self, account_ids):
+        """
+        Returns (accounts, errors): accounts maps each account id in account_ids to its Account,
+        and errors maps each account Holdings does not list to the error text. Holdings covers
+        every account in one request, so nothing is fanned out.
+        """
+        try:
+            account_info = self.get_accounts_v2()
+        except Exception as e:
+            return {}, {account_id: str(e) for account_id in account_ids}
+        accounts, errors = {}, {}
+        for account_id in account_ids:
+            account = account_info.get(int(account_id))
+            if account is None:
+                errors[account_id] = f"account {account_id} not found in Holdings"
+            else:
+                accounts[account_id] = account
+        return accounts, errors
+
+    def _fan_out(self, account_ids, call, max_concurrency):
+        calls = [lambda context=self.account(account_id): (True, call(context)) for account_id in account_ids]
+        outcomes = self.batch_runner.run(calls, lambda e: (False, str(e)), max_concurrency)
+        results, errors = {}, {}
+        for account_id, (ok, value) in zip(account_ids, outcomes):
+            if ok:
+                results[account_id] = value
+            else:
+                errors[account_id] = value
+        return results, errors
+
     def get_account_info_v2(self):
+        """
+            Returns a dict mapping each account id (int) to a dict of its positions and totals.
+            Use get_accounts_v2 for the same information as Account and Position records.
+        """
+        return {account_id: account._as_dict() for account_id, account in self.get_accounts_v2().items()}
+
+    def get_accounts_v2(self):
+        """
+            Returns a dict mapping each account id (int) to its Account record. The positions are
+            Position records, which decode description, cost and market_value on first use.
+        """
+        r = self._gateway_request("GET", urls.positions_v2(), self.account(None).headers(), token_type='api', endpoint="holdings")
+        return self._parse_account_info_v2(self.codec.loads(r.content))
+
+    def _parse_account_info_v2(self, response):
         account_info = dict()
-        self.update_token(token_type='api')
-        r = requests.get(urls.positions_v2(), headers=self.headers)
-        response = json.loads(r.text)
         for account in response['accounts']:
             positions = list()
             for security_group in account["groupedPositions"]:
@@ -1842,13 +1580,7 @@ class Schwab(SessionManager):
                     continue
                 for position in security_group["positions"]:
                     positions.append(
-                        Position(
-                            position["symbolDetail"]["symbol"],
-                            position["symbolDetail"]["description"],
-                            float(position["quantity"]),
-                            0 if "costDetail" not in position else float(position["costDetail"]["costBasisDetail"]["costBasis"]),
-                            0 if "priceDetail" not in position else float(position["priceDetail"]["marketValue"])
-                        )._as_dict()
+                        Position.from_v2(position)
                     )
             account_info[int(account["accountId"])] = Account(
                 account["accountId"],
@@ -1857,25 +1589,224 @@ class Schwab(SessionManager):
                 account["totals"]["cashInvestments"],
                 account["totals"]["accountValue"],
                 account["totals"].get("costBasis", 0)
-            )._as_dict()
+            )
 
         return account_info
 
-    def update_token(self, token_type='api'):
-        r = self.session.get(f"https://client.schwab.com/api/auth/authorize/scope/{token_type}")
+    def _gateway_request(self, method, url, headers, token_type='api', endpoint="other", **kwargs):
+        """
+        Sends a request to the gateway with the cached bearer token for token_type.
+
+        headers is a HeaderSet (see account()), sent with the token's precomputed headers, or a
+        plain dict, which is copied. A 401 response means the cached token expired or was revoked
+        early, so the token is refreshed once and the request is retried.
+
+        The call is recorded in self.metrics under endpoint. For streamed requests (stream=True),
+        the time until the headers arrived and the Content-Length are recorded instead, so the
+        body is left unread.
+        """
+        entry = self.token_cache.get_entry(token_type)
+        retries = 0
+        start_time = time.perf_counter()
+        try:
+            r = self.transport.request(method, url, headers=_with_token(headers, entry), **kwargs)
+            if r.status_code == 401:
+                retries = 1
+                r.close()
+                self.token_cache.refresh(token_type, stale_token=entry.token)
+                entry = self.token_cache.get_entry(token_type)
+                r = self.transport.request(method, url, headers=_with_token(headers, entry), **kwargs)
+        except Exception as e:
+            if self.metrics is not None:
+                self.metrics.record_error(endpoint, time.perf_counter() - start_time, e, retries=retries)
+            raise
+        if self.metrics is not None:
+            self.metrics.record(
+                endpoint,
+                time.perf_counter() - start_time,
+                r.status_code,
+                bytes_out=len(r.request.body or b"") * (retries + 1),
+                bytes_in=int(r.headers.get("Content-Length") or 0) if kwargs.get("stream") else len(r.content),
+                retries=retries
+            )
+        return r
+
+    def _order_template(self, key, build, affirm_order):
+        """
+        Returns the cached OrderTemplate for key, building it from build() the first time.
+        """
+        template = self.order_templates.get(key)
+        if template is None:
+            template = self.order_templates[key] = OrderTemplate(build(), affirm_order=affirm_order)
+        return template
+
+    def _submit_order_v2(
+            self,
+            template,
+            limit_price,
+            valid_return_codes,
+            dry_run=False,
+            place_directly=None,
+            warnings=(),
+            timeout=None,
+            replace_order_id=None,
+            account_id=None
+            ):
+        """
+        Sends an order built by one of the trade_v2 methods through the gateway's two-phase flow:
+        a verification request (OrderProcessingControl 1) that returns the orderId and the
+        schwabSecurityId of the first leg, then the placement request (OrderProcessingControl 2).
+
+        The schwabSecurityId is cached per symbol in self.security_ids. If place_directly is True
+        (or None and the instance was created with place_orders_directly=True) and the symbol is
+        cached, the order is placed with a single request instead. If the gateway rejects that
+        request, the order falls back to the two-phase flow. If the response does not say whether
+        the order was placed (e.g. a timeout or a 5xx), today's orders are checked for it first.
+
+        template (OrderTemplate) - The order. Only limit_price, the order id and the processing
+                    control change between requests, so the bodies are rendered from the
+                    template's pre-serialized bytes.
+        warnings (iterable) - Messages (or None) to put in front of the gateway's messages.
+        replace_order_id (int) - Sends the order to the replace endpoint of this open order
+                    instead, as its replacement (the template is built from
+                    replace_limit_order_payload). It is never placed directly.
+        account_id (int) - Sent as the schwab-client-account header, if given.
+
+        Returns messages (list of strings), is_success (boolean), order_id (the placed order's
+        id, or None)
+        """
+        if place_directly is None:
+            place_directly = self.place_orders_directly
+        submission = OrderSubmission(
+            template, limit_price, valid_return_codes, self.security_ids, dry_run, place_directly, warnings, replace_order_id
+        )
+
+        # Adding the resource version header seems to be necessary.
+        context = self.account(account_id or None)
+        headers = context.headers(submission.resource_version, 'application/json')
+
+        body = submission.direct_body()
+        if body is not None:
+            status_code, response = None, None
+            try:
+                r = self._gateway_request("POST", urls.order_verification_v2(), headers, token_type='update', endpoint="place", data=body, timeout=timeout)
+                status_code = r.status_code
+                response = self.codec.loads(r.content) if r.status_code == 200 else None
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"[Schwab] no usable response to placing the {submission.ticker} order directly: {e!r}")
+            result = submission.direct_result(status_code, response)
+            if result is None and submission.placement_unclear:
+                # the order may have been placed; look for it before placing it again
+                try:
+                    orders, success = self.todays_orders_v2(submission.account_id, compact=True)
+                except requests.exceptions.RequestException:
+                    orders, success = None, False
+                result = submission.unclear_result(orders if success else None)
+            if result is not None:
+                return result
+
+        r = self._gateway_request("POST", submission.url, headers, token_type=submission.token_type, endpoint=submission.verify_endpoint, data=submission.verify_body(), timeout=timeout)
+        if r.status_code != 200:
+            return [r.text], False, None
+        result = submission.verify_result(self.codec.loads(r.content))
+        if result is not None:
+            return result
+
+        # Make the same POST request, but for real this time.
+        r = self._gateway_request("POST", submission.url, headers, token_type=submission.token_type, endpoint=submission.place_endpoint, data=submission.place_body(), timeout=timeout)
+        if r.status_code != 200:
+            return [r.text], False, None
+
+        return submission.place_result(self.codec.loads(r.content))
+
+    def _fetch_token(self, token_type):
+        start_time = time.perf_counter()
+        try:
+            r = self.session.get(urls.authorize_scope(token_type))
+        except Exception as e:
+            if self.metrics is not None:
+                self.metrics.record_error("token", time.perf_counter() - start_time, e)
+            raise
+        if self.metrics is not None:
+            self.metrics.record("token", time.perf_counter() - start_time, r.status_code, bytes_in=len(r.content))
         if not r.ok:
             raise ValueError(f'Error updating Bearer token: {r.reason} at time {datetime.datetime.now().strftime("%I:%M:%S%p on %D")}')
-        token = json.loads(r.text)['token']
-        self.setHeaderToken(token)
+        return self.codec.loads(r.content)['token']
+
+    def update_token(self, token_type='api'):
+        """
+        Fetches a new bearer token for token_type and caches it. Gateway methods use the cached
+        token, so calling this is only needed to force a refresh.
+        """
+        token = self.token_cache.refresh(token_type)
+        self.lastTimeTokenUpdated = time.time()
         return token
     
     def update_both_tokens(self):
-        self.updateToken = self.update_token(token_type='update')
-        self.apiToken = self.update_token(token_type='api')
-        return self.apiToken, self.updateToken
+        updateToken = self.update_token(token_type='update')
+        apiToken = self.update_token(token_type='api')
+        return apiToken, updateToken
     
-    def setHeaderToken(self, token):
-        self.headers['authorization'] = f"Bearer {token}"
+    def setHeaderToken(self, token, token_type='api'):
+        """
+        Deprecated. Requests take their bearer token from the token cache instead of
+        self.headers, so this caches token as a newly issued token for token_type, unless it is
+        already the cached token of a scope.
+        """
+        warnings.warn("setHeaderToken is deprecated; bearer tokens are cached per scope by token_cache", DeprecationWarning, stacklevel=2)
+        for scope in TOKEN_SCOPES:
+            entry = self.token_cache.peek(scope)
+            if entry is not None and entry.token == token:
+                return
+        self.token_cache.put(token_type, token)
+
+    def start_token_refresher(self, scopes=TOKEN_SCOPES, refresh_lead=DEFAULT_REFRESH_LEAD):
+        """
+        Starts a background thread that renews the bearer tokens for scopes before they expire,
+        so requests never wait on a token fetch. Concurrent refreshes (from the thread or from
+        requests that got a 401) are collapsed into one request.
+
+        Must be called after login, and again in each process that uses this instance since the
+        thread does not carry over into child processes.
+        """
+        if self.token_refresher is not None and self.token_refresher.is_alive():
+            return self.token_refresher
+        self.token_refresher = TokenRefresher(self.token_cache, scopes=scopes, refresh_lead=refresh_lead)
+        self.token_refresher.start()
+        return self.token_refresher
+
+    def stop_token_refresher(self):
+        if self.token_refresher is not None:
+            self.token_refresher.stop()
+            self.token_refresher = None
+
+    def attach_token_board(self, board):
+        """
+        Reads bearer tokens from board (a TokenBoard) before each request, so tokens refreshed
+        by another process are used without being sent to this one. If the board stays mid-write,
+        a fresh cached token is used; a request that would need a newer one raises TimeoutError.
+        """
+        self.token_cache.attach_board(board)
+
+    # apiToken and updateToken are kept for code that hands tokens around between processes.
+    # Assigning one caches it as a newly issued token for its scope.
+    @property
+    def apiToken(self):
+        entry = self.token_cache.peek('api')
+        return None if entry is None else entry.token
+
+    @apiToken.setter
+    def apiToken(self, token):
+        self.token_cache.put('api', token)
+
+    @property
+    def updateToken(self):
+        entry = self.token_cache.peek('update')
+        return None if entry is None else entry.token
+
+    @updateToken.setter
+    def updateToken(self, token):
+        self.token_cache.put('update', token)
 
 
 
@@ -1952,8 +1883,6 @@ class Schwab(SessionManager):
                 limit_price = round(limit_price,4)
                 limit_price_warning = f"For limit_buy_price < 1, Only 4 decimal places allowed. Rounded price_limit to: {limit_price}"
 
-        self.update_token(token_type='update')
-
         data = {
             "UserContext": {
                 "AccountId":str(account_id),
@@ -2027,13 +1956,13 @@ class Schwab(SessionManager):
         }
 
         # Adding this header seems to be necessary.
-        self.headers['schwab-resource-version'] = '1.0'
+        headers = self.account(None).headers('1.0')
 
-        r = requests.post(urls.order_verification_v2(), json=data, headers=self.headers)
+        r = self._gateway_request("POST", urls.order_verification_v2(), headers, token_type='update', endpoint="verify", json=data)
         if r.status_code != 200:
             return [r.text], False
 
-        response = json.loads(r.text)
+        response = self.codec.loads(r.content)
 
         orderId = response['orderStrategy']['orderId']
         firstOrderLeg = response['orderStrategy']['orderLegs'][0]
@@ -2057,14 +1986,13 @@ class Schwab(SessionManager):
         data["OrderProcessingControl"] = 2
         if affirm_order:
             data["OrderStrategy"]["OrderAffrmIn"] = True
-        self.update_token(token_type='update')
-        self.headers['schwab-resource-version'] = '1.0'
-        r = requests.post(urls.order_verification_v2(), json=data, headers=self.headers)
+        headers = self.account(None).headers('1.0')
+        r = self._gateway_request("POST", urls.order_verification_v2(), headers, token_type='update', endpoint="place", json=data)
 
         if r.status_code != 200:
             return [r.text], False
 
-        response = json.loads(r.text)
+        response = self.codec.loads(r.content)
 
         messages = list()
         if limit_price_warning is not None:
@@ -0,0 +1,113 @@
+import json
+import os
+import tempfile
+import time
+
+from .credentials import SchwabCredentials
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+    InvalidToken = None
+
+# Environment variable read for the vault key when none is given.
+VAULT_KEY_ENV = "SCHWAB_SESSION_VAULT_KEY"
+VAULT_VERSION = 1
+# Sessions older than this are not restored; the browser login is used instead.
+DEFAULT_MAX_AGE = 24 * 60 * 60 # seconds
+
+
+def generate_key():
+    """
+        Returns a new vault key (a urlsafe base64 Fernet key, as bytes). Store it somewhere other
+        than the vault, e.g. in the SCHWAB_SESSION_VAULT_KEY environment variable.
+    """
+    _require_cryptography()
+    return Fernet.generate_key()
+
+
+def _require_cryptography():
+    if Fernet is None:
+        raise ImportError("The session vault requires cryptography. Install it with: pip install cryptography")
+
+
+class SessionVault:
+    def __init__(self, path, key=None, max_age=DEFAULT_MAX_AGE):
+        """
+            The SessionVault class. Keeps a logged in session (the cookie jar saved by
+            save_and_close_session and the captured request headers) in a Fernet-encrypted file,
+            so a restarted process can reuse the session instead of logging in through the
+            browser again.
+
+            path (str) - The vault file. Written with owner-only permissions.
+            key (bytes or str) - The Fernet key (see generate_key). Defaults to the
+                        SCHWAB_SESSION_VAULT_KEY environment variable.
+            max_age (number) - Seconds after saving at which a session is no longer restored.
+
+            Requires cryptography (pip install cryptography).
+        """
+        _require_cryptography()
+        key = key if key is not None else os.environ.get(VAULT_KEY_ENV)
+        if not key:
+            raise ValueError(f"No session vault key given and {VAULT_KEY_ENV} is not set")
+        self.path = path
+        self.max_age = max_age
+        self._fernet = Fernet(key)
+
+    def save(self, api):
+        """
+            Encrypts api's (a Schwab instance) cookies and headers into the vault file.
+        """
+        # bearer tokens are short lived and fetched again from the cookies
+        state = SchwabCredentials.from_api(api, include_tokens=False).to_dict()
+        state["version"] = VAULT_VERSION
+        state["saved_at"] = time.time()
+        token = self._fernet.encrypt(json.dumps(state).encode("utf-8"))
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".session_vault")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(token)
+            os.chmod(temp_path, 0o600)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def load(self):
+        """
+            Returns the saved state (SchwabCredentials.to_dict plus saved_at), or None if there
+            is no vault, it can not be decrypted with the key, or it is older than max_age.
+        """
+        try:
+            with open(self.path, "rb") as f:
+                token = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            state = json.loads(self._fernet.decrypt(token))
+        except (InvalidToken, ValueError) as e:
+            print(f"[SessionVault] could not decrypt {self.path}: {type(e).__name__}")
+            return None
+        if state.get("version") != VAULT_VERSION:
+            return None
+        if self.max_age is not None and time.time() - state.get("saved_at", 0) > self.max_age:
+            return None
+        return state
+
+    def restore(self, api):
+        """
+            Loads the saved cookies and headers into api (a Schwab instance). Returns True if a
+            session was restored; whether it is still logged in is for check_auth to tell.
+        """
+        state = self.load()
+        if state is None:
+            return False
+        SchwabCredentials.from_dict(state).apply(api)
+        return True
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
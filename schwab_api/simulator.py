@@ -0,0 +1,586 @@
+import datetime
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from . import urls
+from .token_cache import TOKEN_LIFETIME
+
+# Default market for symbols that have not been given a quote.
+DEFAULT_BID = 100.00
+DEFAULT_ASK = 100.05
+# Gateway security ids handed out to symbols, in the order they are first seen.
+FIRST_SECURITY_ID = 10000000
+
+# Return codes and messages used by the simulated order verification/placement.
+EXECUTABLE_RETURN_CODE = 25
+EXECUTABLE_MESSAGE = "This order is executable because the buy (or sell) limit is higher (lower) than the ask (bid) price."
+AFFIRMATION_RETURN_CODE = 30
+AFFIRMATION_MESSAGE = "Order Affirmation required"
+UNKNOWN_ORDER_RETURN_CODE = 40
+SESSION_COOKIE = "SimSession"
+
+_ROUTES = (
+    ("POST", re.compile(r"/TradeOrderManagementWebPort/orders$"), "orders"),
+    ("POST", re.compile(r"/TradeOrderManagementWebPort/orders/(\d+)$"), "replace"),
+    ("POST", re.compile(r"/market/quotes/list$"), "quotes"),
+    ("GET", re.compile(r"/customer/accounts$"), "accounts"),
+    ("GET", re.compile(r"/Holdings/Holdings$"), "holdings"),
+    ("GET", re.compile(r"/orders/listView$"), "orders_list"),
+    ("POST", re.compile(r"/orders/cancelorder$"), "cancel"),
+    ("POST", re.compile(r"/brokerage/transactions/export$"), "transactions"),
+    ("GET", re.compile(r"/api/auth/authorize/scope/(\w+)$"), "authorize"),
+)
+
+
+class SimulatedOrder:
+    def __init__(self, order_id, symbol, side, qty, limit_price, order_type, strategy_type):
+        self.order_id = order_id
+        self.symbol = symbol
+        self.side = side # 'Buy' or 'Sell'
+        self.qty = qty
+        self.limit_price = limit_price # None for market orders
+        self.order_type = order_type
+        self.strategy_type = strategy_type
+        self.status = "Open"
+        self.fill_price = None
+        self.placed_at = time.time()
+        self.updated_at = self.placed_at
+
+    def as_list_view(self):
+        """
+            The order as an OrderList entry of the listView response.
+        """
+        return {
+            "OrderId": self.order_id,
+            "OrderStatus": self.status,
+            "DisplaySymbol": self.symbol,
+            "OrderAction": self.side,
+            "Quantity": f"{self.qty:g}",
+            "Price": "Market" if self.limit_price is None else f"Limit ${self.limit_price:.2f}",
+            "FillPrice": "" if self.fill_price is None else f"${self.fill_price:.2f}",
+            "OrderType": self.order_type,
+            "OrderStrategyType": self.strategy_type,
+            "TimeStamp": datetime.datetime.fromtimestamp(self.updated_at).isoformat(),
+        }
+
+
+class GatewaySimulator:
+    def __init__(self, account_id=12345678, **kwargs):
+        """
+            The GatewaySimulator class. A local HTTP server that stands in for the Schwab gateway
+            and client endpoints in urls.py, so Schwab, AsyncSchwab and the strategy code can be
+            benchmarked and tested offline against realistic response shapes.
+
+            Implements order verification/placement (OrderProcessingControl 1/2, including the
+            executable-limit and affirmation return codes and direct placement with a known
+            ItemIssueId), replace (with the update-scope token), the two-phase cancelorder, quotes/list, listView orders,
+            Holdings, customer/accounts, the transaction export and authorize/scope. A simple
+            matching engine fills limit orders when the simulated market crosses them.
+
+            account_id (int) - The simulated account.
+
+            Optional keyword arguments:
+            host (str) - Interface to listen on. Defaults to 127.0.0.1.
+            port (int) - Port to listen on. Defaults to 0 (any free port).
+            latency (number) - Seconds added to every response.
+            jitter (number) - Up to this many extra seconds, uniformly random, per response.
+            route_latency (dict) - Route name -> seconds, replacing latency for that route.
+            error_rate (number) - Probability (0-1) of answering a gateway request with error_status.
+            error_status (int) - The status code used by error_rate. Defaults to 503.
+            token_lifetime (number) - Seconds an issued bearer token is accepted for.
+            require_session (bool) - Only issue bearer tokens, and only answer customer/accounts
+                        without one, for requests carrying a session cookie from new_session().
+            volatility (number) - Standard deviation (dollars) of the random step the mid price
+                        takes each time a symbol is quoted. 0 keeps quotes fixed.
+            positions (dict) - Initial holdings, symbol -> quantity.
+            cash (number) - Initial cash.
+            seed - Seed for the random latency, errors and price steps.
+        """
+        self.account_id = int(account_id)
+        self.host = kwargs.get("host", "127.0.0.1")
+        self.port = kwargs.get("port", 0)
+        self.latency = kwargs.get("latency", 0)
+        self.jitter = kwargs.get("jitter", 0)
+        self.route_latency = dict(kwargs.get("route_latency", {}))
+        self.error_rate = kwargs.get("error_rate", 0)
+        self.error_status = kwargs.get("error_status", 503)
+        self.token_lifetime = kwargs.get("token_lifetime", TOKEN_LIFETIME)
+        self.require_session = kwargs.get("require_session", False)
+        self.volatility = kwargs.get("volatility", 0)
+        self.cash = kwargs.get("cash", 100000.0)
+        self.positions = {symbol: float(qty) for symbol, qty in kwargs.get("positions", {}).items()}
+        self.cost_basis = {symbol: 0.0 for symbol in self.positions}
+        self._random = random.Random(kwargs.get("seed"))
+
+        self._lock = threading.RLock()
+        self.quotes = {} # symbol -> [bid, ask]
+        self.security_ids = {} # symbol -> schwabSecurityId
+        self.orders = {} # order id -> SimulatedOrder
+        self.transactions = [] # newest last
+        self._pending = {} # verified order id -> payload
+        self._pending_cancels = {} # cancel order id -> order id
+        self._next_id = 1000
+        self._tokens = {} # token -> (scope, issue time)
+        self._token_count = 0
+        self._sessions = set() # session cookie values
+        self._injected = {} # route -> [(status, body)]
+        self.request_counts = Counter()
+
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.start()
+        self.install()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
+        self.stop()
+
+    def start(self):
+        """
+            Starts serving in a daemon thread and returns the base url.
+        """
+        simulator = self
+
+        class Handler(_SimulatorRequestHandler):
+            pass
+        Handler.simulator = simulator
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="GatewaySimulator", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def install(self):
+        """
+            Points urls at this simulator for both the gateway and the client site.
+        """
+        urls.set_base_urls(gateway=self.url, client=self.url)
+
+    def uninstall(self):
+        urls.set_base_urls()
+
+    def client(self, **kwargs):
+        """
+            Returns a Schwab instance that talks to this simulator, without a browser.
+            install() must have been called.
+        """
+        from .schwab import Schwab
+        kwargs.setdefault("launch_browser", False)
+        return Schwab(**kwargs)
+
+    def new_session(self):
+        """
+            Returns the cookies (name -> value) of a new logged in session, as a browser login
+            would leave them.
+        """
+        with self._lock:
+            self._token_count += 1
+            session = f"sim-session-{self._token_count}"
+            self._sessions.add(session)
+        return {SESSION_COOKIE: session}
+
+    def end_sessions(self):
+        """
+            Logs every session out, as if their cookies expired.
+        """
+        with self._lock:
+            self._sessions.clear()
+
+    # market and order control
+
+    def set_quote(self, symbol, bid, ask):
+        """
+            Sets the market for symbol and fills any resting orders it crosses.
+        """
+        with self._lock:
+            self.quotes[symbol] = [float(bid), float(ask)]
+            self._match(symbol)
+
+    def get_quote(self, symbol):
+        with self._lock:
+            return tuple(self._quote(symbol))
+
+    def fill(self, order_id, price=None):
+        """
+            Fills an open order at price (its limit price if None), regardless of the market.
+        """
+        with self._lock:
+            order = self.orders[int(order_id)]
+            if order.status == "Open":
+                self._fill(order, order.limit_price if price is None else price)
+
+    def inject_error(self, route, status=500, count=1, body=None):
+        """
+            Makes the next count requests to route (e.g. 'orders', 'cancel', 'quotes') fail with
+            status and body.
+        """
+        body = body if body is not None else {"Error": {"Code": "InjectedError", "Message": f"injected {status}"}}
+        with self._lock:
+            self._injected.setdefault(route, []).extend([(status, body)] * count)
+
+    def revoke_tokens(self):
+        """
+            Invalidates every issued bearer token, so the next gateway request gets a 401.
+        """
+        with self._lock:
+            self._tokens.clear()
+
+    # request handling
+
+    def handle(self, method, path, query, headers, body):
+        """
+            Returns (status, response body object) for one request.
+        """
+        route, match = None, None
+        for route_method, pattern, name in _ROUTES:
+            match = pattern.search(path)
+            if route_method == method and match:
+                route = name
+                break
+        if route is None:
+            return 404, {"Error": {"Code": "NotFound", "Message": path}}
+
+        self.request_counts[route] += 1
+        self._delay(route)
+
+        with self._lock:
+            injected = self._injected.get(route)
+            if injected:
+                return injected.pop(0)
+        if route == "authorize" or (self.require_session and route == "accounts" and "authorization" not in headers):
+            if self.require_session and not self._has_session(headers):
+                return 401, {"Error": {"Code": "Unauthorized"}}
+        else:
+            if self.error_rate and self._random.random() < self.error_rate:
+                return self.error_status, {"Error": {"Code": "ServiceUnavailable", "Message": "simulated error"}}
+            scope = self._token_scope(headers)
+            if scope is None:
+                return 401, {"Error": {"Code": "Unauthorized"}}
+            if route == "replace" and scope != "update":
+                return 403, {"Error": {"Code": "Forbidden", "Message": f"replace needs the update scope, not {scope}"}}
+
+        payload = json.loads(body) if body else {}
+        with self._lock:
+            if route == "authorize":
+                return self._authorize(match.group(1))
+            if route == "orders":
+                return self._order(payload)
+            if route == "replace":
+                return self._replace(int(match.group(1)), payload)
+            if route == "quotes":
+                return self._quotes(payload)
+            if route == "accounts":
+                return 200, {"Accounts": [{"AccountId": str(self.account_id)}]}
+            if route == "holdings":
+                return self._holdings()
+            if route == "orders_list":
+                return self._orders_list(query)
+            if route == "cancel":
+                return self._cancel(payload)
+            if route == "transactions":
+                return self._transactions()
+
+    def _delay(self, route):
+        delay = self.route_latency.get(route, self.latency)
+        if self.jitter:
+            delay += self._random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _token_scope(self, headers):
+        """
+            Returns the scope of the request's bearer token, or None if it has none that is valid.
+        """
+        authorization = headers.get("authorization", "")
+        if not authorization.startswith("Bearer "):
+            return None
+        with self._lock:
+            scope, issued_at = self._tokens.get(authorization[len("Bearer "):], (None, None))
+        if scope is None or time.time() - issued_at >= self.token_lifetime:
+            return None
+        return scope
+
+    def _has_session(self, headers):
+        cookies = dict(
+            cookie.strip().split("=", 1) for cookie in headers.get("cookie", "").split(";") if "=" in cookie
+        )
+        with self._lock:
+            return cookies.get(SESSION_COOKIE) in self._sessions
+
+    def _authorize(self, scope):
+        self._token_count += 1
+        token = f"sim-{scope}-{self._token_count}"
+        self._tokens[token] = (scope, time.time())
+        return 200, {"token": token}
+
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id
+
+    def _quote(self, symbol):
+        if symbol not in self.quotes:
+            self.quotes[symbol] = [DEFAULT_BID, DEFAULT_ASK]
+        return self.quotes[symbol]
+
+    def _security_id(self, symbol):
+        if symbol not in self.security_ids:
+            self.security_ids[symbol] = FIRST_SECURITY_ID + len(self.security_ids)
+        return self.security_ids[symbol]
+
+    def _quotes(self, payload):
+        entries = []
+        for symbol in payload.get("Symbols", []):
+            quote = self._quote(symbol)
+            if self.volatility:
+                step = round(self._random.gauss(0, self.volatility), 2)
+                quote[0] = round(max(quote[0] + step, 0.01), 2)
+                quote[1] = round(max(quote[1] + step, quote[0] + 0.01), 2)
+                self._match(symbol)
+            entries.append({
+                "symbol": symbol,
+                "quote": {"bid": f"{quote[0]:.2f}", "ask": f"{quote[1]:.2f}", "last": f"{(quote[0] + quote[1]) / 2:.2f}"}
+            })
+        return 200, {"quotes": entries}
+
+    def _parse_order(self, payload):
+        strategy = payload["OrderStrategy"]
+        # OCO brackets are matched on their limit child; the trailing stop child is not simulated.
+        priced = strategy["ChildOrders"][0] if strategy.get("ChildOrders") else strategy
+        leg = strategy["OrderLegs"][0]
+        side = "Buy" if str(leg["Instruction"]) == "49" else "Sell"
+        order_type = str(priced.get("OrderType", "50"))
+        limit_price = float(priced["LimitPrice"]) if order_type != "49" else None
+        return leg["Instrument"]["Symbol"], side, float(leg["Quantity"]), limit_price, order_type, strategy.get("OrderStrategyType", 1)
+
+    def _order_response(self, order_id, return_code, messages, symbol):
+        return 200, {
+            "orderStrategy": {
+                "orderId": order_id,
+                "orderReturnCode": return_code,
+                "orderMessages": [{"message": message, "severity": return_code} for message in messages],
+                "orderLegs": [{"schwabSecurityId": self._security_id(symbol)}]
+            }
+        }
+
+    def _executable(self, side, limit_price, symbol):
+        bid, ask = self._quote(symbol)
+        return limit_price is not None and ((side == "Buy" and limit_price >= ask) or (side == "Sell" and limit_price <= bid))
+
+    def _order(self, payload, replaces=None):
+        try:
+            symbol, side, qty, limit_price, order_type, strategy_type = self._parse_order(payload)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            return 400, {"Error": {"Code": "BadRequest", "Message": str(e)}}
+        strategy = payload["OrderStrategy"]
+        executable = self._executable(side, limit_price, symbol)
+
+        if payload.get("OrderProcessingControl") == 1:
+            order_id = self._new_id()
+            self._pending[order_id] = payload
+            if executable:
+                return self._order_response(order_id, EXECUTABLE_RETURN_CODE, [EXECUTABLE_MESSAGE], symbol)
+            return self._order_response(order_id, 0, [], symbol)
+
+        order_id = int(strategy.get("OrderId") or 0)
+        if order_id in self._pending:
+            del self._pending[order_id]
+        elif order_id == 0 and strategy["OrderLegs"][0]["Instrument"].get("ItemIssueId") == self.security_ids.get(symbol):
+            order_id = self._new_id() # placed directly with a known security id
+        else:
+            return self._order_response(0, UNKNOWN_ORDER_RETURN_CODE, ["Order not found. Verify the order first."], symbol)
+        if executable and not strategy.get("OrderAffrmIn"):
+            return self._order_response(order_id, AFFIRMATION_RETURN_CODE, [AFFIRMATION_MESSAGE], symbol)
+
+        if replaces is not None:
+            old = self.orders.get(replaces)
+            if old is None or old.status != "Open":
+                return self._order_response(0, UNKNOWN_ORDER_RETURN_CODE, [f"Order {replaces} can not be replaced."], symbol)
+            old.status = "Replaced"
+            old.updated_at = time.time()
+
+        order = SimulatedOrder(order_id, symbol, side, qty, limit_price, order_type, strategy_type)
+        self.orders[order_id] = order
+        if limit_price is None or executable:
+            # marketable orders fill at the market right away
+            bid, ask = self._quote(symbol)
+            self._fill(order, ask if side == "Buy" else bid)
+        return self._order_response(order_id, 0, [], symbol)
+
+    def _replace(self, old_order_id, payload):
+        strategy = payload.get("OrderStrategy", {})
+        try:
+            cancel_order_id = int(strategy.get("CancelOrderId"))
+        except (TypeError, ValueError):
+            cancel_order_id = None
+        if cancel_order_id != old_order_id:
+            message = f"CancelOrderId {strategy.get('CancelOrderId')} does not match order {old_order_id}"
+            return 400, {"Error": {"Code": "BadRequest", "Message": message}}
+        old = self.orders.get(old_order_id)
+        if old is None or old.status != "Open":
+            symbol = strategy.get("OrderLegs", [{}])[0].get("Instrument", {}).get("Symbol")
+            return self._order_response(0, UNKNOWN_ORDER_RETURN_CODE, [f"Order {old_order_id} can not be replaced."], symbol)
+        return self._order(payload, replaces=old_order_id)
+
+    def _match(self, symbol):
+        """
+            Fills the open orders for symbol that the current market crosses.
+        """
+        bid, ask = self._quote(symbol)
+        for order in list(self.orders.values()):
+            if order.symbol != symbol or order.status != "Open":
+                continue
+            # resting limit orders fill at their limit once the market reaches them
+            if (order.side == "Buy" and ask <= order.limit_price) or (order.side == "Sell" and bid >= order.limit_price):
+                self._fill(order, order.limit_price)
+
+    def _fill(self, order, price):
+        order.status = "Filled"
+        order.fill_price = round(price, 4)
+        order.updated_at = time.time()
+        signed_qty = order.qty if order.side == "Buy" else -order.qty
+        self.positions[order.symbol] = self.positions.get(order.symbol, 0) + signed_qty
+        self.cost_basis[order.symbol] = self.cost_basis.get(order.symbol, 0) + signed_qty * order.fill_price
+        self.cash -= signed_qty * order.fill_price
+        self.transactions.append({
+            "Date": datetime.datetime.fromtimestamp(order.updated_at).strftime("%m/%d/%Y"),
+            "Action": order.side,
+            "Symbol": order.symbol,
+            "Description": order.symbol,
+            "Quantity": f"{order.qty:g}",
+            "Price": f"${order.fill_price:.2f}",
+            "Fees & Comm": "",
+            "Amount": ("-" if order.side == "Buy" else "") + f"${order.qty * order.fill_price:.2f}",
+        })
+
+    def _cancel(self, payload):
+        try:
+            order_id = int(payload["Orders"][0]["OrderId"])
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            return 400, {"Error": {"Code": "BadRequest", "Message": str(e)}}
+        order = self.orders.get(order_id)
+        if order is None:
+            return 400, {"Error": {"Code": "OrderNotFound", "Message": f"order {order_id} not found"}}
+
+        if payload.get("OrderProcessingControl") == 1:
+            cancel_order_id = self._new_id()
+            self._pending_cancels[cancel_order_id] = order_id
+            return 200, {"CancelOrderId": cancel_order_id}
+
+        if self._pending_cancels.pop(payload.get("ConfirmCancelOrderId"), None) != order_id:
+            return 400, {"Error": {"Code": "InvalidCancelOrderId", "Message": "verify the cancel first"}}
+        if order.status != "Open":
+            return 200, {"CancelOperationSuccessful": False, "OrderStatus": order.status}
+        order.status = "Canceled"
+        order.updated_at = time.time()
+        return 200, {"CancelOperationSuccessful": True}
+
+    def _orders_list(self, query):
+        today_only = query.get("DateRange", ["All"])[0] == "Today"
+        open_only = query.get("OrderStatusType", ["All"])[0] == "Open"
+        start_of_day = datetime.datetime.combine(datetime.date.today(), datetime.time()).timestamp()
+        orders = []
+        for order in self.orders.values():
+            if today_only and order.placed_at < start_of_day:
+                continue
+            if open_only and order.status != "Open":
+                continue
+            orders.append({"OrderList": [order.as_list_view()]})
+        return 200, {"Orders": orders}
+
+    def _holdings(self):
+        positions = []
+        market_value = 0.0
+        for symbol, qty in self.positions.items():
+            if qty == 0:
+                continue
+            bid, ask = self._quote(symbol)
+            value = qty * bid
+            market_value += value
+            positions.append({
+                "symbolDetail": {"symbol": symbol, "description": symbol},
+                "quantity": qty,
+                "costDetail": {"costBasisDetail": {"costBasis": round(self.cost_basis.get(symbol, 0), 2)}},
+                "priceDetail": {"marketValue": round(value, 2)},
+            })
+        return 200, {
+            "accounts": [{
+                "accountId": str(self.account_id),
+                "groupedPositions": [
+                    {"groupName": "Cash", "positions": []},
+                    {"groupName": "Equities", "positions": positions},
+                ],
+                "totals": {
+                    "marketValue": round(market_value, 2),
+                    "cashInvestments": round(self.cash, 2),
+                    "accountValue": round(market_value + self.cash, 2),
+                    "costBasis": round(sum(self.cost_basis.values()), 2),
+                }
+            }]
+        }
+
+    def _transactions(self):
+        # The export is sorted by date, newest first.
+        return 200, {"BrokerageTransactions": list(reversed(self.transactions))}
+
+
+class _SimulatorRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, like the real gateway
+    # headers and body are written separately; without TCP_NODELAY the body waits for the
+    # client's delayed ACK and every response takes ~40ms longer
+    disable_nagle_algorithm = True
+    simulator: GatewaySimulator = None
+
+    def handle(self):
+        # clients may close a connection without reading the whole response (e.g. a transaction
+        # export read only up to the sync watermark)
+        try:
+            super().handle()
+        except ConnectionError:
+            pass
+
+    def do_GET(self):
+        self._respond("GET")
+
+    def do_POST(self):
+        self._respond("POST")
+
+    def _respond(self, method):
+        parsed = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        headers = {key.lower(): value for key, value in self.headers.items()}
+        try:
+            status, response = self.simulator.handle(method, parsed.path, parse_qs(parsed.query), headers, body)
+        except Exception as e:
+            status, response = 500, {"Error": {"Code": "SimulatorError", "Message": str(e)}}
+        encoded = json.dumps(response).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,142 @@
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+from .token_cache import CachedToken, TOKEN_SCOPES
+
+# Bearer tokens are JWTs of roughly 1-2KB. Each scope gets a fixed size slot.
+MAX_TOKEN_BYTES = 8192
+
+# Layout: an 8 byte sequence counter followed by one slot per scope. Each slot holds the token's
+# issue time (double), its length in bytes (uint32) and the token itself.
+_SEQUENCE = struct.Struct("<Q")
+_SLOT_HEADER = struct.Struct("<dI")
+# Retries before a reader gives up on a board that is being written to.
+_MAX_READ_ATTEMPTS = 100
+# A reader that finds a write in progress first only yields (a write takes microseconds), then
+# sleeps longer each retry up to _MAX_READ_BACKOFF, in case the writer was descheduled mid-write.
+_YIELDING_READ_ATTEMPTS = 16
+_MIN_READ_BACKOFF = 0.00001 # seconds
+_MAX_READ_BACKOFF = 0.001 # seconds
+
+
+class TokenBoard:
+    def __init__(self, name=None, create=False, scopes=TOKEN_SCOPES, max_token_bytes=MAX_TOKEN_BYTES):
+        """
+            The TokenBoard class. Publishes bearer tokens in shared memory so one writer (the
+            subprocess manager) can hand refreshed tokens to any number of processes without
+            sending anything to each of them.
+
+            The board is a sequence lock: the writer makes the sequence counter odd while it
+            writes and even again when it is done. Readers never lock; they copy the slots and
+            retry if the counter was odd or changed while they were copying. The counter doubles
+            as a version number, so checking for new tokens costs one 8 byte read.
+
+            name (str) - The shared memory block to attach to. Required if create is False.
+            create (bool) - Creates a new block (with a generated name if name is None).
+            scopes (tuple) - The token scopes, in slot order. Must match between processes.
+            max_token_bytes (int) - The largest token a slot can hold.
+        """
+        self.scopes = tuple(scopes)
+        self.max_token_bytes = max_token_bytes
+        self._slot_size = _SLOT_HEADER.size + max_token_bytes
+        size = _SEQUENCE.size + self._slot_size * len(self.scopes)
+        self._shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self._owner = create
+        if not create:
+            # Only the creating process should unlink the block. Attaching registers it with the
+            # resource tracker, which would otherwise unlink it when this process exits.
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+        self._buf = self._shm.buf
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def __getstate__(self):
+        return {"name": self.name, "scopes": self.scopes, "max_token_bytes": self.max_token_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state["name"], create=False, scopes=state["scopes"], max_token_bytes=state["max_token_bytes"])
+
+    def version(self):
+        """
+            Returns the current sequence number. Odd while a write is in progress.
+        """
+        return _SEQUENCE.unpack_from(self._buf, 0)[0]
+
+    def publish(self, tokens):
+        """
+            Writes tokens to the board. Only one process may publish to a board.
+
+            tokens (dict) - Maps scope to a CachedToken. Scopes not in tokens keep their value.
+        """
+        for scope, entry in tokens.items():
+            if len(entry.token.encode("utf-8")) > self.max_token_bytes:
+                raise ValueError(f"token for scope '{scope}' is larger than {self.max_token_bytes} bytes")
+
+        sequence = self.version()
+        _SEQUENCE.pack_into(self._buf, 0, sequence + 1)
+        for scope, entry in tokens.items():
+            encoded = entry.token.encode("utf-8")
+            offset = self._slot_offset(scope)
+            _SLOT_HEADER.pack_into(self._buf, offset, entry.issued_at, len(encoded))
+            start = offset + _SLOT_HEADER.size
+            self._buf[start:start + len(encoded)] = encoded
+        _SEQUENCE.pack_into(self._buf, 0, sequence + 2)
+
+    def read(self):
+        """
+            Returns (version, tokens) where tokens maps scope to CachedToken for every scope that
+            has been published.
+        """
+        return self.read_if_newer(None)
+
+    def read_if_newer(self, version):
+        """
+            Returns (version, tokens) like read, or None if the board is still at version.
+            Raises TimeoutError if a write stays in progress for every retry.
+        """
+        for attempt in range(_MAX_READ_ATTEMPTS):
+            if attempt:
+                _backoff(attempt)
+            before = self.version()
+            if before == version:
+                return None
+            if before % 2 == 1: # write in progress
+                continue
+            slots = []
+            for scope in self.scopes:
+                offset = self._slot_offset(scope)
+                issued_at, length = _SLOT_HEADER.unpack_from(self._buf, offset)
+                start = offset + _SLOT_HEADER.size
+                slots.append((scope, issued_at, bytes(self._buf[start:start + min(length, self.max_token_bytes)])))
+            if self.version() != before: # torn read
+                continue
+            tokens = {}
+            for scope, issued_at, encoded in slots:
+                if encoded:
+                    tokens[scope] = CachedToken(encoded.decode("utf-8"), issued_at)
+            return before, tokens
+        raise TimeoutError("token board is continuously being written to")
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+
+    def unlink(self):
+        """
+            Removes the shared memory block. Only the creating process should call this.
+        """
+        if self._owner:
+            self._shm.unlink()
+
+    def _slot_offset(self, scope):
+        return _SEQUENCE.size + self.scopes.index(scope) * self._slot_size
+
+
+def _backoff(attempt):
+    if attempt < _YIELDING_READ_ATTEMPTS:
+        time.sleep(0)
+    else:
+        time.sleep(min(_MIN_READ_BACKOFF * 2 ** (attempt - _YIELDING_READ_ATTEMPTS), _MAX_READ_BACKOFF))
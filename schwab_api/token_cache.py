@@ -0,0 +1,273 @@
+import itertools
+import threading
+import time
+
+# Bearer tokens from https://client.schwab.com/api/auth/authorize/scope/{scope} seem to be
+# good for 1800s (30min).
+TOKEN_LIFETIME = 1800 # seconds
+# Tokens are treated as expired this long before TOKEN_LIFETIME runs out, so a request is never
+# sent with a token that expires while it is in flight.
+DEFAULT_SAFETY_MARGIN = 120 # seconds
+
+# The background refresher renews tokens this long before the request path would consider them
+# stale, so requests never have to wait on a token fetch.
+DEFAULT_REFRESH_LEAD = 60 # seconds
+# Wait time before the background refresher retries after a failed refresh.
+DEFAULT_REFRESH_RETRY_INTERVAL = 10 # seconds
+
+TOKEN_SCOPES = ("api", "update")
+
+
+class CachedToken:
+    def __init__(self, token, issued_at, generation=0):
+        """
+            A bearer token and the time (time.time()) it was issued at.
+
+            generation (int) - Numbers the tokens a TokenCache has held, across scopes: every
+                        token it caches gets a new one. Headers built for a token can be reused
+                        for as long as the cached token has the same generation.
+        """
+        self.token = token
+        self.issued_at = issued_at
+        self.generation = generation
+
+    def __repr__(self) -> str:
+        return f"CachedToken(issued_at={self.issued_at}, generation={self.generation})"
+
+
+class _Flight:
+    def __init__(self):
+        """
+            One in-flight token fetch that concurrent callers wait on.
+        """
+        self.done = threading.Event()
+        self.entry = None
+        self.error = None
+
+
+class TokenCache:
+    def __init__(self, fetch, lifetime=TOKEN_LIFETIME, safety_margin=DEFAULT_SAFETY_MARGIN, clock=time.time):
+        """
+            The TokenCache class. Keeps one bearer token per scope ('api'/'update') and reuses it
+            until safety_margin seconds before it expires, instead of fetching a new token before
+            every request.
+
+            fetch (callable) - Called as fetch(scope) to get a new token for scope.
+            lifetime (number) - Seconds a token is valid for after it is issued.
+            safety_margin (number) - Seconds before expiry at which a token is refreshed.
+            clock (callable) - Returns the current time in seconds.
+        """
+        self._fetch = fetch
+        self.lifetime = lifetime
+        self.safety_margin = safety_margin
+        self._clock = clock
+        self._tokens = {} # scope -> CachedToken
+        self._lock = threading.Lock()
+        self._in_flight = {} # scope -> _Flight
+        self._generations = itertools.count(1)
+        self.board = None
+        self._board_version = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["_in_flight"] = {}
+        state["_generations"] = max((entry.generation for entry in self._tokens.values()), default=0)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._generations = itertools.count(state["_generations"] + 1)
+
+    def get(self, scope):
+        """
+            Returns a token for scope, fetching a new one only if there is no cached token or the
+            cached one is within the safety margin of expiring.
+        """
+        return self.get_entry(scope).token
+
+    def get_entry(self, scope):
+        """
+            Like get, but returns the CachedToken, so the caller also knows its generation.
+        """
+        if self.board is not None:
+            try:
+                self._pull_board()
+            except TimeoutError:
+                # The writer is stuck mid-write. A fresh cached token is still good, but a stale
+                # one may be older than one the writer has published, so it is not used in its place.
+                entry = self._tokens.get(scope)
+                if entry is None or self._is_stale(entry):
+                    raise
+                return entry
+        entry = self._tokens.get(scope)
+        if entry is None:
+            return self._refresh_entry(scope, None)
+        if self._is_stale(entry):
+            return self._refresh_entry(scope, entry.token)
+        return entry
+
+    def refresh(self, scope, stale_token=None):
+        """
+            Fetches, caches and returns a new token for scope regardless of the cached one.
+
+            Concurrent refreshes of the same scope are collapsed into one fetch: the first caller
+            sends the request and every other caller waits for and returns its token (or raises
+            its error).
+
+            stale_token (str) - The token the caller found to be rejected. If the cached token is
+                        already a different one, another caller refreshed it in the meantime and
+                        it is returned without fetching again.
+        """
+        return self._refresh_entry(scope, stale_token).token
+
+    def _refresh_entry(self, scope, stale_token):
+        with self._lock:
+            entry = self._tokens.get(scope)
+            if stale_token is not None and entry is not None and entry.token != stale_token:
+                return entry
+            flight = self._in_flight.get(scope)
+            is_leader = flight is None
+            if is_leader:
+                flight = _Flight()
+                self._in_flight[scope] = flight
+
+        if not is_leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.entry
+
+        try:
+            flight.entry = self.put(scope, self._fetch(scope))
+            return flight.entry
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[scope]
+            flight.done.set()
+
+    def attach_board(self, board):
+        """
+            Makes get() pick up tokens published to board (a TokenBoard) by another process.
+            Tokens on the board replace cached ones only if they were issued later.
+        """
+        self.board = board
+        self._board_version = None
+
+    def _pull_board(self):
+        # raises TimeoutError if the board stays mid-write
+        update = self.board.read_if_newer(self._board_version)
+        if update is None:
+            return
+        with self._lock:
+            self._board_version, tokens = update
+            for scope, entry in tokens.items():
+                current = self._tokens.get(scope)
+                if current is None or entry.issued_at > current.issued_at:
+                    self._tokens[scope] = CachedToken(entry.token, entry.issued_at, next(self._generations))
+
+    def put(self, scope, token, issued_at=None):
+        """
+            Caches token for scope and returns its CachedToken. If issued_at is not given the
+            token is assumed to be new. Passing None as the token drops the cached token for scope.
+        """
+        if token is None:
+            self.invalidate(scope)
+            return None
+        # Replacing the whole entry publishes the token, its issue time and its generation in one
+        # step, so readers never see a new token with an old issue time.
+        with self._lock:
+            entry = self._tokens[scope] = CachedToken(token, self._clock() if issued_at is None else issued_at, next(self._generations))
+        return entry
+
+    def peek(self, scope):
+        """
+            Returns the cached CachedToken for scope (or None) without fetching.
+        """
+        return self._tokens.get(scope)
+
+    def invalidate(self, scope=None):
+        """
+            Drops the cached token for scope, or for every scope if scope is None.
+        """
+        with self._lock:
+            if scope is None:
+                self._tokens.clear()
+            else:
+                self._tokens.pop(scope, None)
+
+    def expires_at(self, scope):
+        """
+            Returns the time the cached token for scope should be refreshed by (expiry minus the
+            safety margin), or None if there is no cached token.
+        """
+        entry = self._tokens.get(scope)
+        if entry is None:
+            return None
+        return entry.issued_at + self.lifetime - self.safety_margin
+
+    def seconds_until_refresh(self, scope, lead=0):
+        """
+            Returns the seconds until the cached token for scope should be refreshed, lead
+            seconds early. Returns 0 if it is already due or there is no cached token.
+        """
+        refresh_at = self.expires_at(scope)
+        if refresh_at is None:
+            return 0
+        return max(refresh_at - lead - self._clock(), 0)
+
+    def needs_refresh(self, scope):
+        entry = self._tokens.get(scope)
+        return entry is None or self._is_stale(entry)
+
+    def _is_stale(self, entry):
+        return self._clock() >= entry.issued_at + self.lifetime - self.safety_margin
+
+
+class TokenRefresher(threading.Thread):
+    def __init__(self, cache, scopes=TOKEN_SCOPES, refresh_lead=DEFAULT_REFRESH_LEAD, retry_interval=DEFAULT_REFRESH_RETRY_INTERVAL):
+        """
+            The TokenRefresher class. A daemon thread that renews the tokens in cache for each
+            scope refresh_lead seconds before the request path would refresh them itself, so
+            token fetches are kept off the order path.
+
+            cache (TokenCache) - The cache to keep fresh. Refreshes go through cache.refresh, so
+                        they are collapsed with any refresh a request triggers at the same time.
+            scopes (iterable) - The token scopes to keep fresh.
+            refresh_lead (number) - Seconds before the cache's own refresh point to renew a token.
+            retry_interval (number) - Seconds to wait before retrying after a failed refresh.
+        """
+        super(TokenRefresher, self).__init__(name="TokenRefresher")
+        self.daemon = True
+        self.cache = cache
+        self.scopes = tuple(scopes)
+        self.refresh_lead = refresh_lead
+        self.retry_interval = retry_interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            failed = False
+            for scope in self.scopes:
+                if self.cache.seconds_until_refresh(scope, self.refresh_lead) > 0:
+                    continue
+                try:
+                    self.cache.refresh(scope)
+                except Exception as e:
+                    failed = True
+                    print(f"[TokenRefresher] failed to refresh '{scope}' token: {e}")
+            if failed:
+                wait = self.retry_interval
+            else:
+                wait = min(self.cache.seconds_until_refresh(scope, self.refresh_lead) for scope in self.scopes)
+            # Never spin, even if refresh_lead is longer than a token's lifetime.
+            self._stop_event.wait(max(wait, 1))
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
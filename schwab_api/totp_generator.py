@@ -1,11 +1,13 @@
 import base64
-from vipaccess import provision as vp
 
 def generate_totp():
     """ Generates an authentication pair of Symantec VIP ID, and TOTP Secret
 
     :rtype: (str, str)
     """
+    # Only needed once, to provision the secret, so it is not imported with schwab_api.
+    from vipaccess import provision as vp
+
     request = vp.generate_request()
     session = vp.requests.Session()
     response = vp.get_provisioning_response(request, session)
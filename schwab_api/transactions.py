@@ -0,0 +1,251 @@
+import datetime
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from .records import Transaction
+
+# Transaction categories requested by the export.
+TRANSACTION_TYPES = (
+    "Adjustments",
+    "AtmActivity",
+    "BillPay",
+    "CorporateActions",
+    "Checks",
+    "Deposits",
+    "DividendsAndCapitalGains",
+    "ElectronicTransfers",
+    "Fees",
+    "Interest",
+    "Misc",
+    "SecurityTransfers",
+    "Taxes",
+    "Trades",
+    "VisaDebitCard",
+    "Withdrawals",
+)
+TRANSACTIONS_KEY = "BrokerageTransactions"
+DEFAULT_CHUNK_SIZE = 64 * 1024 # bytes read from the export at a time
+SYNC_BATCH_SIZE = 1000 # rows written per SQLite transaction while syncing
+
+_NON_SPACE = re.compile(rb"\S")
+# A complete JSON string, a brace, or the quote opening a string that has not fully arrived yet.
+_OBJECT_TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[{}"]')
+
+
+def transaction_export_request(account_id, time_frame="All"):
+    """
+        Returns the body of a transaction history export request, newest transactions first.
+    """
+    return {
+        "timeFrame": time_frame,
+        "selectedTransactionTypes": list(TRANSACTION_TYPES),
+        "exportType": "Json",
+        "selectedAccountId": str(account_id),
+        "sortColumn": "Date",
+        "sortDirection": "Descending"
+    }
+
+
+def iter_json_array(chunks, key):
+    """
+        Incrementally parses a JSON document arriving in chunks (bytes) and yields the raw bytes
+        of each object in the array under key, as soon as the object is complete. Only the
+        object being read is kept in memory, so the caller can decode each one and stop early
+        without reading the rest of the document.
+
+        Yields nothing if the document has no such key.
+    """
+    opening = re.compile(b'"' + re.escape(key.encode("utf-8")) + rb'"\s*:\s*\[')
+    chunks = iter(chunks)
+    buffer = b""
+    for chunk in chunks:
+        buffer += chunk
+        match = opening.search(buffer)
+        if match:
+            break
+    else:
+        return
+
+    pos = match.end()
+    start = None # where the object being read starts in buffer
+    depth = 0
+    while True:
+        while pos < len(buffer):
+            if depth == 0:
+                match = _NON_SPACE.search(buffer, pos)
+                if match is None:
+                    pos = len(buffer)
+                    continue
+                char = buffer[match.start()]
+                pos = match.end()
+                if char == 0x5d: # ]
+                    return
+                if char == 0x7b: # {
+                    start = match.start()
+                    depth = 1
+                elif char != 0x2c: # ,
+                    raise ValueError(f"expected an object in '{key}', found {bytes([char])!r}")
+                continue
+            match = _OBJECT_TOKEN.search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                continue
+            token = match.group()
+            if token == b'"': # the rest of the string is in the next chunk
+                pos = match.start()
+                break
+            pos = match.end()
+            if token == b"{":
+                depth += 1
+            elif token == b"}":
+                depth -= 1
+                if depth == 0:
+                    yield buffer[start:pos]
+                    start = None
+
+        # drop what has been read, then read more
+        cut = pos if start is None else start
+        buffer = buffer[cut:]
+        pos -= cut
+        if start is not None:
+            start = 0
+        chunk = next(chunks, None)
+        if chunk is None:
+            raise ValueError(f"the JSON document ended inside '{key}'")
+        buffer += chunk
+
+
+def _fingerprint(entry):
+    return hashlib.sha1(json.dumps(entry, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class TransactionStore:
+    def __init__(self, path):
+        """
+            The TransactionStore class. An append-only SQLite copy of the transaction history of
+            one or more accounts, so daily P&L does not need the whole export every time.
+
+            sync(api, account_id) streams the export (newest first) and stops reading as soon as
+            it reaches transactions older than the account's watermark (the newest date already
+            stored). Transactions on the watermark date are read again and deduplicated, since
+            more may have posted that day after the last sync.
+
+            The export has no transaction ids, so a transaction is identified by its date, a hash
+            of its fields and its occurrence among identical transactions that day (two identical
+            buys on the same day are two rows).
+
+            path (str) - The SQLite database file (':memory:' for a temporary store).
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS transactions (
+                account_id TEXT NOT NULL,
+                date TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                occurrence INTEGER NOT NULL,
+                action TEXT,
+                symbol TEXT,
+                quantity REAL,
+                price REAL,
+                amount REAL,
+                entry TEXT NOT NULL,
+                synced_at REAL NOT NULL,
+                PRIMARY KEY (account_id, date, fingerprint, occurrence)
+            );
+            CREATE INDEX IF NOT EXISTS transactions_by_symbol ON transactions (account_id, symbol, date);
+            CREATE TABLE IF NOT EXISTS watermarks (
+                account_id TEXT PRIMARY KEY,
+                date TEXT NOT NULL,
+                synced_at REAL NOT NULL
+            );
+        """)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def watermark(self, account_id):
+        """
+            Returns the date (datetime.date) of the newest stored transaction of account_id, or
+            None if the account was never synced.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT date FROM watermarks WHERE account_id = ?", (str(account_id),)).fetchone()
+        return None if row is None else datetime.date.fromisoformat(row[0])
+
+    def sync(self, api, account_id):
+        """
+            Appends the transactions of account_id that are not stored yet, using api (a Schwab
+            instance). Returns the number of transactions added.
+
+            Rows are written in batches while the export streams in. The watermark only moves
+            once the export was read up to it, so a sync that fails part way is completed by the
+            next one.
+        """
+        watermark = self.watermark(account_id)
+        occurrences = {} # (date, fingerprint) -> identical transactions seen so far
+        rows = []
+        added = 0
+        newest = watermark
+        transactions = api.iter_transaction_history_v2(account_id)
+        try:
+            for transaction in transactions:
+                if transaction.date is None:
+                    continue
+                if watermark is not None and transaction.date < watermark:
+                    break # sorted newest first; the rest is stored already
+                fingerprint = _fingerprint(transaction.entry)
+                key = (transaction.date, fingerprint)
+                occurrences[key] = occurrences.get(key, 0) + 1
+                rows.append((
+                    str(account_id), transaction.date.isoformat(), fingerprint, occurrences[key],
+                    transaction.action, transaction.symbol, transaction.quantity, transaction.price,
+                    transaction.amount, json.dumps(transaction.entry), time.time()
+                ))
+                if newest is None or transaction.date > newest:
+                    newest = transaction.date
+                if len(rows) >= SYNC_BATCH_SIZE:
+                    added += self._insert(rows)
+                    rows = []
+        finally:
+            transactions.close()
+
+        added += self._insert(rows)
+        if newest is not None:
+            with self._lock, self._db:
+                self._db.execute("INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?)", (str(account_id), newest.isoformat(), time.time()))
+        return added
+
+    def _insert(self, rows):
+        with self._lock, self._db:
+            before = self._db.total_changes
+            self._db.executemany("INSERT OR IGNORE INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            return self._db.total_changes - before
+
+    def transactions(self, account_id, since=None, symbol=None):
+        """
+            Returns the stored Transactions of account_id, newest first, optionally only those
+            on or after since (datetime.date) and/or of symbol.
+        """
+        query = "SELECT entry FROM transactions WHERE account_id = ?"
+        params = [str(account_id)]
+        if since is not None:
+            query += " AND date >= ?"
+            params.append(since.isoformat())
+        if symbol is not None:
+            query += " AND symbol = ?"
+            params.append(symbol)
+        query += " ORDER BY date DESC, rowid"
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [Transaction.from_entry(json.loads(row[0])) for row in rows]
+
+    def count(self, account_id):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM transactions WHERE account_id = ?", (str(account_id),)).fetchone()[0]
@@ -0,0 +1,107 @@
+import socket
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+# Defaults for the gateway connection pool. The strategy code runs a handful of threads per
+# process (quote loop, buy thread, sell thread), so a small number of pooled connections per
+# host is enough to keep every one of them on an already-open TLS connection.
+DEFAULT_POOL_CONNECTIONS = 4  # number of hosts to keep pools for
+DEFAULT_POOL_MAXSIZE = 16     # connections kept open per host
+DEFAULT_KEEP_ALIVE_IDLE = 30  # seconds of idle time before the OS sends TCP keep-alive probes
+DEFAULT_KEEP_ALIVE_INTERVAL = 10 # seconds between TCP keep-alive probes
+
+
+def keep_alive_socket_options(keep_alive=True, keep_alive_idle=DEFAULT_KEEP_ALIVE_IDLE, keep_alive_interval=DEFAULT_KEEP_ALIVE_INTERVAL):
+    """
+        Returns the socket options used for pooled connections.
+
+        The urllib3 defaults (TCP_NODELAY) are always kept. When keep_alive is set, TCP keep-alive
+        probes are enabled so idle pooled connections are not silently dropped by the gateway's
+        load balancer between scraper loop iterations. Platform specific options are only added
+        where the OS supports them.
+    """
+    options = list(HTTPConnection.default_socket_options)
+    if not keep_alive:
+        return options
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, int(keep_alive_idle)))
+    elif hasattr(socket, "TCP_KEEPALIVE"): # macOS
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, int(keep_alive_idle)))
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, int(keep_alive_interval)))
+    return options
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """
+        HTTPAdapter that applies keep-alive socket options to every pooled connection.
+    """
+    __attrs__ = HTTPAdapter.__attrs__ + ["_socket_options"]
+
+    def __init__(self, socket_options=None, **kwargs):
+        # init_poolmanager is called from HTTPAdapter.__init__, so this has to be set first.
+        self._socket_options = socket_options if socket_options is not None else keep_alive_socket_options()
+        super(KeepAliveAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = self._socket_options
+        super(KeepAliveAdapter, self).init_poolmanager(*args, **kwargs)
+
+
+class GatewayTransport:
+    def __init__(
+            self,
+            pool_connections=DEFAULT_POOL_CONNECTIONS,
+            pool_maxsize=DEFAULT_POOL_MAXSIZE,
+            pool_block=False,
+            keep_alive=True,
+            keep_alive_idle=DEFAULT_KEEP_ALIVE_IDLE,
+            keep_alive_interval=DEFAULT_KEEP_ALIVE_INTERVAL
+            ):
+        """
+            The GatewayTransport class. One pooled, keep-alive HTTP transport shared by every
+            gateway call so requests reuse open TCP + TLS connections instead of paying a new
+            handshake each time.
+
+            pool_connections (int) - The number of per-host connection pools to keep.
+            pool_maxsize (int) - The maximum number of connections kept open per host. Should be
+                        at least the number of threads making requests concurrently.
+            pool_block (bool) - If True, requests wait for a free pooled connection instead of
+                        opening (and then discarding) an extra one when the pool is exhausted.
+            keep_alive (bool) - Enables TCP keep-alive probes on pooled connections.
+            keep_alive_idle (int) - Seconds a connection is idle before keep-alive probes start.
+            keep_alive_interval (int) - Seconds between keep-alive probes.
+        """
+        self.adapter = KeepAliveAdapter(
+            socket_options=keep_alive_socket_options(keep_alive, keep_alive_idle, keep_alive_interval),
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block
+        )
+        # Gateway requests authenticate with the bearer token in the headers. A separate session
+        # keeps the client.schwab.com cookie jar out of these requests, same as the module level
+        # requests.post/requests.get calls this replaces.
+        self.session = requests.Session()
+        self.mount(self.session)
+
+    def mount(self, session):
+        """
+            Routes all of session's requests through this transport's connection pools.
+        """
+        session.mount("https://", self.adapter)
+        session.mount("http://", self.adapter)
+
+    def request(self, method, url, **kwargs):
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.session.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.session.post(url, **kwargs)
+
+    def close(self):
+        self.session.close()
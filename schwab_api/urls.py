@@ -1,48 +1,66 @@
+# Hosts for the new gateway API and the client site. set_base_urls points them somewhere else,
+# e.g. at a GatewaySimulator for offline benchmarks and tests.
+DEFAULT_GATEWAY_BASE = "https://ausgateway.schwab.com"
+DEFAULT_CLIENT_BASE = "https://client.schwab.com"
+GATEWAY_BASE = DEFAULT_GATEWAY_BASE
+CLIENT_BASE = DEFAULT_CLIENT_BASE
+
+def set_base_urls(gateway=None, client=None):
+    """
+    Sets the hosts used by every url below. None resets a host to its default.
+    """
+    global GATEWAY_BASE, CLIENT_BASE
+    GATEWAY_BASE = (gateway or DEFAULT_GATEWAY_BASE).rstrip("/")
+    CLIENT_BASE = (client or DEFAULT_CLIENT_BASE).rstrip("/")
+
 
 def homepage():
     return "https://www.schwab.com/"
 
 def account_summary():
-    return "https://client.schwab.com/clientapps/accounts/summary/"
+    return CLIENT_BASE + "/clientapps/accounts/summary/"
 
 def trade_ticket():
-    return "https://client.schwab.com/app/trade/tom/#/trade"
+    return CLIENT_BASE + "/app/trade/tom/#/trade"
 
 # New API
 def order_verification_v2(order_id = None):
     param = ("" if order_id == None else ("/"+str(order_id)))
-    return "https://ausgateway.schwab.com/api/is.TradeOrderManagementWeb/v1/TradeOrderManagementWebPort/orders" + param
+    return GATEWAY_BASE + "/api/is.TradeOrderManagementWeb/v1/TradeOrderManagementWebPort/orders" + param
 
 def account_info_v2():
-    return "https://ausgateway.schwab.com/api/is.TradeOrderManagementWeb/v1/TradeOrderManagementWebPort/customer/accounts"
+    return GATEWAY_BASE + "/api/is.TradeOrderManagementWeb/v1/TradeOrderManagementWebPort/customer/accounts"
 
 def positions_v2():
-    return "https://ausgateway.schwab.com/api/is.Holdings/V1/Holdings/Holdings?=&includeCostBasis=true&includeRatings=true&includeUnderlyingOption=true"
+    return GATEWAY_BASE + "/api/is.Holdings/V1/Holdings/Holdings?=&includeCostBasis=true&includeRatings=true&includeUnderlyingOption=true"
 
 def ticker_quotes_v2():
-    return "https://ausgateway.schwab.com/api/is.TradeOrderManagementWeb/v1/TradeOrderManagementWebPort/market/quotes/list"
+    return GATEWAY_BASE + "/api/is.TradeOrderManagementWeb/v1/TradeOrderManagementWebPort/market/quotes/list"
 
 def orders_v2():
-    return "https://ausgateway.schwab.com/api/is.TradeOrderStatusWeb/ITradeOrderStatusWeb/ITradeOrderStatusWebPort/orders/listView?DateRange=All&OrderStatusType=Open&SecurityType=AllSecurities&Type=All&ShowAdvanceOrder=true&SortOrder=Ascending&SortColumn=Status&CostMethod=M&IsSimOrManagedAccount=false&EnableDateFilterByActivity=true"
+    return GATEWAY_BASE + "/api/is.TradeOrderStatusWeb/ITradeOrderStatusWeb/ITradeOrderStatusWebPort/orders/listView?DateRange=All&OrderStatusType=Open&SecurityType=AllSecurities&Type=All&ShowAdvanceOrder=true&SortOrder=Ascending&SortColumn=Status&CostMethod=M&IsSimOrManagedAccount=false&EnableDateFilterByActivity=true"
 
 def todays_orders_v2(): # setting OrderStatusType to Open or Filled does not work. site uses all, and a local filter.
-    return "https://ausgateway.schwab.com/api/is.TradeOrderStatusWeb/ITradeOrderStatusWeb/ITradeOrderStatusWebPort/orders/listView?DateRange=Today&OrderStatusType=All&SecurityType=AllSecurities&Type=All&ShowAdvanceOrder=true&SortOrder=Ascending&SortColumn=Status&CostMethod=M&IsSimOrManagedAccount=false&EnableDateFilterByActivity=true"
+    return GATEWAY_BASE + "/api/is.TradeOrderStatusWeb/ITradeOrderStatusWeb/ITradeOrderStatusWebPort/orders/listView?DateRange=Today&OrderStatusType=All&SecurityType=AllSecurities&Type=All&ShowAdvanceOrder=true&SortOrder=Ascending&SortColumn=Status&CostMethod=M&IsSimOrManagedAccount=false&EnableDateFilterByActivity=true"
 
 def cancel_order_v2():
-    return "https://ausgateway.schwab.com/api/is.TradeOrderStatusWeb/ITradeOrderStatusWeb/ITradeOrderStatusWebPort/orders/cancelorder"
+    return GATEWAY_BASE + "/api/is.TradeOrderStatusWeb/ITradeOrderStatusWeb/ITradeOrderStatusWebPort/orders/cancelorder"
 
 def transaction_history_v2():
-    return "https://ausgateway.schwab.com/api/is.TransactionHistoryWeb/TransactionHistoryInterface/TransactionHistory/brokerage/transactions/export"
+    return GATEWAY_BASE + "/api/is.TransactionHistoryWeb/TransactionHistoryInterface/TransactionHistory/brokerage/transactions/export"
 
 def replace_order_v2(order_id):
-    return "https://ausgateway.schwab.com/api/is.TradeOrderManagementWeb/v1/TradeOrderManagementWebPort/orders/"+str(order_id)
+    return GATEWAY_BASE + "/api/is.TradeOrderManagementWeb/v1/TradeOrderManagementWebPort/orders/"+str(order_id)
+
+def authorize_scope(scope):
+    return CLIENT_BASE + "/api/auth/authorize/scope/" + scope
 
 # Old API
 def positions_data():
-    return "https://client.schwab.com/api/PositionV2/PositionsDataV2"
+    return CLIENT_BASE + "/api/PositionV2/PositionsDataV2"
 
 def order_verification():
-    return "https://client.schwab.com/api/ts/stamp/verifyOrder"
+    return CLIENT_BASE + "/api/ts/stamp/verifyOrder"
 
 def order_confirmation():
-    return "https://client.schwab.com/api/ts/stamp/confirmorder"
+    return CLIENT_BASE + "/api/ts/stamp/confirmorder"
@@ -0,0 +1,376 @@
+import asyncio
+import concurrent.futures
+import functools
+import json
+import threading
+import time
+
+from tools.terminal_colors import TermColor
+from tools import logger
+from schwab_api import Schwab, AsyncSchwab
+from schwab_api.fill_tracker import FillTracker, Fill
+from schwab_api.quote_service import QuoteService
+from strategy.spread_scraper_subprocess import (
+    getBuySellPriceAdjustmentsFromProfitMargin,
+    LOOP_MINIMUM_RUNTIME,
+    LOOP_MINIMUM_RUNTIME_W_OCO,
+    HOLDINGS_RECHECK_INTERVAL,
+    OVERSOLD_ERROR_PARTIAL_STRING
+)
+
+
+QUOTE_POLL_INTERVAL = LOOP_MINIMUM_RUNTIME # seconds between batched quote requests
+QUOTE_MAX_INTERVAL = 4 * QUOTE_POLL_INTERVAL # seconds between quotes for a ticker whose quote is not moving
+FILLS_MAX_AGE = LOOP_MINIMUM_RUNTIME_W_OCO / 2 # seconds a poll of today's orders is reused between OCO tickers
+
+
+class SharedQuotePoller():
+    def __init__(self, api: AsyncSchwab, account_id):
+        """
+            Wakes up each ticker's task when the engine's QuoteService delivers a new quote for it.
+            Quotes for every running ticker are polled together, one quote_v2 request per tick.
+        """
+        self.api = api
+        self.quoteService = QuoteService(account_id, min_interval=QUOTE_POLL_INTERVAL, max_interval=QUOTE_MAX_INTERVAL)
+        self.subscriptions: dict[str, tuple] = {} # ticker -> (QuoteSubscription, asyncio.Event)
+
+    def subscribe(self, ticker):
+        newQuote = asyncio.Event()
+        subscription = self.quoteService.subscribe(ticker, lambda symbol, quote: newQuote.set())
+        self.subscriptions[ticker] = (subscription, newQuote)
+
+    def unsubscribe(self, ticker):
+        subscription, newQuote = self.subscriptions.pop(ticker)
+        self.quoteService.unsubscribe(subscription)
+
+    async def getBidAsk(self, ticker):
+        # wait for the next quote, so each ticker trades on a quote newer than its last one
+        subscription, newQuote = self.subscriptions[ticker]
+        newQuote.clear()
+        await newQuote.wait()
+        quote, receivedTime, version = self.quoteService.latest(ticker)
+        return quote.bid, quote.ask
+
+    async def run(self):
+        await self.quoteService.run_async(self.api)
+
+
+class SpreadScraperTask():
+    def __init__(self, engine, account_id, ticker, qty, profitMargin, minBASpread, maintainedEquity, timeBeforeCancel=None, trailingStopDollars=None):
+        """
+            One ticker's scraping loop (runSpreadScraperSubprocess, or
+            runSpreadScraperSubprocessOCOwTrailingStop if trailingStopDollars is set) as a task on
+            the engine's event loop. Order state is kept per ticker instead of in module globals,
+            and equity follows the fills published by the engine's shared FillTracker.
+        """
+        self.engine: SpreadScraperEngine = engine
+        self.api: AsyncSchwab = engine.api
+        self.pipeWithDiscord = engine.pipeWithDiscord
+        self.account_id = account_id
+        self.ticker = ticker
+        self.qty = qty
+        self.minBASpread = minBASpread
+        self.maintainedEquity = maintainedEquity
+        self.timeBeforeCancel = timeBeforeCancel
+        self.trailingStopDollars = trailingStopDollars
+        self.buyPriceAdjustment, self.sellPriceAdjustment = getBuySellPriceAdjustmentsFromProfitMargin(profitMargin)
+
+        self.currentEquity = maintainedEquity
+        self.workingBuyOrderId = None
+        self.workingSellOrderId = None
+        self.isStopping = False
+
+    async def run(self):
+        print(TermColor.makeWarning("[WARNING] NOTE condition: need " + str(self.maintainedEquity) + " shares before start.."))
+        self.engine.quotePoller.subscribe(self.ticker)
+        fillSubscription = self.engine.fillTracker.subscribe(self.onFill, self.ticker)
+        try:
+            if self.trailingStopDollars == None:
+                await self.runScraper()
+            else:
+                await self.runScraperOCOwTrailingStop()
+        finally:
+            self.engine.fillTracker.unsubscribe(fillSubscription)
+            self.engine.quotePoller.unsubscribe(self.ticker)
+        self.pipeWithDiscord.send({
+            "stopProcessSuccess": self.ticker
+        })
+
+    def stop(self):
+        self.isStopping = True
+
+    def onFill(self, fill: Fill):
+        self.currentEquity += fill.signed_qty
+        print(TermColor.makeWarning(f'[DEBUG] [{self.ticker}] {fill.action} order {fill.order_id} filled at {fill.price} (eq={self.currentEquity})'))
+
+    async def runScraper(self):
+        while True:
+            loopStartTime = time.time()
+
+            # stop task if done
+            if self.isStopping and self.currentEquity == self.maintainedEquity and self.workingBuyOrderId == None and self.workingSellOrderId == None:
+                return
+
+            try:
+                bid, ask = await self.engine.quotePoller.getBidAsk(self.ticker)
+                avgOfSpread = round((ask + bid)/2, 2)
+
+                newBuyPrice = avgOfSpread - self.buyPriceAdjustment
+                newSellPrice = avgOfSpread + self.sellPriceAdjustment
+
+                # if (should NOT initiate new scrape trade, due to BA spread being too small): then skip to the next quote
+                if self.currentEquity == self.maintainedEquity and ask - bid < self.minBASpread:
+                    continue
+
+                investmentStartTime = time.time()
+
+                # send sell and buy at the same time
+                orders = []
+                if ((self.isStopping and self.currentEquity > self.maintainedEquity) or ((not self.isStopping) and self.currentEquity > 0)) and self.workingSellOrderId == None:
+                    print(TermColor.makeWarning(f'[DEBUG] [{self.ticker}] sending sell (eq={self.currentEquity})...'))
+                    orders.append(self.sell(newSellPrice))
+                if ((self.isStopping and self.currentEquity < self.maintainedEquity) or ((not self.isStopping) and self.currentEquity <= self.maintainedEquity)) and self.workingBuyOrderId == None:
+                    print(TermColor.makeWarning(f'[DEBUG] [{self.ticker}] sending buy (eq={self.currentEquity})...'))
+                    orders.append(self.buy(newBuyPrice))
+                await asyncio.gather(*orders)
+
+                # DELAY
+                secondsInvested = time.time() - investmentStartTime
+                if secondsInvested < self.timeBeforeCancel:
+                    await asyncio.sleep(self.timeBeforeCancel - secondsInvested)
+
+                # cancel buy and sell at the same time
+                cancels = []
+                if self.workingBuyOrderId != None:
+                    cancels.append(self.cancelBuy(newBuyPrice))
+                if self.workingSellOrderId != None:
+                    cancels.append(self.cancelSell(newSellPrice))
+                await asyncio.gather(*cancels)
+
+            except Exception as e:
+                logger.logError("failed managing scraping trades: " + str(e), self.ticker, self.pipeWithDiscord)
+
+            #####################
+            # runtime management
+            timeDiffSecs = time.time() - loopStartTime
+            if timeDiffSecs < LOOP_MINIMUM_RUNTIME:
+                await asyncio.sleep(LOOP_MINIMUM_RUNTIME - timeDiffSecs)
+
+    async def runScraperOCOwTrailingStop(self):
+        while not self.isStopping:
+            loopStartTime = time.time()
+
+            try:
+                positionCount = await self.engine.getPositionCount(self.account_id, self.ticker)
+                if positionCount == None:
+                    logger.logError("no position count found in positions for ticker \"" + self.ticker + "\"", self.ticker, self.pipeWithDiscord)
+                elif positionCount == self.maintainedEquity:
+                    bid, ask = await self.engine.quotePoller.getBidAsk(self.ticker)
+
+                    # only initiate a new scrape trade if the BA spread is big enough
+                    if ask - bid >= self.minBASpread:
+                        avgOfSpread = round((ask + bid)/2, 2)
+
+                        newBuyPrice = avgOfSpread - self.buyPriceAdjustment
+                        newSellPrice = avgOfSpread + self.sellPriceAdjustment
+
+                        print(TermColor.makeWarning(f'[DEBUG] [{self.ticker}] sending BUY and SELL with OCO Trailing Stop'))
+                        await asyncio.gather(self.buyOCOwTrailingStop(newBuyPrice), self.sellOCOwTrailingStop(newSellPrice))
+
+            except Exception as e:
+                logger.logError("failed managing scraping trades with OCO: " + str(e), self.ticker, self.pipeWithDiscord)
+
+            #####################
+            # runtime management
+            timeDiffSecs = time.time() - loopStartTime
+            if timeDiffSecs < LOOP_MINIMUM_RUNTIME_W_OCO:
+                await asyncio.sleep(LOOP_MINIMUM_RUNTIME_W_OCO - timeDiffSecs)
+
+    async def buy(self, price):
+        try:
+            messages, success, buyOrderId = await self.api.trade_v2_limit_buy_order(self.ticker, self.qty, self.account_id, price)
+            if success:
+                self.workingBuyOrderId = buyOrderId
+            else:
+                logger.logError("failed to send BUY. Messages: " + str(messages), self.ticker, self.pipeWithDiscord)
+        except Exception as e:
+            logger.logError("error while sending BUY: " + str(e), self.ticker, self.pipeWithDiscord)
+
+    async def sell(self, price):
+        try:
+            messages, success, sellOrderId = await self.api.trade_v2_limit_sell_order(self.ticker, self.qty, self.account_id, price)
+            if success:
+                self.workingSellOrderId = sellOrderId
+            elif any(OVERSOLD_ERROR_PARTIAL_STRING in str(message) for message in messages):
+                logger.logError(f'failed to send SELL. Would cause negative position. current equity: {self.currentEquity}', self.ticker, self.pipeWithDiscord)
+            else:
+                logger.logError("failed to send SELL. Messages: " + str(messages), self.ticker, self.pipeWithDiscord)
+        except Exception as e:
+            logger.logError("error while sending SELL: " + str(e), self.ticker, self.pipeWithDiscord)
+
+    async def cancelBuy(self, price):
+        messages, success = await self.api.cancel_limit_order_v2(self.account_id, self.workingBuyOrderId, self.ticker, "Buy", price, self.qty)
+        if success or await self.cancelFailedOnClosedOrder(messages, "BUY", self.workingBuyOrderId):
+            self.workingBuyOrderId = None
+
+    async def cancelSell(self, price):
+        messages, success = await self.api.cancel_limit_order_v2(self.account_id, self.workingSellOrderId, self.ticker, "Sell", price, self.qty)
+        if success or await self.cancelFailedOnClosedOrder(messages, "SELL", self.workingSellOrderId):
+            self.workingSellOrderId = None
+
+    async def cancelFailedOnClosedOrder(self, messages, side, orderId):
+        # failed to cancel - most likely the order filled first. Unless the gateway rejected the request
+        # itself, check today's orders (one poll shared by every ticker asking at the same time) instead
+        # of assuming; the fill itself is counted by onFill
+        print(TermColor.makeWarning(f'[DEBUG] [{self.ticker}] failed to cancel {side} order. Messages: {messages}'))
+        messageCode = None
+        try:
+            messageCode = json.loads(messages[0])["Error"]["Code"]
+        except Exception as e:
+            pass
+        if messageCode == "UnsupportedApiVersion":
+            return False
+        await self.engine.fillTracker.poll_async(self.api)
+        return not self.engine.fillTracker.is_open(orderId)
+
+    async def buyOCOwTrailingStop(self, price):
+        try:
+            messages, success = await self.api.trade_v2_buy_OCO_ONLY(self.ticker, self.qty, self.account_id, price, trailing_stop_dollars=self.trailingStopDollars)
+            if not success:
+                logger.logError("failed to send BUY with OCO Trailing Stop. Messages: " + str(messages), self.ticker, self.pipeWithDiscord)
+        except Exception as e:
+            logger.logError("error while sending BUY with OCO Trailing Stop: " + str(e), self.ticker, self.pipeWithDiscord)
+
+    async def sellOCOwTrailingStop(self, price):
+        try:
+            messages, success = await self.api.trade_v2_sell_OCO_ONLY(self.ticker, self.qty, self.account_id, price, trailing_stop_dollars=self.trailingStopDollars)
+            if not success:
+                logger.logError("failed to send SELL with OCO Trailing Stop. Messages: " + str(messages), self.ticker, self.pipeWithDiscord)
+        except Exception as e:
+            logger.logError("error while sending SELL with OCO Trailing Stop: " + str(e), self.ticker, self.pipeWithDiscord)
+
+
+class SpreadScraperEngine():
+    def __init__(self, pipeWithDiscord, account_id, api: Schwab):
+        """
+            Runs every ticker's scraping loop as a task on one event loop in a background thread,
+            instead of a process (plus a buy and a sell thread) per ticker. All tickers share one
+            batched quote poller, one fill tracker, one token cache and one connection pool.
+
+            The add/stop methods are called from the subprocess manager's thread and hand the work
+            to the event loop.
+        """
+        self.pipeWithDiscord = pipeWithDiscord
+        self.account_id = account_id
+        self.syncApi = api
+        self.api: AsyncSchwab = None
+        self.quotePoller: SharedQuotePoller = None
+        self.fillTracker = FillTracker(account_id)
+        self.tasks: dict[str, SpreadScraperTask] = {}
+        self._futures: dict[str, concurrent.futures.Future] = {}
+        self._stopping: set[concurrent.futures.Future] = set() # futures of stopped tickers' tasks that have not ended yet
+        self._startingPositions = {} # symbol -> Holdings quantity minus the fills counted when it was read
+        self._holdingsCheckedAt = 0
+        self._closedWithoutFill = {} # symbol -> fillTracker.closed_without_fill when its position was read
+        self._positionsLock = None
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._runLoop, name="SpreadScraperEngine", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._started.wait()
+
+    def _runLoop(self):
+        asyncio.set_event_loop(self._loop)
+        self.api = AsyncSchwab(self.syncApi)
+        self.quotePoller = SharedQuotePoller(self.api, self.account_id)
+        self._positionsLock = asyncio.Lock()
+        # orders filled before the engine started are not counted as fills
+        self._loop.run_until_complete(self.fillTracker.poll_async(self.api))
+        pollerTask = self._loop.create_task(self.quotePoller.run())
+        self._started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            pollerTask.cancel()
+            self._loop.run_until_complete(asyncio.gather(pollerTask, return_exceptions=True))
+            self._loop.run_until_complete(self.api.close())
+            self._loop.close()
+
+    def hasTicker(self, ticker):
+        return ticker in self.tasks
+
+    def addTicker(self, account_id, ticker, qty, profitMargin, minBASpread, maintainedEquity, timeBeforeCancel=None, trailingStopDollars=None):
+        task = SpreadScraperTask(self, account_id, ticker, qty, profitMargin, minBASpread, maintainedEquity, timeBeforeCancel, trailingStopDollars)
+        self.tasks[ticker] = task
+        self._futures[ticker] = asyncio.run_coroutine_threadsafe(self._runTask(task), self._loop)
+
+    async def _runTask(self, task: SpreadScraperTask):
+        try:
+            await task.run()
+        except Exception as e:
+            logger.logRareError("spread scraper task ended with an error: " + str(e), task.ticker, self.pipeWithDiscord)
+
+    def stopTicker(self, ticker):
+        # returns right away, so the subprocess manager keeps reading commands while the ticker's task
+        # closes its positions. _onTaskStopped reports when the task has ended
+        task = self.tasks.pop(ticker)
+        future = self._futures.pop(ticker)
+        self._stopping.add(future)
+        future.add_done_callback(functools.partial(self._onTaskStopped, ticker))
+        self._loop.call_soon_threadsafe(task.stop)
+
+    def _onTaskStopped(self, ticker, future):
+        self._stopping.discard(future)
+        print(TermColor.makeWarning("[SpreadScraperEngine] " + ticker + " stopped"))
+
+    def stopAll(self):
+        for ticker in list(self.tasks.keys()):
+            self.stopTicker(ticker)
+        # every task closes its positions before the event loop is stopped
+        concurrent.futures.wait(list(self._stopping))
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def getPositionCount(self, account_id, ticker):
+        # positions are read from Holdings, then follow the fills in today's orders; Holdings is read
+        # again every HOLDINGS_RECHECK_INTERVAL to correct them, and as soon as one of the ticker's
+        # orders closes without filling (it may have filled partially). One poll of today's orders
+        # serves every OCO ticker that asks within FILLS_MAX_AGE
+        async with self._positionsLock:
+            if (ticker not in self._startingPositions or time.time() - self._holdingsCheckedAt >= HOLDINGS_RECHECK_INTERVAL
+                    or self.fillTracker.closed_without_fill(ticker) != self._closedWithoutFill.get(ticker, 0)):
+                self._holdingsCheckedAt = time.time()
+                await self.readStartingPositions(account_id)
+        if ticker not in self._startingPositions:
+            return None
+        await self.fillTracker.poll_async(self.api, max_age=FILLS_MAX_AGE)
+        return self._startingPositions[ticker] + self.fillTracker.net_filled(ticker)
+
+    async def readStartingPositions(self, account_id):
+        # the tracker (primed when the engine started) is polled before and after Holdings is read:
+        # the fills up to the first poll are in Holdings and the ones after the second are added by
+        # the tracker. A symbol that filled in between may or may not be in Holdings yet, so it keeps
+        # its previous starting position and is read again on the next call
+        await self.fillTracker.poll_async(self.api)
+        if not self.fillTracker.primed:
+            return
+        filledBeforeHoldings = self.fillTracker.net_filled_by_symbol()
+        closedBeforeHoldings = self.fillTracker.closed_without_fill_by_symbol()
+        accounts = await self.api.get_accounts_v2()
+        lastPoll = self.fillTracker.last_poll
+        await self.fillTracker.poll_async(self.api)
+        if self.fillTracker.last_poll == lastPoll:
+            return
+        filledAfterHoldings = self.fillTracker.net_filled_by_symbol()
+        for position in accounts[int(account_id)].positions:
+            filled = filledBeforeHoldings.get(position.symbol, 0)
+            if filledAfterHoldings.get(position.symbol, 0) != filled:
+                continue
+            startingPosition = position.quantity - filled
+            previous = self._startingPositions.get(position.symbol)
+            if previous != None and previous != startingPosition:
+                logger.logError(f'position for ticker "{position.symbol}" corrected by {startingPosition - previous} from Holdings', position.symbol, self.pipeWithDiscord)
+            self._startingPositions[position.symbol] = startingPosition
+            self._closedWithoutFill[position.symbol] = closedBeforeHoldings.get(position.symbol, 0)
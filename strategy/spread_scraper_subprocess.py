@@ -6,10 +6,14 @@ import time
 from tools.terminal_colors import TermColor
 from tools import logger
 from schwab_api import Schwab
+from schwab_api.credentials import SchwabCredentials
+from schwab_api.fill_tracker import FillTracker
+from schwab_api.token_board import TokenBoard
 
 
 LOOP_MINIMUM_RUNTIME = 1.5 # seconds
 LOOP_MINIMUM_RUNTIME_W_OCO = 10 # seconds
+HOLDINGS_RECHECK_INTERVAL = 60 # seconds between Holdings reads that correct a position kept from fills
 
 
 # global vars - shared with threads 
@@ -34,6 +38,7 @@ class ManageBuyThread(threading.Thread):
         self.ticker = args[3]
         self.qty = args[4]
         self.trailingStopDollars = args[5] if len(args) > 5 else None
+        self.fillTracker: FillTracker = (kwargs or {}).get("fillTracker")
 
     def run(self):
         global workingBuyOrderId
@@ -71,15 +76,16 @@ class ManageBuyThread(threading.Thread):
                 else:
                     # failed to cancel BUY order
                     print(TermColor.makeWarning("[DEBUG] failed to cancel BUY order. Messages: " + str(messages)))
-                    # assume it executed ( TODO IF executed ) 
                     messageCode = None
                     try:
                         messageCode = json.loads(messages[0])["Error"]["Code"]
                     except Exception as e:
                         print(TermColor.makeWarning("[DEBUG] error getting message code in ManageBuyThread cancel."))
                     if messageCode == None or messageCode != "UnsupportedApiVersion":
-                        currentEquity += 1
-                        workingBuyOrderId = None
+                        # most likely it filled before the cancel. Check instead of assuming - the
+                        # fill itself is counted in currentEquity by the fill tracker's subscriber
+                        if orderIsClosed(self.fillTracker, self.api, workingBuyOrderId):
+                            workingBuyOrderId = None
 
             if "buyOCOwTrailingStop" in fromQueue.keys():
                 if self.trailingStopDollars == None:
@@ -99,14 +105,6 @@ class ManageBuyThread(threading.Thread):
                 except Exception as e:
                     logger.logError("error while sending BUY with OCO Trailing Stop: " + str(e), self.ticker, self.pipeWithDiscord)
 
-            if "tokenApi" in fromQueue.keys():
-                # print(TermColor.makeWarning("[DEBUG] updating api token in buy thread"))
-                self.api.apiToken = fromQueue["tokenApi"]
-
-            if "tokenUpdate" in fromQueue.keys():
-                # print(TermColor.makeWarning("[DEBUG] updating update token in buy thread"))
-                self.api.updateToken = fromQueue["tokenUpdate"]
-
             if "stopProcess" in fromQueue.keys():
                 return
 
@@ -123,6 +121,7 @@ class ManageSellThread(threading.Thread):
         self.ticker = args[3]
         self.qty = args[4]
         self.trailingStopDollars = args[5] if len(args) > 5 else None
+        self.fillTracker: FillTracker = (kwargs or {}).get("fillTracker")
 
     def run(self):
         global workingSellOrderId
@@ -161,17 +160,18 @@ class ManageSellThread(threading.Thread):
                 if success:
                     workingSellOrderId = None
                 else:
-                    # failed to cancel BUY order
-                    # print(TermColor.makeWarning("[DEBUG] failed to cancel BUY order. Messages: " + str(messages)))
-                    # assume it executed ( TODO IF executed ) 
+                    # failed to cancel SELL order
+                    # print(TermColor.makeWarning("[DEBUG] failed to cancel SELL order. Messages: " + str(messages)))
                     messageCode = None
                     try:
                         messageCode = json.loads(messages[0])["Error"]["Code"]
                     except Exception as e:
                         print(TermColor.makeWarning("[DEBUG] error getting message code in ManageSellThread cancel."))
                     if messageCode == None or messageCode != "UnsupportedApiVersion":
-                        currentEquity -= 1
-                        workingSellOrderId = None
+                        # most likely it filled before the cancel. Check instead of assuming - the
+                        # fill itself is counted in currentEquity by the fill tracker's subscriber
+                        if orderIsClosed(self.fillTracker, self.api, workingSellOrderId):
+                            workingSellOrderId = None
 
             if "sellOCOwTrailingStop" in fromQueue.keys():
                 if self.trailingStopDollars == None:
@@ -191,17 +191,40 @@ class ManageSellThread(threading.Thread):
                 except Exception as e:
                     logger.logError("error while sending SELL with OCO Trailing Stop: " + str(e), self.ticker, self.pipeWithDiscord)
 
-            if "tokenApi" in fromQueue.keys():
-                self.api.apiToken = fromQueue["tokenApi"]
-
-            if "tokenUpdate" in fromQueue.keys():
-                self.api.updateToken = fromQueue["tokenUpdate"]
-
             if "stopProcess" in fromQueue.keys():
                 return
 
 
 
+def orderIsClosed(fillTracker: FillTracker, api: Schwab, orderId):
+    # polls today's orders (shared with any other thread asking at the same time) and returns True
+    # once the order is filled, canceled or otherwise closed. An order still open is cancelled again
+    # on the next loop iteration
+    fillTracker.poll(api)
+    return not fillTracker.is_open(orderId)
+
+
+def getStartingPosition(api: Schwab, account_id, ticker, fillTracker: FillTracker):
+    # the position in Holdings, minus the fills the tracker had counted when Holdings was read, so
+    # that (starting position + fillTracker.net_filled(ticker)) is the current position.
+    # The tracker is polled (which primes it on its first poll) before and after Holdings is read:
+    # the fills up to the first poll are in Holdings and the ones after the second are added by the
+    # tracker. A fill seen by the second poll may or may not be in Holdings yet, so then None is
+    # returned and the caller reads Holdings again on its next loop
+    fillTracker.poll(api)
+    if not fillTracker.primed:
+        return None # the poll failed; a fill counted as already seen by the first poll would be lost
+    filledBeforeHoldings = fillTracker.net_filled(ticker)
+    position = api.get_accounts_v2()[int(account_id)].position(ticker)
+    lastPoll = fillTracker.last_poll
+    fillTracker.poll(api)
+    if fillTracker.last_poll == lastPoll or fillTracker.net_filled(ticker) != filledBeforeHoldings:
+        return None # the second poll failed, or the ticker filled while Holdings was read
+    if position == None:
+        return None
+    return position.quantity - filledBeforeHoldings
+
+
 def getBuySellPriceAdjustmentsFromProfitMargin(profitMargin): # returns   [buy adjustment, sell adjustment]
     if (profitMargin*100) % 2 == 0: # is an even number of cents
         return profitMargin/2.0, profitMargin/2.0
@@ -214,7 +237,8 @@ def getBuySellPriceAdjustmentsFromProfitMargin(profitMargin): # returns   [buy a
 def runSpreadScraperSubprocess(
         pipeFromParent,   # read this pipe to hear from parent (subprocess manager)
         pipeWithDiscord,  # write to this pipe to write to discord
-        api: Schwab,      # the API access
+        credentials: SchwabCredentials, # the session to build this process's API access from
+        tokenBoard: TokenBoard, # shared memory tokens published by the subprocess manager (None to refresh tokens here)
         account_id,
         ticker,           # stock ticker 
         qty,              # quantity of stock per order
@@ -236,10 +260,30 @@ def runSpreadScraperSubprocess(
     global workingBuyOrderId
     global workingSellOrderId
 
+    # own client and connection pool, from the session the subprocess manager passed in 
+    api = credentials.client()
+
+    # keep bearer tokens fresh without refreshing them on the order path: read the tokens the
+    # subprocess manager publishes, or refresh them in the background here if there is no board
+    # (refresher threads do not survive into this process, so start one here)
+    if tokenBoard != None:
+        api.attach_token_board(tokenBoard)
+    else:
+        api.start_token_refresher()
+
+    # equity follows the fills seen in today's orders (orders filled before the start are not counted)
+    fillTracker = FillTracker(account_id)
+    fillTracker.poll(api)
+    def onFill(fill):
+        global currentEquity
+        currentEquity += fill.signed_qty
+        print(TermColor.makeWarning(f'[DEBUG] {fill.action} order {fill.order_id} filled at {fill.price} (eq={currentEquity})'))
+    fillTracker.subscribe(onFill, ticker)
+
     # setup buy and sell threads 
-    buyThread = ManageBuyThread(Queue(), args=(pipeWithDiscord, account_id, api, ticker, qty))
+    buyThread = ManageBuyThread(Queue(), args=(pipeWithDiscord, account_id, api, ticker, qty), kwargs={"fillTracker": fillTracker})
     buyThread.start()
-    sellThread = ManageSellThread(Queue(), args=(pipeWithDiscord, account_id, api, ticker, qty))
+    sellThread = ManageSellThread(Queue(), args=(pipeWithDiscord, account_id, api, ticker, qty), kwargs={"fillTracker": fillTracker})
     sellThread.start()
 
     ######################################################################################
@@ -253,26 +297,6 @@ def runSpreadScraperSubprocess(
             try:
                 fromPipe = pipeFromParent.recv()
 
-                if "tokenApi" in fromPipe.keys():
-                    newToken = fromPipe["tokenApi"]
-                    api.apiToken = newToken
-                    buyThread.queue.put({
-                        "tokenApi": newToken
-                    })
-                    sellThread.queue.put({
-                        "tokenApi": newToken
-                    })
-
-                if "tokenUpdate" in fromPipe.keys():
-                    newToken = fromPipe["tokenUpdate"]
-                    api.updateToken = newToken
-                    buyThread.queue.put({
-                        "tokenUpdate": newToken
-                    })
-                    sellThread.queue.put({
-                        "tokenUpdate": newToken
-                    })
-
                 if "stopProcess" in fromPipe.keys():
                     isStopping = True
                 
@@ -293,6 +317,7 @@ def runSpreadScraperSubprocess(
             print(TermColor.makeWarning(f'[END] {ticker} BUY thread ended'))
             sellThread.join()
             print(TermColor.makeWarning(f'[END] {ticker} SELL thread ended'))
+            api.stop_token_refresher()
             pipeWithDiscord.send({
                 "stopProcessSuccess": ticker
             })
@@ -427,7 +452,7 @@ def runSpreadScraperSubprocess(
         #####################
         # runtime management 
         timeDiffSecs = time.time() - loopStartTime
-        print(TermColor.makeWarning("[DEBUG] scraper subprocess iteration runtime: " + str(timeDiffSecs/1000.0) + " ms"))
+        print(TermColor.makeWarning("[DEBUG] scraper subprocess iteration runtime: " + str(round(timeDiffSecs*1000.0, 3)) + " ms"))
         if timeDiffSecs < LOOP_MINIMUM_RUNTIME:
             time.sleep(LOOP_MINIMUM_RUNTIME - timeDiffSecs)
         
@@ -437,7 +462,8 @@ def runSpreadScraperSubprocess(
 def runSpreadScraperSubprocessOCOwTrailingStop(
         pipeFromParent,      # read this pipe to hear from parent (subprocess manager)
         pipeWithDiscord,     # write to this pipe to write to discord
-        api: Schwab,         # the API access
+        credentials: SchwabCredentials, # the session to build this process's API access from
+        tokenBoard: TokenBoard, # shared memory tokens published by the subprocess manager (None to refresh tokens here)
         account_id,
         ticker,              # stock ticker 
         qty,                 # quantity of stock per order
@@ -457,10 +483,31 @@ def runSpreadScraperSubprocessOCOwTrailingStop(
     # global currentEquity 
     # currentEquity = maintainedEquity
 
+    # own client and connection pool, from the session the subprocess manager passed in 
+    api = credentials.client()
+
+    # keep bearer tokens fresh without refreshing them on the order path: read the tokens the
+    # subprocess manager publishes, or refresh them in the background here if there is no board
+    # (refresher threads do not survive into this process, so start one here)
+    if tokenBoard != None:
+        api.attach_token_board(tokenBoard)
+    else:
+        api.start_token_refresher()
+
+    # the position is read from Holdings, then kept up to date from the fills in today's orders
+    # (orders filled before the tracker's first poll are in Holdings, not counted as fills). Holdings
+    # is read again every HOLDINGS_RECHECK_INTERVAL to correct anything the fills missed, and as soon
+    # as an order closes without filling, since it may have filled partially
+    fillTracker = FillTracker(account_id)
+    fillTracker.poll(api)
+    startingPosition = None
+    holdingsCheckedAt = 0
+    closedWithoutFill = 0
+
     # setup buy and sell threads 
-    buyThread = ManageBuyThread(Queue(), args=(pipeWithDiscord, account_id, api, ticker, qty, trailingStopDollars))
+    buyThread = ManageBuyThread(Queue(), args=(pipeWithDiscord, account_id, api, ticker, qty, trailingStopDollars), kwargs={"fillTracker": fillTracker})
     buyThread.start()
-    sellThread = ManageSellThread(Queue(), args=(pipeWithDiscord, account_id, api, ticker, qty, trailingStopDollars))
+    sellThread = ManageSellThread(Queue(), args=(pipeWithDiscord, account_id, api, ticker, qty, trailingStopDollars), kwargs={"fillTracker": fillTracker})
     sellThread.start()
 
     ######################################################################################
@@ -474,26 +521,6 @@ def runSpreadScraperSubprocessOCOwTrailingStop(
             try:
                 fromPipe = pipeFromParent.recv()
 
-                if "tokenApi" in fromPipe.keys():
-                    newToken = fromPipe["tokenApi"]
-                    api.apiToken = newToken
-                    buyThread.queue.put({
-                        "tokenApi": newToken
-                    })
-                    sellThread.queue.put({
-                        "tokenApi": newToken
-                    })
-
-                if "tokenUpdate" in fromPipe.keys():
-                    newToken = fromPipe["tokenUpdate"]
-                    api.updateToken = newToken
-                    buyThread.queue.put({
-                        "tokenUpdate": newToken
-                    })
-                    sellThread.queue.put({
-                        "tokenUpdate": newToken
-                    })
-
                 if "stopProcess" in fromPipe.keys():
                     print(TermColor.makeWarning("[END] ending buy and sell threads..."))
 
@@ -507,6 +534,7 @@ def runSpreadScraperSubprocessOCOwTrailingStop(
                     print(TermColor.makeWarning(f'[END] {ticker} BUY thread ended'))
                     sellThread.join()
                     print(TermColor.makeWarning(f'[END] {ticker} SELL thread ended'))
+                    api.stop_token_refresher()
                     pipeWithDiscord.send({
                         "stopProcessSuccess": ticker
                     })
@@ -521,15 +549,22 @@ def runSpreadScraperSubprocessOCOwTrailingStop(
         
         # get quote 
         try:
-            acctInfo = api.get_account_info_v2()
-            positionsForAcct = acctInfo[int(account_id)]["positions"]
+            if (startingPosition == None or time.time() - holdingsCheckedAt >= HOLDINGS_RECHECK_INTERVAL
+                    or fillTracker.closed_without_fill(ticker) != closedWithoutFill):
+                holdingsCheckedAt = time.time()
+                closedBeforeHoldings = fillTracker.closed_without_fill(ticker)
+                checkedPosition = getStartingPosition(api, account_id, ticker, fillTracker)
+                if checkedPosition != None:
+                    if startingPosition != None and checkedPosition != startingPosition:
+                        logger.logError(f'position for ticker "{ticker}" corrected by {checkedPosition - startingPosition} from Holdings', ticker, pipeWithDiscord)
+                    startingPosition = checkedPosition
+                    closedWithoutFill = closedBeforeHoldings
             positionCount = None
-            for position in positionsForAcct:
-                if position["symbol"] == ticker:
-                    positionCount = position["quantity"]
-                    break
+            if startingPosition != None:
+                fillTracker.poll(api)
+                positionCount = startingPosition + fillTracker.net_filled(ticker)
             if positionCount == None:
-                logger.logError("no position count found in positions for ticker \"" + ticker + "\"")
+                logger.logError("no position count found in positions for ticker \"" + ticker + "\"", ticker, pipeWithDiscord)
                 continue
             print(TermColor.makeWarning(f'[DEBUG] found position count {positionCount} for ticker "{ticker}"'))
 
@@ -575,7 +610,7 @@ def runSpreadScraperSubprocessOCOwTrailingStop(
         #####################
         # runtime management 
         timeDiffSecs = time.time() - loopStartTime
-        print(TermColor.makeWarning("[DEBUG] scraper subprocess iteration runtime: " + str(timeDiffSecs/1000.0) + " ms"))
+        print(TermColor.makeWarning("[DEBUG] scraper subprocess iteration runtime: " + str(round(timeDiffSecs*1000.0, 3)) + " ms"))
         if timeDiffSecs < LOOP_MINIMUM_RUNTIME_W_OCO:
             time.sleep(LOOP_MINIMUM_RUNTIME_W_OCO - timeDiffSecs)
 
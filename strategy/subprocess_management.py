@@ -1,5 +1,9 @@
 from schwab_api import Schwab
+from schwab_api.credentials import SchwabCredentials
+from schwab_api.token_board import TokenBoard
+from schwab_api.token_cache import TOKEN_SCOPES
 import strategy.spread_scraper_subprocess as spread_scraper_subprocess
+from strategy.spread_scraper_engine import SpreadScraperEngine
 from tools.terminal_colors import TermColor
 from tools import logger
 
@@ -9,9 +13,12 @@ import time
 
 
 class SchwabManager():
-    def __init__(self, account_id, api: Schwab):
+    def __init__(self, account_id, api: Schwab, useEngine=False):
+        # useEngine - run every ticker as a task in the manager process instead of a process per ticker
         self.pipeWithApp, child_connection = multiprocessing.Pipe()
-        self.subProcessManagerProcess = SchwabSubprocessesManager(child_connection, account_id, api)
+        # the manager process builds its own client from a snapshot of the session, rather than
+        # getting a copy of api
+        self.subProcessManagerProcess = SchwabSubprocessesManager(child_connection, account_id, SchwabCredentials.from_api(api), useEngine=useEngine)
         self.subProcessManagerProcess.start()
 
         # supposed to be used for the subprocesses to send things to discord. can be used here to log to discord too. weird architecture doing this.
@@ -112,42 +119,64 @@ class SubProcess():
 
 class SchwabSubprocessesManager(multiprocessing.Process):
     SLEEP_TIME = 2 # seconds
-    TOKEN_UPDATE_TIME = 25 # seconds     (note: leave buffer time)
+    TOKEN_REFRESH_LEAD = 60 # seconds before the api would refresh a token itself     (note: leave buffer time)
 
-    def __init__(self, pipeWithDiscord, account_id, api: Schwab, **kwargs):
+    def __init__(self, pipeWithDiscord, account_id, credentials: SchwabCredentials, **kwargs):
         super(SchwabSubprocessesManager, self).__init__()
         self.pipeWithDiscord = pipeWithDiscord
         self.daemon = False
-        self.lastTokenUpdateTime = time.time()
         self.subprocesses: dict[str, SubProcess] = {}
+        self.tokenBoard: TokenBoard = None # created in run(), in the manager process
+        # engine mode: every ticker runs as a task on one event loop in this process, sharing one
+        # quote poller, token cache and connection pool, instead of a process per ticker
+        self.useEngine = kwargs.get("useEngine", False)
+        self.engine: SpreadScraperEngine = None # created in run(), in the manager process
 
         self.account_id = account_id
-        self.api: Schwab = api
+        self.credentials: SchwabCredentials = credentials
+        self.api: Schwab = None # built from credentials in run(), in the manager process
 
     def run(self):
-        while True:
-            try:
-                if self.checkInputQueue():
-                    return 
-            except Exception as e:
-                logger.logRareError("failed to check input queue in SchwabSubprocessesManager: " + e, None, self.pipeWithDiscord)
-            # self.refreshToken()
-            time.sleep(SchwabSubprocessesManager.SLEEP_TIME)
-    
-    def refreshToken(self):
-        # if time to refresh token 
-        if time.time() - self.lastTokenUpdateTime >= SchwabSubprocessesManager.TOKEN_UPDATE_TIME:
-            newTokenApi, newTokenUpdate = self.api.update_both_tokens()
-            self.lastTokenUpdateTime = time.time()
-
-            # send new token for each subprocess 
-            for subprocess in self.subprocesses.values():
-                subprocess.send({
-                    "tokenApi": newTokenApi,
-                    "tokenUpdate": newTokenUpdate,
-                })
+        self.api = self.credentials.client()
+        # subprocesses read tokens from shared memory just before each request, so a refresh
+        # here reaches all of them with one write
+        self.tokenBoard = TokenBoard(create=True)
+        try:
+            self.refreshToken(alwaysPublish=True)
+        except Exception as e:
+            logger.logRareError("failed to publish initial tokens in SchwabSubprocessesManager: " + str(e), None, self.pipeWithDiscord)
+        if self.useEngine:
+            # the engine shares this process's token cache, which refreshToken keeps fresh
+            self.engine = SpreadScraperEngine(self.pipeWithDiscord, self.account_id, self.api)
+            self.engine.start()
 
+        try:
+            while True:
+                try:
+                    if self.checkInputQueue():
+                        return 
+                except Exception as e:
+                    logger.logRareError("failed to check input queue in SchwabSubprocessesManager: " + str(e), None, self.pipeWithDiscord)
+                try:
+                    self.refreshToken()
+                except Exception as e:
+                    logger.logRareError("failed to refresh token in SchwabSubprocessesManager: " + str(e), None, self.pipeWithDiscord)
+                time.sleep(SchwabSubprocessesManager.SLEEP_TIME)
+        finally:
+            self.tokenBoard.close()
+            self.tokenBoard.unlink()
+    
+    def refreshToken(self, alwaysPublish=False):
+        # refresh tokens shortly before the api would refresh them on its own 
+        cache = self.api.token_cache
+        if any(cache.seconds_until_refresh(scope, SchwabSubprocessesManager.TOKEN_REFRESH_LEAD) == 0 for scope in TOKEN_SCOPES):
+            self.api.update_both_tokens()
             print(TermColor.makeWarning(f'[DEBUG][{datetime.datetime.now().strftime("%I:%M:%S%p on %D")}] token refreshed'))
+        elif not alwaysPublish:
+            return
+
+        # publish tokens for every subprocess 
+        self.tokenBoard.publish({scope: cache.peek(scope) for scope in TOKEN_SCOPES})
 
     def checkInputQueue(self):
         # get info from queue - retrieve user input 
@@ -158,6 +187,8 @@ class SchwabSubprocessesManager(multiprocessing.Process):
             
             if command == "stopProcess": # signal processes to end, then end this thread 
                 print(TermColor.makeWarning("[END] ending subprocesses..."))
+                if self.engine != None:
+                    self.engine.stopAll()
                 for subprocess in self.subprocesses.values():
                     subprocess.send({
                         "stopProcess": 0,
@@ -170,7 +201,9 @@ class SchwabSubprocessesManager(multiprocessing.Process):
             if command == "stopTicker": # stop process for ticker
                 if "ticker" in fromQueue.keys():
                     ticker = fromQueue["ticker"]
-                    if ticker in self.subprocesses.keys():
+                    if self.engine != None and self.engine.hasTicker(ticker):
+                        self.engine.stopTicker(ticker)
+                    elif ticker in self.subprocesses.keys():
                         self.subprocesses[ticker].send({
                             "stopProcess": 0
                         })
@@ -189,8 +222,10 @@ class SchwabSubprocessesManager(multiprocessing.Process):
                     minBASpread = fromQueue["minBASpread"]
                     qty = fromQueue["qty"]
                     timeBeforeCancel = fromQueue["timeBeforeCancel"]
-                    if ticker in self.subprocesses.keys():
+                    if ticker in self.subprocesses.keys() or (self.engine != None and self.engine.hasTicker(ticker)):
                         logger.logRareError("ticker \"" + ticker + "\" already exists in subprocesses!", ticker, self.pipeWithDiscord)
+                    elif self.engine != None:
+                        self.engine.addTicker(self.account_id, ticker, qty, profitMargin, minBASpread, maintainedEquity, timeBeforeCancel=timeBeforeCancel)
                     else: # ticker does not yet exist in subprocesses dict 
                         # make new process
                         parent_connection, child_connection = multiprocessing.Pipe()
@@ -199,7 +234,8 @@ class SchwabSubprocessesManager(multiprocessing.Process):
                             args=[
                                 child_connection,
                                 self.pipeWithDiscord,
-                                self.api,
+                                SchwabCredentials.from_api(self.api),
+                                self.tokenBoard,
                                 self.account_id,
                                 ticker,
                                 qty,
@@ -222,8 +258,10 @@ class SchwabSubprocessesManager(multiprocessing.Process):
                     minBASpread = fromQueue["minBASpread"]
                     qty = fromQueue["qty"]
                     trailingStopDollars = fromQueue["trailingStopDollars"]
-                    if ticker in self.subprocesses.keys():
+                    if ticker in self.subprocesses.keys() or (self.engine != None and self.engine.hasTicker(ticker)):
                         logger.logRareError("ticker \"" + ticker + "\" already exists in subprocesses!", ticker, self.pipeWithDiscord)
+                    elif self.engine != None:
+                        self.engine.addTicker(self.account_id, ticker, qty, profitMargin, minBASpread, maintainedEquity, trailingStopDollars=trailingStopDollars)
                     else: # ticker does not yet exist in subprocesses dict 
                         # make new process
                         parent_connection, child_connection = multiprocessing.Pipe()
@@ -232,7 +270,8 @@ class SchwabSubprocessesManager(multiprocessing.Process):
                             args=[
                                 child_connection,
                                 self.pipeWithDiscord,
-                                self.api,
+                                SchwabCredentials.from_api(self.api),
+                                self.tokenBoard,
                                 self.account_id,
                                 ticker,
                                 qty,
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from schwab_api.codec import Codec, available_backends, QUOTES_SCHEMA, ORDERS_SCHEMA
+from schwab_api.records import Quote
+
+QUOTES = json.dumps({
+    "quotes": [
+        {"symbol": "AAPL", "quote": {"bid": "189.10", "ask": "189.12", "last": "189.11", "bidSize": "300"}, "extra": 1},
+        {"symbol": "NOPE", "quote": None},
+        {"symbol": "MSFT"}
+    ],
+    "metadata": {"count": 3}
+}).encode("utf-8")
+
+ORDERS = json.dumps({
+    "Orders": [
+        {"OrderList": [{"OrderId": 1, "DisplaySymbol": "AAPL", "OrderStatus": "Filled", "FillPrice": "$189.10", "Unused": "x"}], "Unused": 2},
+        {"OrderList": [{"OrderId": 2, "DisplaySymbol": "MSFT", "OrderStatus": "Open", "FillPrice": None}]}
+    ],
+    "Total": 2
+}).encode("utf-8")
+
+
+@pytest.fixture(params=["json", "orjson", "msgspec"])
+def codec(request):
+    if request.param not in available_backends():
+        pytest.skip(f"{request.param} is not installed")
+    return Codec(request.param)
+
+
+def test_loads_matches_the_json_module(codec):
+    assert codec.loads(QUOTES) == json.loads(QUOTES)
+    assert codec.loads(QUOTES.decode("utf-8")) == json.loads(QUOTES)
+
+
+def test_invalid_json_raises_json_decode_error(codec):
+    with pytest.raises(json.JSONDecodeError):
+        codec.loads(b'{"quotes": [')
+
+
+def test_decode_keeps_only_the_schema_fields(codec):
+    quotes = codec.decode(QUOTES, QUOTES_SCHEMA)
+
+    assert quotes == {"quotes": [
+        {"symbol": "AAPL", "quote": {"bid": "189.10", "ask": "189.12", "last": "189.11"}},
+        {"symbol": "NOPE", "quote": None},
+        {"symbol": "MSFT"}
+    ]}
+
+
+def test_decode_keeps_null_fields(codec):
+    orders = codec.decode(ORDERS, ORDERS_SCHEMA)
+
+    assert orders == {"Orders": [
+        {"OrderList": [{"OrderId": 1, "DisplaySymbol": "AAPL", "OrderStatus": "Filled", "FillPrice": "$189.10"}]},
+        {"OrderList": [{"OrderId": 2, "DisplaySymbol": "MSFT", "OrderStatus": "Open", "FillPrice": None}]}
+    ]}
+
+
+def test_null_quote_decodes_without_prices(codec):
+    entries = codec.decode(QUOTES, QUOTES_SCHEMA)["quotes"]
+    quotes = [Quote.from_entry(entry) for entry in entries]
+
+    assert (quotes[0].bid, quotes[0].ask, quotes[0].last) == (189.10, 189.12, 189.11)
+    assert (quotes[1].symbol, quotes[1].bid, quotes[1].ask) == ("NOPE", None, None)
+    assert quotes[1].field("bid") is None
+    assert quotes[2].bid is None
+
+
+def test_backends_decode_the_same(codec):
+    reference = Codec("json")
+
+    assert codec.decode(QUOTES, QUOTES_SCHEMA) == reference.decode(QUOTES, QUOTES_SCHEMA)
+    assert codec.decode(ORDERS, ORDERS_SCHEMA) == reference.decode(ORDERS, ORDERS_SCHEMA)
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        Codec("simdjson")
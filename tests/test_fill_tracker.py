@@ -0,0 +1,134 @@
+from schwab_api.fill_tracker import FillTracker
+
+
+def order(order_id, status, symbol="AAPL", action="Buy", qty="1", fill_price=""):
+    return {"OrderList": [{
+        "OrderId": order_id,
+        "DisplaySymbol": symbol,
+        "OrderStatus": status,
+        "OrderAction": action,
+        "Quantity": qty,
+        "Price": "Limit $10.00",
+        "FillPrice": fill_price
+    }]}
+
+
+class FakeApi:
+    def __init__(self, orders=None):
+        self.orders = orders or []
+        self.requests = 0
+
+    def todays_orders_v2(self, account_id, compact=False):
+        self.requests += 1
+        return list(self.orders), True
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_first_poll_primes_without_counting_fills():
+    api = FakeApi([order(1, "Filled", fill_price="$10.00"), order(2, "Open")])
+    tracker = FillTracker(12345678)
+    published = []
+    tracker.subscribe(published.append)
+
+    assert tracker.poll(api) == []
+    assert tracker.primed
+    assert tracker.net_filled("AAPL") == 0
+    assert published == []
+
+
+def test_fill_after_priming_is_counted_once():
+    api = FakeApi([order(1, "Open"), order(2, "Open", action="Sell", qty="2")])
+    tracker = FillTracker(12345678)
+    published = []
+    tracker.subscribe(published.append, "AAPL")
+    tracker.poll(api)
+
+    api.orders = [order(1, "Filled", fill_price="$10.00"), order(2, "Filled", action="Sell", qty="2", fill_price="$10.05")]
+    fills = tracker.poll(api)
+    tracker.poll(api)
+    tracker.poll(api)
+
+    assert [fill.order_id for fill in fills] == [1, 2]
+    assert [fill.order_id for fill in published] == [1, 2]
+    assert tracker.net_filled("AAPL") == 1 - 2
+    assert tracker.net_filled_by_symbol() == {"AAPL": -1}
+    assert not tracker.is_open(1)
+
+
+def test_order_first_seen_filled_after_priming_is_a_fill():
+    api = FakeApi([])
+    tracker = FillTracker(12345678)
+    tracker.poll(api)
+
+    api.orders = [order(3, "Filled", symbol="MSFT", qty="5", fill_price="$300.00")]
+    fills = tracker.poll(api)
+
+    assert [(fill.symbol, fill.signed_qty) for fill in fills] == [("MSFT", 5)]
+    assert tracker.net_filled("MSFT") == 5
+
+
+def test_subscriber_only_gets_its_symbol():
+    api = FakeApi([])
+    tracker = FillTracker(12345678)
+    tracker.poll(api)
+    published = []
+    subscription = tracker.subscribe(published.append, "MSFT")
+
+    api.orders = [order(1, "Filled", symbol="AAPL"), order(2, "Filled", symbol="MSFT")]
+    tracker.poll(api)
+    tracker.unsubscribe(subscription)
+    api.orders.append(order(3, "Filled", symbol="MSFT"))
+    tracker.poll(api)
+
+    assert [fill.order_id for fill in published] == [2]
+
+
+def test_polls_within_max_age_are_deduplicated():
+    api = FakeApi([])
+    clock = Clock()
+    tracker = FillTracker(12345678, clock=clock)
+
+    tracker.poll(api, max_age=5)
+    clock.now += 2
+    tracker.poll(api, max_age=5)
+    assert api.requests == 1
+
+    clock.now += 4
+    tracker.poll(api, max_age=5)
+    assert api.requests == 2
+    assert tracker.polls == 2
+
+
+def test_failed_poll_does_not_prime():
+    class FailingApi:
+        def todays_orders_v2(self, account_id, compact=False):
+            return "error", False
+
+    tracker = FillTracker(12345678)
+    tracker.poll(FailingApi())
+
+    assert not tracker.primed
+
+
+def test_orders_closed_without_filling_are_counted():
+    api = FakeApi([order(1, "Canceled"), order(2, "Open"), order(3, "Open", symbol="MSFT")])
+    tracker = FillTracker(12345678)
+    tracker.poll(api)
+
+    # a partial fill is not visible in listView, so canceled and replaced orders are counted instead
+    api.orders = [order(1, "Canceled"), order(2, "Canceled"), order(3, "Replaced", symbol="MSFT"), order(4, "Rejected")]
+    tracker.poll(api)
+    tracker.poll(api)
+
+    assert tracker.closed_without_fill("AAPL") == 2
+    assert tracker.closed_without_fill("MSFT") == 1
+    assert tracker.closed_without_fill_by_symbol() == {"AAPL": 2, "MSFT": 1}
+    assert tracker.net_filled("AAPL") == 0
+    assert tracker.fills == []
@@ -0,0 +1,164 @@
+import copy
+import json
+
+import pytest
+
+from schwab_api.order_templates import OrderSubmission, OrderTemplate, limit_order_payload, replace_limit_order_payload
+
+
+def old_limit_order_data(ticker, instruction, qty, account_id, limit_price, duration=48, primary_security_type=46, costBasis='FIFO'):
+    # the verification payload trade_v2_limit_buy_order / trade_v2_limit_sell_order built per call
+    # before the templates, sent with requests' json=
+    return {
+        "UserContext": {
+            "AccountId":str(account_id),
+            "AccountColor":0
+        },
+        "OrderStrategy": {
+            "PrimarySecurityType":primary_security_type,
+            "CostBasisRequest": {
+                "costBasisMethod":costBasis,
+                "defaultCostBasisMethod":costBasis
+            },
+            "OrderType":"50",
+            "LimitPrice":str(limit_price),
+            "StopPrice":"0",
+            "Duration":str(duration),
+            "AllNoneIn":False,
+            "DoNotReduceIn":False,
+            "OrderStrategyType":1,
+            "MinimumQuantity":0,
+            "OrderLegs":[
+                {
+                    "Quantity":str(qty),
+                    "LeavesQuantity":str(qty),
+                    "Instrument":{"Symbol":ticker},
+                    "SecurityType":primary_security_type,
+                    "Instruction":instruction
+                }
+            ]
+        },
+        "OrderProcessingControl":1
+    }
+
+
+def old_place_data(data, order_id, security_id=None, affirm_order=False):
+    # the same payload, changed the way the old code changed it for the placement request
+    data = copy.deepcopy(data)
+    if security_id is not None:
+        data["OrderStrategy"]["OrderLegs"][0]["Instrument"]["ItemIssueId"] = security_id
+    data["UserContext"]["CustomerId"] = 0
+    data["OrderStrategy"]["OrderId"] = int(order_id)
+    data["OrderProcessingControl"] = 2
+    if affirm_order:
+        data["OrderStrategy"]["OrderAffrmIn"] = True
+    return data
+
+
+def compact(data):
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+@pytest.mark.parametrize("instruction", [49, 50])
+@pytest.mark.parametrize("limit_price", [12.5, 101.25, 0.1234, 7])
+def test_verify_body_matches_the_old_payload(instruction, limit_price):
+    template = OrderTemplate(limit_order_payload("AAPL", instruction, 3, 12345678, 48, 46, 'FIFO'))
+    body = template.verify_body(limit_price)
+    old = old_limit_order_data("AAPL", instruction, 3, 12345678, limit_price)
+
+    assert json.loads(body) == json.loads(json.dumps(old))
+    assert body == compact(old)
+
+
+@pytest.mark.parametrize("security_id", [None, 987654])
+@pytest.mark.parametrize("affirm_order", [False, True])
+def test_place_body_matches_the_old_payload(security_id, affirm_order):
+    template = OrderTemplate(limit_order_payload("MSFT", 49, 1, 12345678, 48, 46, 'FIFO'), affirm_order)
+    body = template.place_body(99.99, 4321, security_id)
+    old = old_place_data(old_limit_order_data("MSFT", 49, 1, 12345678, 99.99), 4321, security_id, affirm_order)
+
+    assert json.loads(body) == json.loads(json.dumps(old))
+    assert body == compact(old)
+
+
+def test_rendering_does_not_change_the_template():
+    template = OrderTemplate(limit_order_payload("AAPL", 49, 1, 12345678, 48, 46, 'FIFO'))
+    first = template.verify_body(10)
+    template.place_body(11, 1, 2)
+    template.verify_body(12)
+
+    assert template.verify_body(10) == first
+
+
+def test_replace_body_carries_the_replaced_order_id():
+    template = OrderTemplate(replace_limit_order_payload("AAPL", 50, 2, 12345678, 48, 46, 'FIFO'))
+    verify = json.loads(template.verify_body(20.05, 1001))
+    place = json.loads(template.place_body(20.05, 1002, 555, 1001))
+
+    assert verify["OrderStrategy"]["CancelOrderId"] == 1001
+    assert verify["OrderStrategy"]["LimitPrice"] == "20.05"
+    assert place["OrderStrategy"]["CancelOrderId"] == 1001
+    assert place["OrderStrategy"]["OrderId"] == 1002
+    assert place["OrderStrategy"]["OrderLegs"][0]["Instrument"]["ItemIssueId"] == 555
+
+
+def direct_submission(instruction=49, limit_price=10.5):
+    template = OrderTemplate(limit_order_payload("AAPL", instruction, 2, 12345678, 48, 46, 'FIFO'), True)
+    return OrderSubmission(template, limit_price, {0, 10, 20, 25}, {"AAPL": 555}, place_directly=True)
+
+
+def listed_order(order_id, status, action="Buy", qty="2", price="Limit $10.50", symbol="AAPL"):
+    return {"OrderList": [{"OrderId": order_id, "DisplaySymbol": symbol, "OrderStatus": status, "OrderAction": action, "Quantity": qty, "Price": price, "FillPrice": ""}]}
+
+
+def test_direct_placement_accepted():
+    submission = direct_submission()
+    response = {"orderStrategy": {"orderId": 1001, "orderReturnCode": 0, "orderMessages": [{"message": "ok"}]}}
+
+    assert submission.direct_result(200, response) == (["ok"], True, 1001)
+    assert not submission.placement_unclear
+
+
+@pytest.mark.parametrize("status_code, response", [
+    (200, {"orderStrategy": {"orderId": 0, "orderReturnCode": 99, "orderMessages": [{"message": "Order not found. Verify the order first."}]}}),
+    (400, None),
+])
+def test_rejected_direct_placement_falls_back_to_verification(status_code, response):
+    submission = direct_submission()
+
+    assert submission.direct_result(status_code, response) is None
+    assert not submission.placement_unclear
+    assert "AAPL" not in submission.security_ids
+
+
+@pytest.mark.parametrize("status_code, response", [(None, None), (503, None), (200, None), (200, {"orderStrategy": {}})])
+def test_unclear_direct_placement_checks_todays_orders(status_code, response):
+    submission = direct_submission()
+
+    assert submission.direct_result(status_code, response) is None
+    assert submission.placement_unclear
+    assert submission.security_ids["AAPL"] == 555
+
+
+def test_unclear_placement_finds_the_placed_order():
+    submission = direct_submission()
+    orders = [
+        listed_order(1001, "Open"),
+        listed_order(1002, "Canceled"),
+        listed_order(1003, "Open", action="Sell"),
+        listed_order(1004, "Open", price="Limit $10.55"),
+        listed_order(1005, "Open", qty="3"),
+        listed_order(1006, "Open", symbol="MSFT"),
+        listed_order(1007, "Filled"),
+    ]
+
+    assert submission.unclear_result(orders) == ([], True, 1007)
+    assert submission.unclear_result(orders[1:6]) is None
+
+
+def test_unclear_placement_is_not_retried_if_orders_cannot_be_checked():
+    messages, is_success, order_id = direct_submission().unclear_result(None)
+
+    assert not is_success
+    assert order_id is None
+    assert messages
@@ -0,0 +1,41 @@
+import json
+
+from schwab_api import Schwab
+from schwab_api.records import Account, Position
+
+HOLDINGS = {"accounts": [{
+    "accountId": "12345678",
+    "groupedPositions": [
+        {"groupName": "Cash", "positions": [{"symbolDetail": {"symbol": "CASH", "description": "Cash"}, "quantity": "1"}]},
+        {"groupName": "Equity", "positions": [
+            {"symbolDetail": {"symbol": "AAPL", "description": "APPLE INC"}, "quantity": "10",
+             "costDetail": {"costBasisDetail": {"costBasis": "1890.50"}}, "priceDetail": {"marketValue": "1900.00"}},
+            {"symbolDetail": {"symbol": "MSFT", "description": "MICROSOFT CORP"}, "quantity": "2"}
+        ]}
+    ],
+    "totals": {"marketValue": 2600.0, "cashInvestments": 500.0, "accountValue": 3100.0}
+}]}
+
+
+def test_accounts_are_records_with_lazy_positions():
+    accounts = Schwab(launch_browser=False)._parse_account_info_v2(HOLDINGS)
+    account = accounts[12345678]
+
+    assert isinstance(account, Account)
+    assert [position.symbol for position in account.positions] == ["AAPL", "MSFT"]
+    aapl = account.position("AAPL")
+    assert isinstance(aapl, Position)
+    assert (aapl.quantity, aapl.cost, aapl.market_value) == (10.0, 1890.5, 1900.0)
+    assert account.position("MSFT")["cost"] == 0
+    assert account.position("NOPE") is None
+
+
+def test_account_as_dict_is_plain_json():
+    account = Schwab(launch_browser=False)._parse_account_info_v2(HOLDINGS)[12345678]._as_dict()
+
+    assert isinstance(account, dict)
+    assert all(type(position) is dict for position in account["positions"])
+    assert account["positions"][0] == {"symbol": "AAPL", "description": "APPLE INC", "quantity": 10.0, "cost": 1890.5, "market_value": 1900.0}
+    assert account["cost_basis"] == 0
+    json.dumps(account)
+    account["positions"][1]["quantity"] = 3.0
@@ -0,0 +1,79 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+from requests.cookies import create_cookie
+
+from schwab_api import Schwab
+from schwab_api.session_vault import SessionVault, generate_key
+
+
+def logged_in_api():
+    api = Schwab(launch_browser=False)
+    api.session.cookies.set_cookie(create_cookie("SESSION", "abc123", domain=".schwab.com", path="/", secure=True))
+    api.headers = {"user-agent": "test-agent", "schwab-channelcode": "IO", "authorization": "Bearer old"}
+    api.security_ids["AAPL"] = 1234
+    api.token_cache.put("api", "api-token", time.time())
+    return api
+
+
+def test_round_trip_restores_cookies_and_headers(tmp_path):
+    path = str(tmp_path / "session.vault")
+    vault = SessionVault(path, generate_key())
+    vault.save(logged_in_api())
+
+    restored = Schwab(launch_browser=False)
+    assert vault.restore(restored)
+
+    assert restored.session.cookies.get("SESSION", domain=".schwab.com") == "abc123"
+    assert restored.headers == {"user-agent": "test-agent", "schwab-channelcode": "IO"}
+    assert restored.security_ids == {"AAPL": 1234}
+    # bearer tokens are not stored
+    assert restored.token_cache.peek("api") is None
+
+
+def test_vault_file_is_encrypted_and_private(tmp_path):
+    path = str(tmp_path / "session.vault")
+    SessionVault(path, generate_key()).save(logged_in_api())
+
+    with open(path, "rb") as f:
+        contents = f.read()
+    assert b"abc123" not in contents
+    assert b"test-agent" not in contents
+    if os.name == "posix":
+        assert os.stat(path).st_mode & 0o777 == 0o600
+
+
+def test_wrong_key_restores_nothing(tmp_path):
+    path = str(tmp_path / "session.vault")
+    SessionVault(path, generate_key()).save(logged_in_api())
+
+    assert not SessionVault(path, generate_key()).restore(Schwab(launch_browser=False))
+
+
+def test_expired_or_missing_session_restores_nothing(tmp_path):
+    path = str(tmp_path / "session.vault")
+    key = generate_key()
+    SessionVault(path, key).save(logged_in_api())
+
+    assert SessionVault(path, key, max_age=-1).load() is None
+    SessionVault(path, key).clear()
+    assert not os.path.exists(path)
+    assert SessionVault(path, key).load() is None
+
+
+def test_key_from_the_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv("SCHWAB_SESSION_VAULT_KEY", generate_key().decode("ascii"))
+    path = str(tmp_path / "session.vault")
+    SessionVault(path).save(logged_in_api())
+
+    assert SessionVault(path).load()["headers"]["user-agent"] == "test-agent"
+
+
+def test_missing_key_is_an_error(tmp_path, monkeypatch):
+    monkeypatch.delenv("SCHWAB_SESSION_VAULT_KEY", raising=False)
+    with pytest.raises(ValueError):
+        SessionVault(str(tmp_path / "session.vault"))
@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from schwab_api.token_board import TokenBoard, _SEQUENCE
+from schwab_api.token_cache import CachedToken, TokenCache
+
+
+@pytest.fixture
+def board():
+    board = TokenBoard(create=True, max_token_bytes=64)
+    yield board
+    board.close()
+    board.unlink()
+
+
+def test_read_returns_published_tokens(board):
+    board.publish({"api": CachedToken("api-token", 100.0)})
+    version, tokens = board.read()
+
+    assert version == 2
+    assert list(tokens) == ["api"]
+    assert tokens["api"].token == "api-token"
+    assert tokens["api"].issued_at == 100.0
+
+
+def test_publish_keeps_other_scopes(board):
+    board.publish({"api": CachedToken("api-token", 100.0)})
+    board.publish({"update": CachedToken("update-token", 200.0)})
+    _, tokens = board.read()
+
+    assert tokens["api"].token == "api-token"
+    assert tokens["update"].token == "update-token"
+
+
+def test_read_if_newer_only_returns_new_versions(board):
+    board.publish({"api": CachedToken("first", 100.0)})
+    version, _ = board.read()
+
+    assert board.read_if_newer(version) is None
+    board.publish({"api": CachedToken("second", 200.0)})
+    newer_version, tokens = board.read_if_newer(version)
+    assert newer_version > version
+    assert tokens["api"].token == "second"
+
+
+def test_read_times_out_while_a_write_is_in_progress(board):
+    board.publish({"api": CachedToken("api-token", 100.0)})
+    _SEQUENCE.pack_into(board._buf, 0, board.version() + 1) # a writer stopped mid-write
+
+    with pytest.raises(TimeoutError):
+        board.read()
+
+
+def test_reader_waits_for_a_write_to_finish(board):
+    board.publish({"api": CachedToken("old", 100.0)})
+    sequence = board.version()
+    _SEQUENCE.pack_into(board._buf, 0, sequence + 1)
+
+    def finish_write():
+        time.sleep(0.01)
+        _SEQUENCE.pack_into(board._buf, 0, sequence + 2)
+
+    writer = threading.Thread(target=finish_write)
+    writer.start()
+    version, tokens = board.read()
+    writer.join()
+
+    assert version == sequence + 2
+    assert tokens["api"].token == "old"
+
+
+def test_too_large_token_is_rejected(board):
+    with pytest.raises(ValueError):
+        board.publish({"api": CachedToken("x" * 65, 100.0)})
+    assert board.version() == 0
+
+
+def test_reader_never_sees_a_torn_token(board):
+    tokens = [CachedToken("a" * 64, 1.0), CachedToken("b" * 16, 2.0)]
+    expected = {(entry.token, entry.issued_at) for entry in tokens}
+    stop = threading.Event()
+
+    def write():
+        i = 0
+        while not stop.is_set():
+            board.publish({"api": tokens[i % 2]})
+            i += 1
+
+    board.publish({"api": tokens[0]})
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        for _ in range(2000):
+            try:
+                _, read = board.read()
+            except TimeoutError:
+                continue
+            assert (read["api"].token, read["api"].issued_at) in expected
+    finally:
+        stop.set()
+        writer.join()
+
+
+def test_cache_falls_back_to_a_fresh_token_while_the_board_is_stuck(board):
+    now = [1000.0]
+    cache = TokenCache(lambda scope: "fetched", clock=lambda: now[0])
+    board.publish({"api": CachedToken("from-board", 1000.0)})
+    cache.attach_board(board)
+    assert cache.get("api") == "from-board"
+
+    _SEQUENCE.pack_into(board._buf, 0, board.version() + 1) # a writer stopped mid-write
+    assert cache.get("api") == "from-board"
+
+    now[0] += cache.lifetime # the cached token is stale now
+    with pytest.raises(TimeoutError):
+        cache.get("api")
@@ -0,0 +1,178 @@
+import threading
+import time
+
+import pytest
+
+from schwab_api.token_cache import TokenCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Fetcher:
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, scope):
+        with self._lock:
+            self.calls.append(scope)
+            count = len(self.calls)
+        if self.delay:
+            time.sleep(self.delay)
+        return f"{scope}-{count}"
+
+
+def test_token_is_reused_until_the_safety_margin():
+    clock = Clock()
+    fetch = Fetcher()
+    cache = TokenCache(fetch, lifetime=1800, safety_margin=120, clock=clock)
+
+    assert cache.get("api") == "api-1"
+    clock.now += 1800 - 120 - 1
+    assert cache.get("api") == "api-1"
+    assert fetch.calls == ["api"]
+
+    clock.now += 1
+    assert cache.get("api") == "api-2"
+    assert fetch.calls == ["api", "api"]
+
+
+def test_scopes_are_cached_separately():
+    clock = Clock()
+    fetch = Fetcher()
+    cache = TokenCache(fetch, clock=clock)
+
+    assert cache.get("api") == "api-1"
+    assert cache.get("update") == "update-2"
+    assert cache.get("api") == "api-1"
+    assert cache.get("update") == "update-2"
+    assert fetch.calls == ["api", "update"]
+
+
+def test_expires_at_and_seconds_until_refresh():
+    clock = Clock()
+    cache = TokenCache(Fetcher(), lifetime=1800, safety_margin=120, clock=clock)
+
+    assert cache.expires_at("api") is None
+    assert cache.seconds_until_refresh("api") == 0
+    assert cache.needs_refresh("api")
+
+    cache.get("api")
+    assert cache.expires_at("api") == 1000.0 + 1800 - 120
+    assert cache.seconds_until_refresh("api", lead=60) == 1800 - 120 - 60
+    assert not cache.needs_refresh("api")
+    clock.now = cache.expires_at("api")
+    assert cache.needs_refresh("api")
+
+
+def test_concurrent_gets_fetch_once():
+    fetch = Fetcher(delay=0.05)
+    cache = TokenCache(fetch)
+    start = threading.Barrier(16)
+    tokens = []
+
+    def get():
+        start.wait()
+        tokens.append(cache.get("api"))
+
+    threads = [threading.Thread(target=get) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert fetch.calls == ["api"]
+    assert tokens == ["api-1"] * 16
+
+
+def test_failed_fetch_is_raised_to_every_waiter_and_not_cached():
+    calls = []
+
+    def fetch(scope):
+        calls.append(scope)
+        time.sleep(0.05)
+        raise ValueError("authorize failed")
+
+    cache = TokenCache(fetch)
+    errors = []
+
+    def get():
+        try:
+            cache.get("api")
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=get) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(errors) == 4
+    assert cache.peek("api") is None
+
+
+def test_invalidate_makes_the_next_get_fetch_a_new_generation():
+    cache = TokenCache(Fetcher())
+    first = cache.get_entry("api")
+
+    cache.invalidate("api")
+    assert cache.peek("api") is None
+    second = cache.get_entry("api")
+
+    assert second.token == "api-2"
+    assert second.generation > first.generation
+
+
+def test_invalidate_all_scopes():
+    cache = TokenCache(Fetcher())
+    cache.get("api")
+    cache.get("update")
+
+    cache.invalidate()
+
+    assert cache.peek("api") is None
+    assert cache.peek("update") is None
+
+
+def test_refresh_after_a_401_fetches_once_for_the_rejected_token():
+    fetch = Fetcher()
+    cache = TokenCache(fetch)
+    rejected = cache.get("api")
+
+    # the first request to see the 401 refreshes; the others find the new token already cached
+    assert cache.refresh("api", stale_token=rejected) == "api-2"
+    assert cache.refresh("api", stale_token=rejected) == "api-2"
+    assert fetch.calls == ["api", "api"]
+
+
+def test_put_and_peek():
+    clock = Clock()
+    cache = TokenCache(Fetcher(), clock=clock)
+
+    entry = cache.put("update", "given", issued_at=900.0)
+    assert cache.peek("update") is entry
+    assert (entry.token, entry.issued_at) == ("given", 900.0)
+    assert cache.get("update") == "given"
+
+    assert cache.put("update", None) is None
+    assert cache.peek("update") is None
+
+
+@pytest.mark.parametrize("scope", ["api", "update"])
+def test_generations_increase_across_scopes(scope):
+    cache = TokenCache(Fetcher())
+    other = "update" if scope == "api" else "api"
+
+    first = cache.get_entry(scope)
+    second = cache.get_entry(other)
+
+    assert second.generation > first.generation
@@ -0,0 +1,258 @@
+"""
+Benchmarks the order-entry round trip of the scraper's hot path against the local gateway
+simulator (schwab_api/simulator.py):
+
+    getBidAsk -> price computation -> trade_v2_limit_buy_order -> cancel_limit_order_v2
+
+Reports p50/p99 latency per phase, gateway requests per order and tracemalloc allocation stats
+per order, and writes them to a JSON file so runs can be compared between versions.
+
+usage: python -m tools.benchmark_order_entry [--orders N] [--latency SECONDS] [--out FILE] ...
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+from schwab_api import Schwab, urls
+from schwab_api.simulator import GatewaySimulator
+
+BENCHMARK_TICKER = "AAPL"
+BENCHMARK_ACCOUNT_ID = "12345678"
+BENCHMARK_BID = 100.00
+BENCHMARK_ASK = 100.10
+BUY_PRICE_ADJUSTMENT = 0.02 # dollars below the middle of the spread, so the buy rests
+DEFAULT_ORDERS = 200
+DEFAULT_WARMUP = 10
+DEFAULT_ALLOCATION_ORDERS = 50
+DEFAULT_OUTPUT = "benchmark_order_entry.json"
+PHASES = ("quote", "price", "order", "cancel", "tick_to_order", "round_trip")
+
+
+def runSimulator(connection, simulatorKwargs):
+    # runs in a child process, so the simulator's threads and allocations stay out of the measurements
+    simulator = GatewaySimulator(BENCHMARK_ACCOUNT_ID, **simulatorKwargs)
+    simulator.set_quote(BENCHMARK_TICKER, BENCHMARK_BID, BENCHMARK_ASK)
+    connection.send(simulator.start())
+    while True:
+        command = connection.recv()
+        if command == "counts":
+            connection.send(dict(simulator.request_counts))
+        elif command == "stop":
+            simulator.stop()
+            connection.send(None)
+            return
+
+
+class SimulatorProcess:
+    def __init__(self, **simulatorKwargs):
+        """
+            Runs a GatewaySimulator in a child process and points urls at it.
+        """
+        self.simulatorKwargs = simulatorKwargs
+        self.connection = None
+        self.process = None
+        self.url = None
+
+    def __enter__(self):
+        self.connection, childConnection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=runSimulator, args=(childConnection, self.simulatorKwargs), daemon=True)
+        self.process.start()
+        self.url = self.connection.recv()
+        urls.set_base_urls(gateway=self.url, client=self.url)
+        return self
+
+    def __exit__(self, *exc_info):
+        urls.set_base_urls()
+        self.connection.send("stop")
+        self.connection.recv()
+        self.process.join()
+
+    def requestCounts(self):
+        self.connection.send("counts")
+        return self.connection.recv()
+
+
+def computeBuyPrice(bid, ask):
+    # same computation as runSpreadScraperSubprocess
+    avgOfSpread = round((ask + bid)/2, 2)
+    return avgOfSpread - BUY_PRICE_ADJUSTMENT
+
+
+def placeAndCancel(api: Schwab, timings=None):
+    """
+        Runs one quote -> price -> buy -> cancel round trip. Appends each phase's duration (seconds)
+        to timings[phase] if timings is given. Returns True if both the buy and the cancel succeeded.
+    """
+    startTime = time.perf_counter()
+    bid, ask = api.getBidAsk(BENCHMARK_TICKER, BENCHMARK_ACCOUNT_ID)
+    quoteTime = time.perf_counter()
+    buyPrice = computeBuyPrice(bid, ask)
+    priceTime = time.perf_counter()
+    messages, success, orderId = api.trade_v2_limit_buy_order(
+        BENCHMARK_TICKER,
+        qty=1,
+        account_id=BENCHMARK_ACCOUNT_ID,
+        limit_price=buyPrice
+    )
+    orderTime = time.perf_counter()
+    if not success:
+        print("[BENCHMARK] buy failed: " + str(messages))
+        return False
+    messages, success = api.cancel_limit_order_v2(
+        BENCHMARK_ACCOUNT_ID,
+        orderId,
+        BENCHMARK_TICKER,
+        "Buy",
+        buyPrice,
+        1
+    )
+    endTime = time.perf_counter()
+    if timings != None:
+        timings["quote"].append(quoteTime - startTime)
+        timings["price"].append(priceTime - quoteTime)
+        timings["order"].append(orderTime - priceTime)
+        timings["cancel"].append(endTime - orderTime)
+        timings["tick_to_order"].append(orderTime - startTime)
+        timings["round_trip"].append(endTime - startTime)
+    if not success:
+        print("[BENCHMARK] cancel failed: " + str(messages))
+    return success
+
+
+def percentile(values, fraction):
+    # nearest-rank percentile
+    ordered = sorted(values)
+    index = max(int(round(fraction * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def summarize(values):
+    # seconds -> milliseconds
+    if not values:
+        return None
+    return {
+        "p50": percentile(values, 0.50) * 1000,
+        "p99": percentile(values, 0.99) * 1000,
+        "mean": statistics.mean(values) * 1000,
+        "min": min(values) * 1000,
+        "max": max(values) * 1000,
+    }
+
+
+def measureAllocations(api: Schwab, orders):
+    """
+        Runs orders round trips under tracemalloc. Returns the peak bytes allocated during a round
+        trip (above what was allocated before it) and the blocks/bytes still allocated afterwards,
+        both per order. Only this process is traced, so the simulator is not counted.
+    """
+    tracemalloc.start()
+    peaks = []
+    try:
+        before = tracemalloc.take_snapshot()
+        for _ in range(orders):
+            current, _peak = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            placeAndCancel(api)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    retained = after.compare_to(before, "filename")
+    return {
+        "orders": orders,
+        "peak_bytes_per_order": statistics.median(peaks),
+        "retained_blocks_per_order": sum(stat.count_diff for stat in retained) / orders,
+        "retained_bytes_per_order": sum(stat.size_diff for stat in retained) / orders,
+    }
+
+
+def runBenchmark(orders=DEFAULT_ORDERS, warmup=DEFAULT_WARMUP, allocationOrders=DEFAULT_ALLOCATION_ORDERS, placeDirectly=False, **simulatorKwargs):
+    """
+        Runs the benchmark against a simulator started with simulatorKwargs (latency, jitter,
+        route_latency, ...) and returns the results as a dict.
+    """
+    with SimulatorProcess(**simulatorKwargs) as simulator:
+        api = Schwab(launch_browser=False, place_orders_directly=placeDirectly)
+        for _ in range(warmup): # fetches tokens, the security id and the order templates
+            placeAndCancel(api)
+
+        timings = {phase: [] for phase in PHASES}
+        failures = 0
+        countsBefore = simulator.requestCounts()
+        for _ in range(orders):
+            if not placeAndCancel(api, timings):
+                failures += 1
+        countsAfter = simulator.requestCounts()
+
+        allocations = measureAllocations(api, allocationOrders) if allocationOrders > 0 else None
+
+    requestsByRoute = {
+        route: (countsAfter.get(route, 0) - countsBefore.get(route, 0)) / orders
+        for route in countsAfter
+        if countsAfter.get(route, 0) != countsBefore.get(route, 0)
+    }
+    return {
+        "benchmark": "order_entry",
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "orders": orders,
+            "warmup": warmup,
+            "place_directly": placeDirectly,
+            "simulator": simulatorKwargs,
+        },
+        "failures": failures,
+        "latency_ms": {phase: summarize(values) for phase, values in timings.items()},
+        "requests_per_order": sum(requestsByRoute.values()),
+        "requests_per_order_by_route": requestsByRoute,
+        "allocations": allocations,
+    }
+
+
+def printResults(results):
+    print("order entry benchmark (" + str(results["config"]["orders"]) + " orders, " + str(results["failures"]) + " failures)")
+    for phase, stats in results["latency_ms"].items():
+        if stats != None:
+            print("  %-14s p50 %8.3f ms   p99 %8.3f ms" % (phase, stats["p50"], stats["p99"]))
+    print("  requests/order " + str(results["requests_per_order"]) + " " + str(results["requests_per_order_by_route"]))
+    if results["allocations"] != None:
+        print("  allocations    peak %d bytes/order, retained %.1f blocks (%.0f bytes)/order" % (
+            results["allocations"]["peak_bytes_per_order"],
+            results["allocations"]["retained_blocks_per_order"],
+            results["allocations"]["retained_bytes_per_order"],
+        ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the order-entry round trip against the gateway simulator.")
+    parser.add_argument("--orders", type=int, default=DEFAULT_ORDERS, help="timed round trips")
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP, help="untimed round trips run first")
+    parser.add_argument("--allocation-orders", type=int, default=DEFAULT_ALLOCATION_ORDERS, help="round trips run under tracemalloc (0 to skip)")
+    parser.add_argument("--latency", type=float, default=0, help="seconds the simulator adds to every response")
+    parser.add_argument("--jitter", type=float, default=0, help="up to this many random extra seconds per response")
+    parser.add_argument("--place-directly", action="store_true", help="place orders with a single request once the security id is cached")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    results = runBenchmark(
+        orders=args.orders,
+        warmup=args.warmup,
+        allocationOrders=args.allocation_orders,
+        placeDirectly=args.place_directly,
+        latency=args.latency,
+        jitter=args.jitter,
+        seed=args.seed,
+    )
+    printResults(results)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=4)
+    print("results written to " + args.out)
+    sys.exit(1 if results["failures"] else 0)
@@ -1,4 +1,6 @@
 from schwab_api import Schwab
+from schwab_api.order_store import OrderStore
+import datetime
 import json
 from tools.terminal_colors import TermColor
 
@@ -13,39 +15,49 @@ def printStat(buyPrice, sellPrice, isMarket, totalProfit):
     print("%.2f" % round(totalProfit, 2), end="")
     print("    (market)" if isMarket else "")
 
-def printDayAnalysis(api: Schwab, account_id: str, stockTicker: str):
+def inFillOrder(orderItems):
+    # buys and sells are matched in the order they filled: by TimeStamp (ISO 8601), or by OrderId
+    # (assigned in the order the orders were placed) if a TimeStamp is missing or in another format
+    try:
+        return sorted(orderItems, key=lambda orderItem: (datetime.datetime.fromisoformat(orderItem.timestamp), orderItem.order_id))
+    except (TypeError, ValueError):
+        return sorted(orderItems, key=lambda orderItem: orderItem.order_id)
+
+def printDayAnalysis(api: Schwab, account_id: str, stockTicker: str, orderStore: OrderStore = None):
+    # orderStore can be kept between calls; only orders that changed since the last call are parsed again
     buysQueue = []
     extraSell = None
     totalProfit = 0.00 # TODO profit currently does not adjust for QTY > 1
+    if orderStore == None:
+        orderStore = OrderStore()
     try:
         try:
-            orders, success = api.todays_orders_v2(account_id)
+            orders, success = api.todays_orders_v2(account_id, compact=True)
+            orderStore.update(orders)
         except Exception as e:
             print("EEEEEEEEEEEE", e)
-        for order in orders:
+        for orderItem in inFillOrder(orderStore.by_symbol(stockTicker, "Filled")):
             try:
-                orderItem = order["OrderList"][0]
-                # orderId = orderItem["OrderId"]
-                if orderItem["OrderStatus"] == "Filled" and orderItem["DisplaySymbol"] == stockTicker:
+                if orderItem.leg == 0:
                     try:
-                        if orderItem["OrderAction"] == "Buy": # is a buy order
+                        if orderItem.action == "Buy": # is a buy order
                             try:
-                                fillPrice = float(orderItem["FillPrice"].replace('$',''))
+                                fillPrice = orderItem.fill_price
                                 if extraSell == None:
                                     buysQueue.append(fillPrice)
                                 else:
                                     totalProfit += extraSell - fillPrice
-                                    printStat(fillPrice, extraSell, "Limit" not in orderItem["Price"], totalProfit)
+                                    printStat(fillPrice, extraSell, orderItem.is_market, totalProfit)
                                     extraSell = None
                             except Exception as e:
                                 print("CCCCCCCCCCC", e)
-                        elif orderItem["OrderAction"] == "Sell": # is a sell order
+                        elif orderItem.action == "Sell": # is a sell order
                             try:
-                                fillPrice = float(orderItem["FillPrice"].replace('$',''))
+                                fillPrice = orderItem.fill_price
                                 if len(buysQueue) > 0:
                                     buyPrice = buysQueue.pop()
                                     totalProfit += fillPrice - buyPrice
-                                    printStat(buyPrice, fillPrice, "Limit" not in orderItem["Price"], totalProfit)
+                                    printStat(buyPrice, fillPrice, orderItem.is_market, totalProfit)
                                 else:
                                     extraSell = fillPrice
                             except Exception as e: